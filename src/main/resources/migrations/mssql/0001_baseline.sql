@@ -1,3 +1,6 @@
+-- Tables of the original create.sql; skipped where they already exist so
+-- databases created before migrations were introduced can be adopted as is.
+IF OBJECT_ID('Caregivers') IS NULL
 CREATE TABLE Caregivers (
     Username varchar(255),
     Salt BINARY(16),
@@ -5,18 +8,21 @@ CREATE TABLE Caregivers (
     PRIMARY KEY (Username)
 );
 
+IF OBJECT_ID('Availabilities') IS NULL
 CREATE TABLE Availabilities (
     Time date,
     Username varchar(255) REFERENCES Caregivers,
     PRIMARY KEY (Time, Username)
 );
 
+IF OBJECT_ID('Vaccines') IS NULL
 CREATE TABLE Vaccines (
     Name varchar(255),
     Doses int,
     PRIMARY KEY (Name)
 );
 
+IF OBJECT_ID('Patients') IS NULL
 CREATE TABLE Patients (
     Username VARCHAR(255),
     Salt BINARY(16),
@@ -24,10 +30,11 @@ CREATE TABLE Patients (
     PRIMARY KEY (Username)
 );
 
+IF OBJECT_ID('Reserve') IS NULL
 CREATE TABLE Reserve (
     appointment_id INT PRIMARY KEY IDENTITY(1,1),
     vaccine_name VARCHAR(255) REFERENCES Vaccines(Name),
     appointment_date DATE,
     patient_name VARCHAR(255) REFERENCES Patients(Username),
-    caregiver_name VARCHAR(255) REFERENCES Caregivers(Username),
-);
\ No newline at end of file
+    caregiver_name VARCHAR(255) REFERENCES Caregivers(Username)
+);
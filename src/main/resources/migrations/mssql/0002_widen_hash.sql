@@ -0,0 +1,4 @@
+-- Room for self-describing password hashes (util/PasswordHash.py).
+-- Existing 16-byte hashes are kept and keep verifying.
+ALTER TABLE Caregivers ALTER COLUMN Hash VARBINARY(255);
+ALTER TABLE Patients ALTER COLUMN Hash VARBINARY(255);
@@ -0,0 +1,19 @@
+-- show_appointments filters Reserve by patient_name or caregiver_name and
+-- orders by appointment_id; these indexes seek and cover the selected columns.
+-- cancel looks up (appointment_id, patient_name), which the clustered primary
+-- key on appointment_id already serves.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Reserve_patient_name')
+CREATE INDEX IX_Reserve_patient_name
+    ON Reserve (patient_name, appointment_id)
+    INCLUDE (vaccine_name, appointment_date, caregiver_name);
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Reserve_caregiver_name')
+CREATE INDEX IX_Reserve_caregiver_name
+    ON Reserve (caregiver_name, appointment_id)
+    INCLUDE (vaccine_name, appointment_date, patient_name);
+
+-- The caregiver search seeks Availabilities by Time through its primary key;
+-- lookups by caregiver (and the foreign key to Caregivers) use this one.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Availabilities_Username')
+CREATE INDEX IX_Availabilities_Username
+    ON Availabilities (Username, Time);
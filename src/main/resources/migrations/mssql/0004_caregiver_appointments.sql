@@ -0,0 +1,10 @@
+-- Number of appointments booked with each caregiver, kept up to date by
+-- reserve and cancel, for the least_loaded assignment policy.
+IF COL_LENGTH('Caregivers', 'Appointments') IS NULL
+ALTER TABLE Caregivers ADD Appointments INT NOT NULL
+    CONSTRAINT DF_Caregivers_Appointments DEFAULT 0;
+GO
+
+UPDATE c
+SET Appointments = (SELECT COUNT(*) FROM Reserve r WHERE r.caregiver_name = c.Username)
+FROM Caregivers c;
@@ -0,0 +1,32 @@
+-- Dose-allocation leases (service/DoseAllocator.py). An instance moves a block
+-- of doses from Vaccines.Doses into a DoseLeases row and books against it;
+-- Reserve.lease_id records which lease a booking used. TotalAdded is the
+-- number of doses ever added, so for every vaccine
+--     Doses + (Granted of its leases - bookings against them) + bookings = TotalAdded.
+IF COL_LENGTH('Vaccines', 'TotalAdded') IS NULL
+ALTER TABLE Vaccines ADD TotalAdded INT NOT NULL
+    CONSTRAINT DF_Vaccines_TotalAdded DEFAULT 0;
+
+IF COL_LENGTH('Reserve', 'lease_id') IS NULL
+ALTER TABLE Reserve ADD lease_id VARCHAR(32) NULL;
+GO
+
+UPDATE v
+SET TotalAdded = Doses + (SELECT COUNT(*) FROM Reserve r WHERE r.vaccine_name = v.Name)
+FROM Vaccines v;
+
+IF OBJECT_ID('DoseLeases') IS NULL
+CREATE TABLE DoseLeases (
+    LeaseId VARCHAR(32) PRIMARY KEY,
+    Instance VARCHAR(255) NOT NULL,
+    Vaccine VARCHAR(255) NOT NULL REFERENCES Vaccines(Name),
+    Granted INT NOT NULL,
+    ExpiresAt DATETIME2 NOT NULL
+);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DoseLeases_Vaccine')
+CREATE INDEX IX_DoseLeases_Vaccine ON DoseLeases (Vaccine, ExpiresAt);
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Reserve_lease_id')
+CREATE INDEX IX_Reserve_lease_id ON Reserve (lease_id) WHERE lease_id IS NOT NULL;
@@ -0,0 +1,16 @@
+-- Requests reserve could not book (service/WaitlistMatcher.py). A patient waits
+-- at most once per vaccine and date; requests are matched to freed slots in
+-- WaitlistId order. RequestedAt is UTC.
+IF OBJECT_ID('Waitlist') IS NULL
+CREATE TABLE Waitlist (
+    WaitlistId INT PRIMARY KEY IDENTITY(1,1),
+    patient_name VARCHAR(255) NOT NULL REFERENCES Patients(Username),
+    vaccine_name VARCHAR(255) NOT NULL REFERENCES Vaccines(Name),
+    Time DATE NOT NULL,
+    RequestedAt DATETIME2 NOT NULL,
+    CONSTRAINT UQ_Waitlist_Request UNIQUE (patient_name, vaccine_name, Time)
+);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Waitlist_Time')
+CREATE INDEX IX_Waitlist_Time ON Waitlist (Time, WaitlistId) INCLUDE (patient_name, vaccine_name);
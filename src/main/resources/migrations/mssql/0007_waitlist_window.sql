@@ -0,0 +1,4 @@
+-- A waitlisted patient can accept any day from Time to LatestTime (NULL: only
+-- Time). The offline planner (service/SlotPlanner.py) uses the whole window.
+IF COL_LENGTH('Waitlist', 'LatestTime') IS NULL
+ALTER TABLE Waitlist ADD LatestTime DATE NULL;
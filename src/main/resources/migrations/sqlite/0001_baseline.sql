@@ -0,0 +1,34 @@
+-- Tables of the original create.sql in SQLite syntax.
+CREATE TABLE IF NOT EXISTS Caregivers (
+    Username varchar(255),
+    Salt BINARY(16),
+    Hash BINARY(16),
+    PRIMARY KEY (Username)
+);
+
+CREATE TABLE IF NOT EXISTS Availabilities (
+    Time date,
+    Username varchar(255) REFERENCES Caregivers,
+    PRIMARY KEY (Time, Username)
+);
+
+CREATE TABLE IF NOT EXISTS Vaccines (
+    Name varchar(255),
+    Doses int,
+    PRIMARY KEY (Name)
+);
+
+CREATE TABLE IF NOT EXISTS Patients (
+    Username VARCHAR(255),
+    Salt BINARY(16),
+    Hash BINARY(16),
+    PRIMARY KEY (Username)
+);
+
+CREATE TABLE IF NOT EXISTS Reserve (
+    appointment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    vaccine_name VARCHAR(255) REFERENCES Vaccines(Name),
+    appointment_date DATE,
+    patient_name VARCHAR(255) REFERENCES Patients(Username),
+    caregiver_name VARCHAR(255) REFERENCES Caregivers(Username)
+);
@@ -0,0 +1,2 @@
+-- SQLite does not enforce column lengths, so the wider password hashes of
+-- util/PasswordHash.py need no change here. Kept so versions match mssql.
@@ -0,0 +1,11 @@
+-- Covering indexes for show_appointments by patient and by caregiver, ordered
+-- by appointment_id. cancel is served by the appointment_id primary key.
+CREATE INDEX IF NOT EXISTS IX_Reserve_patient_name
+    ON Reserve (patient_name, appointment_id, vaccine_name, appointment_date, caregiver_name);
+
+CREATE INDEX IF NOT EXISTS IX_Reserve_caregiver_name
+    ON Reserve (caregiver_name, appointment_id, vaccine_name, appointment_date, patient_name);
+
+-- Lookups of availability by caregiver.
+CREATE INDEX IF NOT EXISTS IX_Availabilities_Username
+    ON Availabilities (Username, Time);
@@ -0,0 +1,6 @@
+-- Number of appointments booked with each caregiver, kept up to date by
+-- reserve and cancel, for the least_loaded assignment policy.
+ALTER TABLE Caregivers ADD COLUMN Appointments INTEGER NOT NULL DEFAULT 0;
+
+UPDATE Caregivers
+SET Appointments = (SELECT COUNT(*) FROM Reserve r WHERE r.caregiver_name = Caregivers.Username);
@@ -0,0 +1,23 @@
+-- Dose-allocation leases (service/DoseAllocator.py). An instance moves a block
+-- of doses from Vaccines.Doses into a DoseLeases row and books against it;
+-- Reserve.lease_id records which lease a booking used. TotalAdded is the
+-- number of doses ever added, so for every vaccine
+--     Doses + (Granted of its leases - bookings against them) + bookings = TotalAdded.
+ALTER TABLE Vaccines ADD COLUMN TotalAdded INTEGER NOT NULL DEFAULT 0;
+
+UPDATE Vaccines
+SET TotalAdded = Doses + (SELECT COUNT(*) FROM Reserve r WHERE r.vaccine_name = Vaccines.Name);
+
+ALTER TABLE Reserve ADD COLUMN lease_id VARCHAR(32);
+
+CREATE TABLE IF NOT EXISTS DoseLeases (
+    LeaseId VARCHAR(32) PRIMARY KEY,
+    Instance VARCHAR(255) NOT NULL,
+    Vaccine VARCHAR(255) NOT NULL REFERENCES Vaccines(Name),
+    Granted INT NOT NULL,
+    ExpiresAt TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS IX_DoseLeases_Vaccine ON DoseLeases (Vaccine, ExpiresAt);
+
+CREATE INDEX IF NOT EXISTS IX_Reserve_lease_id ON Reserve (lease_id);
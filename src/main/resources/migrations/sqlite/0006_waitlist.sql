@@ -0,0 +1,13 @@
+-- Requests reserve could not book (service/WaitlistMatcher.py). A patient waits
+-- at most once per vaccine and date; requests are matched to freed slots in
+-- WaitlistId order. RequestedAt is UTC.
+CREATE TABLE IF NOT EXISTS Waitlist (
+    WaitlistId INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_name VARCHAR(255) NOT NULL REFERENCES Patients(Username),
+    vaccine_name VARCHAR(255) NOT NULL REFERENCES Vaccines(Name),
+    Time DATE NOT NULL,
+    RequestedAt TIMESTAMP NOT NULL,
+    UNIQUE (patient_name, vaccine_name, Time)
+);
+
+CREATE INDEX IF NOT EXISTS IX_Waitlist_Time ON Waitlist (Time, WaitlistId);
@@ -0,0 +1,3 @@
+-- A waitlisted patient can accept any day from Time to LatestTime (NULL: only
+-- Time). The offline planner (service/SlotPlanner.py) uses the whole window.
+ALTER TABLE Waitlist ADD COLUMN LatestTime DATE;
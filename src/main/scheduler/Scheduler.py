@@ -1,54 +1,49 @@
-from model.Vaccine import Vaccine
-from model.Caregiver import Caregiver
-from model.Patient import Patient
-from util.Util import Util
-from db.ConnectionManager import ConnectionManager
-import pymssql
 import datetime
+import json
 import re
-
-
-'''
-objects to keep track of the currently logged-in user
-Note: it is always true that at most one of currentCaregiver and currentPatient is not null
-        since only one user can be logged-in at a time
-'''
-current_patient = None
-
-current_caregiver = None
+import sys
+import time
+from model.Session import Session
+from util.LazyImport import LazyImport
+from util.OutputCapture import capture_output
+from util.Metrics import get_metrics
+from db.Backend import DBError
+from db.Queries import Queries
+
+# imported on first use, so that starting up for a single command stays cheap
+Caregiver = LazyImport("model.Caregiver", "Caregiver")
+Patient = LazyImport("model.Patient", "Patient")
+Util = LazyImport("util.Util", "Util")
+Recurrence = LazyImport("util.Recurrence", "Recurrence")
+UserImporter = LazyImport("service.UserImporter", "UserImporter")
+get_verifier = LazyImport("service.CredentialVerifier", "get_verifier")
+get_inventory_cache = LazyImport("service.InventoryCache", "get_inventory_cache")
+get_dose_allocator = LazyImport("service.DoseAllocator", "get_dose_allocator")
+get_availability_index = LazyImport("service.AvailabilityIndex", "get_availability_index")
+ConnectionManager = LazyImport("db.ConnectionManager", "ConnectionManager")
+ReservationEngine = LazyImport("db.ReservationEngine", "ReservationEngine")
+ShipmentImporter = LazyImport("service.ShipmentImporter", "ShipmentImporter")
+DayCancellation = LazyImport("service.DayCancellation", "DayCancellation")
+get_waitlist_matcher = LazyImport("service.WaitlistMatcher", "get_waitlist_matcher")
+get_tracer = LazyImport("db.QueryTracer", "get_tracer")
 
 
 def is_strong_password(password):
     """
     Check if a password is strong
     """
-    # At least 8 characters
-    if len(password) < 8:
-        print("Your password should include at least 8 characters!")
-        return False
-    
-    # Check for at least one uppercase and one lowercase letter
-    if not any(c.isupper() for c in password) or not any(c.islower() for c in password):
-        print("Your password should include a mixture of both uppercase and lowercase letters!")
+    problem = Util.password_problem(password)
+    if problem is not None:
+        print(problem)
         return False
 
-    # A mixture of letters and numbers
-    if not any(c.isalnum() for c in password):
-        print("Your password should include a mixture of letters and numbers!")
-        return False
-    
-    # Inclusion of at least one special character from "!", "@", "#", "?"
-    if not any(c in "!@#?" for c in password):
-        print("Your password should include at least one special character from '!','@','#', '?'")
-        return False
-    
     # Password meets all criteria
     return True
 
 
 
 
-def create_patient(tokens):
+def create_patient(tokens, session):
     """
     TODO: Part 1
     """
@@ -61,7 +56,7 @@ def create_patient(tokens):
     username = tokens[1]
     password = tokens[2]
     # check 2: check if the username has been taken already
-    if username_exists_patient(username):
+    if username_exists(Queries.patient_exists, username):
         print("Username taken, try again!")
         return
     
@@ -70,16 +65,15 @@ def create_patient(tokens):
         print("Password is not strong enough. Please follow the password guidelines.")
         return
     
-    salt = Util.generate_salt()
-    hash = Util.generate_hash(password, salt)
+    password_hash = get_verifier().hash_password(password)
 
     # create the patient
-    patient = Patient(username, salt=salt, hash=hash)
+    patient = Patient(username, salt=password_hash.salt, hash=password_hash.encode())
 
     # save to patient information to our database
     try:
         patient.save_to_db()
-    except pymssql.Error as e:
+    except DBError as e:
         print("Failed to create user.")
         print("Db-Error:", e)
         quit()
@@ -88,20 +82,19 @@ def create_patient(tokens):
         print(e)
         return
     print(f"Create user {username}")
+    return True
 
 
-def username_exists_patient(username):
+# Whether exists_query (Queries.patient_exists or Queries.caregiver_exists) finds username
+def username_exists(exists_query, username):
     cm = ConnectionManager()
     conn = cm.create_connection()
 
-    select_username = "SELECT * FROM Patients WHERE Username = %s"
     try:
-        cursor = conn.cursor(as_dict=True)
-        cursor.execute(select_username, username)
-        # return false if the cursor is not before the first record or if there are no rows in the ResultSet.
-        for row in cursor:
-            return row['Username'] is not None
-    except pymssql.Error as e:
+        cursor = conn.cursor()
+        cursor.execute(exists_query, username)
+        return cursor.fetchone() is not None
+    except DBError as e:
         print("Error occurred when checking username")
         print("Db-Error:", e)
         quit()
@@ -114,7 +107,7 @@ def username_exists_patient(username):
         
 
 
-def create_caregiver(tokens):
+def create_caregiver(tokens, session):
     # create_caregiver <username> <password>
     # check 1: the length for tokens need to be exactly 3 to include all information (with the operation name)
     if len(tokens) != 3:
@@ -124,7 +117,7 @@ def create_caregiver(tokens):
     username = tokens[1]
     password = tokens[2]
     # check 2: check if the username has been taken already
-    if username_exists_caregiver(username):
+    if username_exists(Queries.caregiver_exists, username):
         print("Username taken, try again!")
         return
 
@@ -134,16 +127,15 @@ def create_caregiver(tokens):
         return
 
 
-    salt = Util.generate_salt()
-    hash = Util.generate_hash(password, salt)
+    password_hash = get_verifier().hash_password(password)
 
     # create the caregiver
-    caregiver = Caregiver(username, salt=salt, hash=hash)
+    caregiver = Caregiver(username, salt=password_hash.salt, hash=password_hash.encode())
 
     # save to caregiver information to our database
     try:
         caregiver.save_to_db()
-    except pymssql.Error as e:
+    except DBError as e:
         print("Failed to create user.")
         print("Db-Error:", e)
         quit()
@@ -152,39 +144,40 @@ def create_caregiver(tokens):
         print(e)
         return
     print("Created user ", username)
+    return True
 
 
-def username_exists_caregiver(username):
-    cm = ConnectionManager()
-    conn = cm.create_connection()
+def import_users(tokens, session):
+    # import_users <csv>
+    # each line of the file is: patient|caregiver,<username>,<password>
+    if len(tokens) != 2:
+        print("Please try again!")
+        return
+
+    def progress(report):
+        print(f"... {report.rows} rows, {report.created} created ({report.throughput():.1f} users/s)")
 
-    select_username = "SELECT * FROM Caregivers WHERE Username = %s"
     try:
-        cursor = conn.cursor(as_dict=True)
-        cursor.execute(select_username, username)
-        #  returns false if the cursor is not before the first record or if there are no rows in the ResultSet.
-        for row in cursor:
-            return row['Username'] is not None
-    except pymssql.Error as e:
-        print("Error occurred when checking username")
+        report = UserImporter(progress=progress).import_file(tokens[1])
+    except DBError as e:
+        print("Failed to import users.")
         print("Db-Error:", e)
         quit()
     except Exception as e:
-        print("Error occurred when checking username")
+        print("Failed to import users.")
         print("Error:", e)
-    finally:
-        cm.close_connection()
-    return False
+        return
+    print(f"Imported users: {report}")
+    return True
 
 
-def login_patient(tokens):
+def login_patient(tokens, session):
     """
     TODO: Part 1
     """
     # login_patient <username> <password>
     # check 1: if someone's already logged-in, they need to log out first
-    global current_patient, current_caregiver
-    if current_patient is not None or current_caregiver is not None:
+    if session.patient is not None or session.caregiver is not None:
         print("User already logged in.")
         return
     
@@ -199,7 +192,7 @@ def login_patient(tokens):
     patient = None
     try:
         patient = Patient(username, password=password).get()
-    except pymssql.Error as e:
+    except DBError as e:
         print("Login failed.")
         print("Db-Error:", e)
         quit()
@@ -213,14 +206,14 @@ def login_patient(tokens):
         print("Login failed.")
     else:
         print(f"Logged in as {username}")
-        current_patient = patient
+        session.patient = patient
+        return True
 
 
-def login_caregiver(tokens):
+def login_caregiver(tokens, session):
     # login_caregiver <username> <password>
     # check 1: if someone's already logged-in, they need to log out first
-    global current_caregiver, current_patient
-    if current_caregiver is not None or current_patient is not None:
+    if session.caregiver is not None or session.patient is not None:
         print("User already logged in.")
         return
 
@@ -235,7 +228,7 @@ def login_caregiver(tokens):
     caregiver = None
     try:
         caregiver = Caregiver(username, password=password).get()
-    except pymssql.Error as e:
+    except DBError as e:
         print("Login failed.")
         print("Db-Error:", e)
         quit()
@@ -249,27 +242,31 @@ def login_caregiver(tokens):
         print("Login failed.")
     else:
         print("Logged in as: " + username)
-        current_caregiver = caregiver
+        session.caregiver = caregiver
+        return True
 
 
 
 def is_valid_date_format(date_str):
-    # Use regular expression to validate the date format
-    return re.match(r"\d{2}-\d{2}-\d{4}", date_str) is not None
+    # Use regular expression to validate the date format; strptime accepts single-digit months and days
+    return re.fullmatch(r"\d{1,2}-\d{1,2}-\d{4}", date_str) is not None
 
 
 
 
-def search_caregiver_schedule(tokens):
+def search_caregiver_schedule(tokens, session):
     """
     TODO: Part 2
     """
     # check 1: if no user is logged-in, they need to login first
-    global current_patient, current_caregiver
-    if current_patient is None and current_caregiver is None:
+    if session.patient is None and session.caregiver is None:
         print("Please login first!")
         return
     
+    # search_caregiver_schedule <from> <to> [--caregivers] gives per-day counts over a range
+    if len(tokens) in (3, 4):
+        return search_caregiver_range(tokens)
+
     # check 2: the length for tokens need to be exactly 2 to include all information (with the operation name)
     if len(tokens) != 2:
         print("Please try again!")
@@ -289,70 +286,165 @@ def search_caregiver_schedule(tokens):
         print("Invalid date. Please enter the valid date format mm-dd-yyyy.")
         return
     
+    index = get_availability_index()
+    if index is not None:
+        try:
+            caregivers = index.caregivers(appointment_date)
+        except DBError as e:
+            print("Please try again!")
+            print("Db-Error:", e)
+            return
+        print("Caregiver Username:")
+        for caregiver_username in caregivers:
+            print(caregiver_username)
+        return print_vaccines()
+
     cm = ConnectionManager()
     conn = cm.create_connection()
-    cursor = conn.cursor(as_dict=True)
+    cursor = conn.cursor()
 
     try:
         # Query caregivers available for the specified date
-        caregiver_query = """
-            SELECT c.Username AS Caregiver_Username
-            FROM Caregivers c
-            LEFT JOIN Availabilities a ON c.Username = a.Username AND a.Time = %s
-            WHERE a.Time IS NOT NULL
-            ORDER BY c.Username
-        """
-        cursor.execute(caregiver_query, appointment_date)
+        cursor.execute(Queries.caregivers_available_on, appointment_date)
 
         # Print the caregiver usernames
         print("Caregiver Username:")
         for row in cursor:
-            caregiver_username = row['Caregiver_Username']
+            caregiver_username = row[0]
             print(caregiver_username)
 
-        # Query vaccines and available doses for the specified date
-        vaccine_query = """
-            SELECT Name, Doses
-            FROM Vaccines
-            ORDER BY Name
-        """
-        cursor.execute(vaccine_query)
+    except DBError as e:
+        print("Please try again!")
+        print("Db-Error:", e)
+        return
+    finally:
+        cm.close_connection()
 
-        # Print the vaccines and available doses
-        print("\nVaccine Names and Available Doses:")
-        for row in cursor:
-            vaccine_name = row['Name']
-            available_doses = row['Doses']
-            print(f"{vaccine_name} {available_doses}")
+    return print_vaccines()
 
-    except pymssql.Error as e:
+
+def print_vaccines():
+    try:
+        # Vaccines and available doses, served from the inventory cache
+        vaccines = get_inventory_cache().vaccines()
+    except DBError as e:
         print("Please try again!")
         print("Db-Error:", e)
+        return
+
+    # Print the vaccines and available doses
+    print("\nVaccine Names and Available Doses:")
+    for vaccine_name, available_doses in vaccines:
+        print(f"{vaccine_name} {available_doses}")
+    return True
+
+
+def search_caregiver_range(tokens):
+    #  search_caregiver_schedule <from> <to> [--caregivers]
+    with_caregivers = len(tokens) == 4
+    if with_caregivers and tokens[3] != "--caregivers":
+        print("Please try again!")
+        return
+
+    try:
+        date_from = datetime.datetime.strptime(tokens[1], "%m-%d-%Y").date()
+        date_to = datetime.datetime.strptime(tokens[2], "%m-%d-%Y").date()
+    except ValueError:
+        print("Invalid date. Please enter the valid date format mm-dd-yyyy.")
+        return
+    if date_to < date_from:
+        print("The end date must not be before the start date!")
+        return
+
+    index = get_availability_index()
+    if index is not None:
+        try:
+            days = index.schedule(date_from, date_to) if with_caregivers else index.counts(date_from, date_to)
+        except DBError as e:
+            print("Please try again!")
+            print("Db-Error:", e)
+            return
+        print("Date Available_Caregivers" + (" Caregiver_Usernames" if with_caregivers else ""))
+        for day, caregivers in days:
+            if with_caregivers:
+                print(f"{day.strftime('%m-%d-%Y')} {len(caregivers)} {' '.join(caregivers)}")
+            else:
+                print(f"{day.strftime('%m-%d-%Y')} {caregivers}")
+        if not days:
+            print("No caregiver is available in this range!")
+        return print_vaccines()
+
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    cursor = conn.cursor()
+
+    try:
+        if with_caregivers:
+            # one ordered scan of the primary key, counted per day while streaming
+            cursor.execute(Queries.available_in_range, (date_from, date_to))
+        else:
+            cursor.execute(Queries.available_per_day, (date_from, date_to))
+
+        print("Date Available_Caregivers" + (" Caregiver_Usernames" if with_caregivers else ""))
+        days = 0
+        if with_caregivers:
+            day, names = None, []
+            for time, username in cursor:
+                if time != day and names:
+                    print(f"{day.strftime('%m-%d-%Y')} {len(names)} {' '.join(names)}")
+                    days += 1
+                    names = []
+                day = time
+                names.append(username)
+            if names:
+                print(f"{day.strftime('%m-%d-%Y')} {len(names)} {' '.join(names)}")
+                days += 1
+        else:
+            for time, count in cursor:
+                print(f"{time.strftime('%m-%d-%Y')} {count}")
+                days += 1
+        if days == 0:
+            print("No caregiver is available in this range!")
+
+    except DBError as e:
+        print("Please try again!")
+        print("Db-Error:", e)
+        return
     finally:
         cm.close_connection()
 
-    
+    return print_vaccines()
 
 
 
 
-def reserve(tokens):
+
+
+def reserve(tokens, session):
     """
     TODO: Part 2
     """
-    global current_patient, current_caregiver
 
     # Check if a user is logged in
-    if current_patient is None:
+    if session.patient is None:
         print("Please login first!")
         return
     
     # Check if the logged-in user is a patient
-    if current_caregiver is not None:
+    if session.caregiver is not None:
         print("Please login as a patient!")
         return
     
-    # Check if the length of tokens is correct
+    # Check if the length of tokens is correct; --waitlist queues the request if it cannot be booked
+    # now, --waitlist <to_date> accepts any day up to to_date
+    waitlist, latest_str = "--waitlist" in tokens, None
+    if waitlist:
+        options = tokens[tokens.index("--waitlist"):]
+        tokens = tokens[:tokens.index("--waitlist")]
+        if len(options) > 2 or (len(options) == 2 and not is_valid_date_format(options[1])):
+            print("Please try again!")
+            return
+        latest_str = options[1] if len(options) == 2 else None
     if len(tokens) != 3:
         print("Please try again!")
         return
@@ -368,167 +460,140 @@ def reserve(tokens):
     # Convert date to datetime object
     try:
         appointment_date = datetime.datetime.strptime(date_str, "%m-%d-%Y").date()
+        latest_date = datetime.datetime.strptime(latest_str, "%m-%d-%Y").date() if latest_str else None
     except ValueError:
         print("Invalid date. Please enter the valid date format mm-dd-yyyy.")
         return
+    if latest_date is not None and latest_date < appointment_date:
+        print("Please enter a valid date range!")
+        return
 
-    # Check caregiver availability
-    caregiver_username = get_available_caregiver(appointment_date)
+    # Claim a caregiver, take a dose and book the appointment in one transaction
+    status, appointment_id, caregiver_username = reserve_appointment(session.patient.get_username(), vaccine_name, appointment_date)
 
-    if caregiver_username:
-        # Check vaccine availability
-        if check_vaccine_availability(vaccine_name):
-            # Reserve the appointment
-            appointment_id = reserve_appointment(vaccine_name, appointment_date, caregiver_username)
-            print(f"Appointment ID: {appointment_id}, Caregiver username: {caregiver_username}")
-        else:
-            print("Not enough available doses!")
-    else:
+    if status == ReservationEngine.OK:
+        print(f"Appointment ID: {appointment_id}, Caregiver username: {caregiver_username}")
+        return True
+    elif status == ReservationEngine.NO_DOSES:
+        print("Not enough available doses!")
+    elif status == ReservationEngine.NO_CAREGIVER:
         print("No Caregiver is available!")
+    else:
+        # the booking failed for another reason (see reserve_appointment), there is nothing to wait for
+        return
+    if waitlist and (latest_date or appointment_date) >= datetime.date.today():
+        return join_waitlist(session.patient.get_username(), vaccine_name, appointment_date, latest_date)
 
 
-
-
-# Define a function to get available caregiver in selected date
-def get_available_caregiver(appointment_date):
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor(as_dict=True)
-
+def join_waitlist(patient_name, vaccine_name, appointment_date, latest_date=None):
     try:
-        # Query caregivers available for the specified date
-        caregiver_query = """
-            SELECT c.Username AS Caregiver_Username
-            FROM Caregivers c
-            LEFT JOIN Availabilities a ON c.Username = a.Username AND a.Time = %s
-            WHERE a.Time IS NOT NULL
-            ORDER BY c.Username
-        """
-        cursor.execute(caregiver_query, appointment_date)
-
-        for row in cursor:
-            return row['Caregiver_Username']
-        
-    except pymssql.Error as e:
-        print("Please try again!")
+        position = get_waitlist_matcher().enqueue(patient_name, vaccine_name, appointment_date, latest_date)
+    except DBError as e:
+        print("Error occurred when joining the waitlist")
         print("Db-Error:", e)
-    finally:
-        cm.close_connection()
-    return None
+        quit()
+    if position is None:
+        print("Please try again! Enter a valid vaccine!")
+        return
+    days = f"{appointment_date:%m-%d-%Y}" + (f" to {latest_date:%m-%d-%Y}" if latest_date else "")
+    print(f"On the waitlist as number {position} for {days}. "
+          f"show_appointments lists the appointment once it is booked.")
+    return True
 
-# Define a function to check the availability of the selected vaccine
-def check_vaccine_availability(vaccine_name):
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor()
 
+# Book waitlisted requests after slots or doses were freed and say how many were booked
+def match_waitlist():
     try:
-        vaccine_query = "SELECT Doses FROM Vaccines WHERE Name = %s"
-        cursor.execute(vaccine_query, vaccine_name)
-
-        for row in cursor:
-            available_doses = row[0]
-            return available_doses > 0
-    
-    except pymssql.Error as e:
-        print("Please try again!")
+        booked = get_waitlist_matcher().match()
+    except DBError as e:
+        print("Error occurred when booking the waitlist")
         print("Db-Error:", e)
-    finally:
-        cm.close_connection()
-    return False
-
-
-# Update the table Reserve, Vaccines, Availabilities and return appointment_id from table Reserve
-def reserve_appointment(vaccine_name, appointment_date, caregiver_name):
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor()
-
-    try:
-        # Insert reservation into the Reserve table
-        insert_reserve_query = """
-            INSERT INTO Reserve (vaccine_name, appointment_date, patient_name, caregiver_name)
-            VALUES (%s, %s, %s, %s)
-        """
-        cursor.execute(insert_reserve_query, (vaccine_name, appointment_date, current_patient.get_username(), caregiver_name))
-        conn.commit()
+        quit()
+    if booked:
+        print(f"{len(booked)} waitlisted request(s) booked")
 
-        # Get the appointment_id of the reservation from Reserve table
-        select_appointment_id_query = "SELECT SCOPE_IDENTITY()"
-        cursor.execute(select_appointment_id_query)
-        appointment_id = cursor.fetchone()[0]
 
-        # Remove caregiver availability for the specified date from Availabilities
-        delete_availability_query = "DELETE FROM Availabilities WHERE Time = %s AND Username = %s"
-        cursor.execute(delete_availability_query, (appointment_date, caregiver_name))
-        conn.commit()
 
-        # Decrement available doses for the specified vaccine in Vaccines table
-        update_vaccine_query = "UPDATE Vaccines SET Doses = Doses - 1 WHERE Name = %s"
-        cursor.execute(update_vaccine_query, vaccine_name)
-        conn.commit()
 
-        return appointment_id
-    
-    except pymssql.Error as e:
+# Insert into Reserve, take the caregiver slot and the dose atomically, and return
+# (status, appointment_id, caregiver_name)
+def reserve_appointment(patient_name, vaccine_name, appointment_date):
+    try:
+        return ReservationEngine().reserve(patient_name, vaccine_name, appointment_date)
+    except DBError as e:
         print("Please try again!")
         print("Db-Error:", e)
-    finally:
-        cm.close_connection()
-
-    return None
+    return None, None, None
 
 
 
-def upload_availability(tokens):
+def upload_availability(tokens, session):
     #  upload_availability <date>
+    #  upload_availability [<rule>] [from] <date> [to] <date> [<rule>]
+    #  e.g. upload_availability weekdays from 01-01-2027 to 03-31-2027
+    #  <rule> is daily (default), weekdays, weekends or a day list such as mon,wed,fri
     #  check 1: check if the current logged-in user is a caregiver
-    global current_caregiver
-    if current_caregiver is None:
+    if session.caregiver is None:
         print("Please login as a caregiver first!")
         return
 
-    # check 2: the length for tokens need to be exactly 2 to include all information (with the operation name)
-    if len(tokens) != 2:
+    # check 2: one or two dates and at most one recurrence rule
+    date_tokens = [t for t in tokens[1:] if is_valid_date_format(t)]
+    rule_tokens = [t for t in tokens[1:] if t not in date_tokens and t.lower() not in ("from", "to")]
+    if len(date_tokens) not in (1, 2) or len(rule_tokens) > 1:
         print("Please try again!")
         return
 
-    date = tokens[1]
-    # assume input is hyphenated in the format mm-dd-yyyy
-    date_tokens = date.split("-")
-    month = int(date_tokens[0])
-    day = int(date_tokens[1])
-    year = int(date_tokens[2])
     try:
-        d = datetime.datetime(year, month, day)
-        current_caregiver.upload_availability(d)
-    except pymssql.Error as e:
-        print("Upload Availability Failed")
-        print("Db-Error:", e)
-        quit()
+        # assume input is hyphenated in the format mm-dd-yyyy
+        start = datetime.datetime.strptime(date_tokens[0], "%m-%d-%Y").date()
+        end = datetime.datetime.strptime(date_tokens[-1], "%m-%d-%Y").date()
     except ValueError:
         print("Please enter a valid date!")
         return
+    if end < start:
+        print("Please enter a valid date range: the from date is after the to date!")
+        return
+    try:
+        recurrence = Recurrence(*rule_tokens)
+    except ValueError:
+        print("Please enter a valid rule: daily, weekdays, weekends or days such as mon,wed,fri")
+        return
+    dates = list(recurrence.dates(start, end))
+    if not dates:
+        print("No dates in the range match the rule, nothing uploaded!")
+        return
+
+    try:
+        added = session.caregiver.upload_availabilities(dates)
+    except DBError as e:
+        print("Upload Availability Failed")
+        print("Db-Error:", e)
+        quit()
     except Exception as e:
         print("Error occurred when uploading availability")
         print("Error:", e)
         return
     print("Availability uploaded!")
+    if len(dates) > 1 or added < len(dates):
+        print(f"{added} date(s) added, {len(dates) - added} already uploaded")
+    if added:
+        match_waitlist()
+    return True
 
 
-def cancel(tokens):
+def cancel(tokens, session):
     """
     TODO: Extra Credit
     """
-    global current_patient, current_caregiver
 
     # Check if a user is logged in
-    if current_patient is None:
+    if session.patient is None:
         print("Please login first!")
         return
     
     # Check if the logged-in user is a patient
-    if current_caregiver is not None:
+    if session.caregiver is not None:
         print("Please login as a patient!")
         return
     
@@ -545,43 +610,46 @@ def cancel(tokens):
 
     try:
         # Query to check if the appointment_id exists
-        check_appointment_query = """
-            SELECT *
-            FROM Reserve
-            WHERE appointment_id = %s AND patient_name = %s
-        """
-        cursor.execute(check_appointment_query, (appointment_id, current_patient.get_username()))
+        cursor.execute(Queries.appointment_of_patient, (appointment_id, session.patient.get_username()))
         appointment_data = cursor.fetchone()
 
         if not appointment_data:
             print("Please try again! Enter a valid appointment_id!")
             return
 
-        # Update Vaccines table by increasing available doses
-        update_vaccine_query = """
-            UPDATE Vaccines
-            SET Doses = Doses + 1
-            WHERE Name = %s
-        """
-        cursor.execute(update_vaccine_query, appointment_data['vaccine_name'])
+        # A booking against a dose lease that is still open gives the dose back to the lease:
+        # the lease's unused doses are counted from Reserve. Updating the row locks it against closing.
+        lease_id = appointment_data['lease_id']
+        returned_to_lease = False
+        if lease_id is not None:
+            cursor.execute(Queries.dose_lease_touch, lease_id)
+            returned_to_lease = cursor.rowcount == 1
+
+        # Otherwise update Vaccines table by increasing available doses
+        if not returned_to_lease:
+            cursor.execute(Queries.vaccine_return_dose, appointment_data['vaccine_name'])
 
         # Update Availabilities table by adding the appointment_date and caregiver_name
-        update_availabilities_query = """
-            INSERT INTO Availabilities (Time, Username)
-            VALUES (%s, %s)
-        """
-        cursor.execute(update_availabilities_query, (appointment_data['appointment_date'], appointment_data['caregiver_name']))
+        cursor.execute(Queries.availability_restore,
+                       (appointment_data['appointment_date'], appointment_data['caregiver_name']))
+
+        # The caregiver has one appointment less
+        cursor.execute(Queries.caregiver_appointment_removed, appointment_data['caregiver_name'])
 
         # Delete the appointment from the Reserve table
-        delete_appointment_query = """
-            DELETE FROM Reserve
-            WHERE appointment_id = %s
-        """
-        cursor.execute(delete_appointment_query, appointment_id)
+        cursor.execute(Queries.appointment_delete, appointment_id)
 
         conn.commit()
+        get_inventory_cache().invalidate()
+        if returned_to_lease and get_dose_allocator() is not None:
+            get_dose_allocator().returned(lease_id)
+        if get_availability_index() is not None:
+            get_availability_index().add(appointment_data['caregiver_name'], [appointment_data['appointment_date']])
+            get_availability_index().appointment_added(appointment_data['caregiver_name'], -1)
 
         print("Appointment canceled successfully!")
+        match_waitlist()
+        return True
 
     except Exception as e:
         print("Please try again!")
@@ -590,14 +658,50 @@ def cancel(tokens):
         cm.close_connection()
 
 
+def cancel_days(tokens, session):
+    #  cancel_days <date> [<to_date>]
+    #  takes the logged-in caregiver off those days: their appointments go to other
+    #  caregivers free on the same day, the rest are canceled
+    if session.caregiver is None:
+        print("Please login as a caregiver first!")
+        return
 
+    if len(tokens) not in (2, 3) or not all(is_valid_date_format(t) for t in tokens[1:]):
+        print("Please try again!")
+        return
+    try:
+        date_from = datetime.datetime.strptime(tokens[1], "%m-%d-%Y").date()
+        date_to = datetime.datetime.strptime(tokens[-1], "%m-%d-%Y").date()
+    except ValueError:
+        print("Please enter a valid date!")
+        return
+    if date_to < date_from:
+        print("Please enter a valid date range!")
+        return
 
+    try:
+        report = DayCancellation().cancel(session.caregiver.get_username(), date_from, date_to)
+    except DBError as e:
+        print("Error occurred when canceling days")
+        print("Db-Error:", e)
+        quit()
 
-def add_doses(tokens):
-    #  add_doses <vaccine> <number>
+    for appointment_id, caregiver_name, date in report.moved:
+        print(f"Appointment ID: {appointment_id} on {date:%m-%d-%Y} reassigned to {caregiver_name}")
+    for appointment_id, patient_name, date, _ in report.canceled:
+        print(f"Appointment ID: {appointment_id} of {patient_name} on {date:%m-%d-%Y} canceled")
+    print(f"Days canceled! {report.availabilities_removed} availabilities removed, {len(report.moved)} "
+          f"appointments reassigned, {len(report.canceled)} canceled in {report.elapsed * 1000:.1f} ms")
+    return True
+
+
+
+
+
+def add_doses(tokens, session):
+    #  add_doses <vaccine> <number> | add_doses --file <shipment.csv>
     #  check 1: check if the current logged-in user is a caregiver
-    global current_caregiver
-    if current_caregiver is None:
+    if session.caregiver is None:
         print("Please login as a caregiver first!")
         return
 
@@ -606,136 +710,166 @@ def add_doses(tokens):
         print("Please try again!")
         return
 
+    if tokens[1] == "--file":
+        return add_doses_file(tokens[2])
+
     vaccine_name = tokens[1]
-    doses = int(tokens[2])
-    vaccine = None
     try:
-        vaccine = Vaccine(vaccine_name, doses).get()
-    except pymssql.Error as e:
+        doses = int(tokens[2])
+    except ValueError:
+        print("Please try again!")
+        return
+    if doses <= 0:
+        print("Error occurred when adding doses")
+        print("Error: Argument cannot be negative!")
+        return
+
+    # one relative insert-or-update: a new vaccine is added, an existing one incremented
+    try:
+        ShipmentImporter().apply({vaccine_name: doses})
+    except DBError as e:
         print("Error occurred when adding doses")
         print("Db-Error:", e)
         quit()
-    except Exception as e:
+    print("Doses updated!")
+    match_waitlist()
+    return True
+
+
+def add_doses_file(path):
+    # each line of the file is: <vaccine>,<doses>
+    try:
+        report = ShipmentImporter().import_file(path)
+    except DBError as e:
+        print("Error occurred when adding doses")
+        print("Db-Error:", e)
+        quit()
+    except (OSError, ValueError) as e:
         print("Error occurred when adding doses")
         print("Error:", e)
         return
 
-    # if the vaccine is not found in the database, add a new (vaccine, doses) entry.
-    # else, update the existing entry by adding the new doses
-    if vaccine is None:
-        vaccine = Vaccine(vaccine_name, doses)
-        try:
-            vaccine.save_to_db()
-        except pymssql.Error as e:
-            print("Error occurred when adding doses")
-            print("Db-Error:", e)
-            quit()
-        except Exception as e:
-            print("Error occurred when adding doses")
-            print("Error:", e)
-            return
-    else:
-        # if the vaccine is not null, meaning that the vaccine already exists in our table
-        try:
-            vaccine.increase_available_doses(doses)
-        except pymssql.Error as e:
-            print("Error occurred when adding doses")
-            print("Db-Error:", e)
-            quit()
-        except Exception as e:
-            print("Error occurred when adding doses")
-            print("Error:", e)
-            return
-    print("Doses updated!")
+    print("Vaccine Doses_Before Doses_After")
+    for vaccine_name, before, after in report.vaccines:
+        print(f"{vaccine_name} {before} {after}")
+    print(f"Doses updated! {report}")
+    match_waitlist()
+    return True
+
+
+# Parse "--name value" pairs from tokens; returns None if an unknown or incomplete option is given
+def parse_options(tokens, names):
+    options = {}
+    if len(tokens) % 2 != 0:
+        return None
+    for flag, value in zip(tokens[::2], tokens[1::2]):
+        name = flag[2:] if flag.startswith("--") else None
+        if name not in names:
+            return None
+        options[name] = value
+    return options
+
+
+# Yield the appointments of the user whose name is in column (patient_name or
+# caregiver_name) after appointment_id `after`, in appointment_id order, reading
+# chunk_size rows at a time so memory use does not grow with the result
+def iter_appointments(column, username, after=0, date_from=None, date_to=None, limit=None, chunk_size=500):
+    # one statement for every combination of options: missing bounds are the widest ones
+    appointments_query = Queries.patient_appointments if column == "patient_name" else Queries.caregiver_appointments
+    params = (username, after, date_from or datetime.date.min, date_to or datetime.date.max,
+              2 ** 31 - 1 if limit is None else limit)
+
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(appointments_query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cm.close_connection()
 
 
-def show_appointments(tokens):
+def show_appointments(tokens, session):
     '''
     TODO: Part 2
     '''
-    global current_patient, current_caregiver
+    # show_appointments [--from <date>] [--to <date>] [--after <appointment_id>] [--limit N]
 
     # Check if a user is logged in
-    if current_patient is None and current_caregiver is None:
+    if session.patient is None and session.caregiver is None:
         print("Please login first!")
         return
     
-    # Check if the length of tokens is correct
-    if len(tokens) != 1:
+    # Check the options
+    options = parse_options(tokens[1:], ("from", "to", "after", "limit"))
+    if options is None:
+        print("Please try again!")
+        return
+    try:
+        date_from = date_to = None
+        if "from" in options:
+            date_from = datetime.datetime.strptime(options["from"], "%m-%d-%Y").date()
+        if "to" in options:
+            date_to = datetime.datetime.strptime(options["to"], "%m-%d-%Y").date()
+        after = int(options.get("after", 0))
+        limit = int(options["limit"]) if "limit" in options else None
+    except ValueError:
+        print("Please try again!")
+        return
+    if limit is not None and limit <= 0:
         print("Please try again!")
         return
-    
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor(as_dict=True)
+
+    if session.patient:
+        column, username = "patient_name", session.patient.get_username()
+        print("Appointment_ID Vaccine_Name Date Caregiver_Name")
+    else:
+        column, username = "caregiver_name", session.caregiver.get_username()
+        print("Appointment_ID Vaccine_Name Date Patient_Name")
 
     try:
-        # Get appointments for the current user
-        if current_patient:
-            appointments_query = """
-                SELECT appointment_id, vaccine_name, appointment_date, caregiver_name
-                FROM Reserve
-                WHERE patient_name = %s
-                ORDER BY appointment_id
-            """
-            cursor.execute(appointments_query, current_patient.get_username())
-
-            # Print patient appointments
-            print("Appointment_ID Vaccine_Name Date Caregiver_Name")
-            for row in cursor:
-                appointment_id = row['appointment_id']
-                vaccine_name = row['vaccine_name']
-                appointment_date = row['appointment_date'].strftime("%m-%d-%Y")
-                caregiver_name = row['caregiver_name']
-                print(f"{appointment_id} {vaccine_name} {appointment_date} {caregiver_name}")
-        
-        elif current_caregiver:
-            appointments_query = """
-                SELECT appointment_id, vaccine_name, appointment_date, patient_name
-                FROM Reserve
-                WHERE caregiver_name = %s
-                ORDER BY appointment_id
-            """
-            cursor.execute(appointments_query, current_caregiver.get_username())
-
-            # Print caregiver appointments
-            print("Appointment_ID Vaccine_Name Date Patient_Name")
-            for row in cursor:
-                appointment_id = row['appointment_id']
-                vaccine_name = row['vaccine_name']
-                appointment_date = row['appointment_date'].strftime("%m-%d-%Y")
-                patient_name = row['patient_name']
-                print(f"{appointment_id} {vaccine_name} {appointment_date} {patient_name}")
-
-    except pymssql.Error as e:
+        shown = 0
+        last_id = None
+        for appointment_id, vaccine_name, appointment_date, other_name in iter_appointments(
+                column, username, after, date_from, date_to, limit):
+            print(f"{appointment_id} {vaccine_name} {appointment_date.strftime('%m-%d-%Y')} {other_name}")
+            shown += 1
+            last_id = appointment_id
+        if limit is not None and shown == limit:
+            print(f"More appointments may follow, use --after {last_id} for the next page.")
+        return True
+    except DBError as e:
         print("Please try again!")
         print("Db-Error:", e)
-    finally:
-        cm.close_connection()
 
 
 
 
 
-def logout(tokens):
+def logout(tokens, session):
     """
     TODO: Part 2
     """
-    global current_patient, current_caregiver
 
     # Check if a user is logged in
-    if current_patient is None and current_caregiver is None:
+    if session.patient is None and session.caregiver is None:
         print("Please login first!")
         return
     
     try:
         # Logout the current user
-        if current_patient:
+        if session.patient:
             print("Successfully logged out!")
-            current_patient = None
-        elif current_caregiver:
+            session.patient = None
+        elif session.caregiver:
             print("Successfully logged out!")
-            current_caregiver = None
+            session.caregiver = None
+        return True
 
     except Exception as e:
         print("Please try again!")
@@ -743,22 +877,67 @@ def logout(tokens):
 
 
 
+def stats(tokens, session):
+    #  stats [prometheus|sql|queries]
+    if len(tokens) > 2 or (len(tokens) == 2 and tokens[1].lower() not in ("prometheus", "sql", "queries")):
+        print("Please try again!")
+        return
+    if len(tokens) == 2 and tokens[1].lower() == "prometheus":
+        print(get_metrics().render(), end="")
+        return True
+    if len(tokens) == 2 and tokens[1].lower() == "queries":
+        # every catalog statement, including the ones not run yet
+        run = get_tracer().by_name()
+        for query in Queries.all():
+            statement = run.get(query.name)
+            if statement is None:
+                print(f"{query.name}: 0 runs")
+            else:
+                print(f"{query.name}: {statement['count']} runs, {statement['total_ms']:.3f} ms total, "
+                      f"{statement['mean_ms']:.3f} ms mean, {statement['max_ms']:.3f} ms max, "
+                      f"{statement['rows']} rows, {statement['errors']} errors")
+        return True
+    if len(tokens) == 2:
+        # statements by total time
+        for statement in get_tracer().top(10):
+            print(f"{statement['total_ms']:.3f} ms total, {statement['count']} runs, "
+                  f"{statement['mean_ms']:.3f} ms mean, {statement['max_ms']:.3f} ms max, "
+                  f"{statement['rows']} rows, {statement['errors']} errors: {statement['sql']}")
+        return True
+    for line in get_metrics().summary():
+        print(line)
+    print("pool", ConnectionManager.pool_stats())
+    print("password hashing", get_verifier().stats())
+    print("inventory cache", get_inventory_cache().stats())
+    if get_dose_allocator() is not None:
+        print("dose leases", get_dose_allocator().stats())
+    if get_availability_index() is not None:
+        print("availability index", get_availability_index().stats())
+    matcher = get_waitlist_matcher()
+    # stats() holds the depth of the last pass, print the current one
+    print("waitlist", dict(matcher.stats(), depth=matcher.depth()))
+    return True
+
 
 def start():
+    session = Session()
     stop = False
     print()
     print(" *** Please enter one of the following commands *** ")
     print("> create_patient <username> <password>")  # //TODO: implement create_patient (Part 1)
     print("> create_caregiver <username> <password>")
+    print("> import_users <csv>")
     print("> login_patient <username> <password>")  # // TODO: implement login_patient (Part 1)
     print("> login_caregiver <username> <password>")
-    print("> search_caregiver_schedule <date>")  # // TODO: implement search_caregiver_schedule (Part 2)
-    print("> reserve <date> <vaccine>")  # // TODO: implement reserve (Part 2)
-    print("> upload_availability <date>")
+    print("> search_caregiver_schedule <date> | <from> <to> [--caregivers]")  # // TODO: implement search_caregiver_schedule (Part 2)
+    print("> reserve <date> <vaccine> [--waitlist [<to_date>]]")  # // TODO: implement reserve (Part 2)
+    print("> upload_availability <date> [<to_date>] [daily|weekdays|weekends|mon,wed,...]")
     print("> cancel <appointment_id>")  # // TODO: implement cancel (extra credit)
-    print("> add_doses <vaccine> <number>")
-    print("> show_appointments")  # // TODO: implement show_appointments (Part 2)
+    print("> cancel_days <date> [<to_date>]")
+    print("> add_doses <vaccine> <number> | --file <shipment.csv>")
+    print("> show_appointments [--from <date>] [--to <date>] [--after <appointment_id>] [--limit N]")  # // TODO: implement show_appointments (Part 2)
     print("> logout")  # // TODO: implement logout (Part 2)
+    print("> stats [prometheus|sql|queries]")
     print("> Quit")
     print()
     while not stop:
@@ -777,33 +956,133 @@ def start():
             ValueError("Please try again!")
             continue
         operation = tokens[0].lower()
-        if operation == "create_patient":
-            create_patient(tokens)
-        elif operation == "create_caregiver":
-            create_caregiver(tokens)
-        elif operation == "login_patient":
-            login_patient(tokens)
-        elif operation == "login_caregiver":
-            login_caregiver(tokens)
-        elif operation == "search_caregiver_schedule":
-            search_caregiver_schedule(tokens)
-        elif operation == "reserve":
-            reserve(tokens)
-        elif operation == "upload_availability":
-            upload_availability(tokens)
-        elif operation == "cancel":
-            cancel(tokens)
-        elif operation == "add_doses":
-            add_doses(tokens)
-        elif operation == "show_appointments":
-            show_appointments(tokens)
-        elif operation == "logout":
-            logout(tokens)
-        elif operation == "quit":
+        if operation == "quit":
             print("Bye!")
             stop = True
         else:
-            print("Invalid operation name!")
+            dispatch(tokens, session)
+
+
+# operation name -> handler; every handler takes the command tokens and the session and returns True on success
+commands = {
+    "create_patient": create_patient,
+    "create_caregiver": create_caregiver,
+    "import_users": import_users,
+    "login_patient": login_patient,
+    "login_caregiver": login_caregiver,
+    "search_caregiver_schedule": search_caregiver_schedule,
+    "reserve": reserve,
+    "upload_availability": upload_availability,
+    "cancel": cancel,
+    "cancel_days": cancel_days,
+    "add_doses": add_doses,
+    "show_appointments": show_appointments,
+    "logout": logout,
+    "stats": stats,
+}
+
+
+def dispatch(tokens, session):
+    operation = tokens[0].lower()
+    handler = commands.get(operation)
+    if handler is None:
+        print("Invalid operation name!")
+        return False
+    status = "exception"
+    start_time = time.perf_counter()
+    try:
+        ok = handler(tokens, session)
+        status = "ok" if ok is True else "error"
+        return ok
+    finally:
+        get_metrics().histogram("scheduler_command_seconds", command=operation, status=status).observe(
+            time.perf_counter() - start_time)
+
+
+def execute(session, tokens, number=None):
+    """
+    Run one command for session, capturing what it prints. Returns the result
+    object of script and server mode: line number, operation, status ("ok",
+    "error", or "fatal" when the handler gave up on the database), elapsed time
+    and printed output. Arguments are not echoed since they may hold passwords.
+    """
+    status = "error"
+    start_time = time.perf_counter()
+    with capture_output() as output:
+        try:
+            if dispatch(tokens, session) is True:
+                status = "ok"
+        except SystemExit:
+            # handlers quit() on database errors
+            status = "fatal"
+        except Exception as e:
+            print(f"Error: {e}")
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    return {
+        "line": number,
+        "command": tokens[0].lower(),
+        "status": status,
+        "elapsed_ms": round(elapsed_ms, 3),
+        "output": output.getvalue(),
+    }
+
+
+def run_script(lines, results, stop_on_error=False):
+    """
+    Run commands without prompts, writing the result of each one to results as a
+    JSON line (see execute). Blank lines and lines starting with # are skipped.
+    Returns the number of failed commands.
+    """
+    session = Session()
+    failed = 0
+    with ConnectionManager.pinned():
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            tokens = line.split(" ")
+            if tokens[0].lower() == "quit":
+                break
+
+            result = execute(session, tokens, number)
+            fatal = result["status"] == "fatal"
+            if fatal:
+                # keep the documented statuses, stop like the prompt would
+                result["status"] = "error"
+            results.write(json.dumps(result) + "\n")
+            if result["status"] != "ok":
+                failed += 1
+                if fatal or stop_on_error:
+                    break
+    return failed
+
+
+def run_command_line(words):
+    """
+    Run the commands given on the command line, separated by ';' words, in one
+    session and print their output as the prompt would. Returns the exit status:
+    0 when every command succeeded, 1 at the first one that did not.
+    """
+    commands_given = [[]]
+    for word in words:
+        if word == ";":
+            commands_given.append([])
+        else:
+            commands_given[-1].append(word)
+
+    session = Session()
+    with ConnectionManager.pinned():
+        for tokens in commands_given:
+            if not tokens:
+                continue
+            try:
+                ok = dispatch(tokens, session)
+            except SystemExit:
+                # handlers quit() on database errors
+                return 1
+            if ok is not True:
+                return 1
+    return 0
 
 
 if __name__ == "__main__":
@@ -813,6 +1092,45 @@ if __name__ == "__main__":
     // for the simplicity of this assignment
     // and then construct a map of vaccineName -> vaccineObject
     '''
+    import argparse
+
+    parser = argparse.ArgumentParser(description="COVID-19 Vaccine Reservation Scheduling Application")
+    parser.add_argument("command", nargs=argparse.REMAINDER,
+                        help="run this one command and exit, e.g. add_doses pfizer 10; separate several "
+                             "commands sharing a login with a ';' argument")
+    parser.add_argument("--script", help="run the commands in this file ('-' for stdin) instead of prompting")
+    parser.add_argument("--stop-on-error", action="store_true", help="stop the script at the first failed command")
+    parser.add_argument("--results", help="write the JSONL results of --script here instead of stdout")
+    parser.add_argument("--serve", metavar="HOST:PORT", help="serve the commands over TCP, one JSON result line per command")
+    parser.add_argument("--workers", type=int, default=8, help="threads running commands for --serve")
+    args = parser.parse_args()
+
+    if args.script:
+        script = sys.stdin if args.script == "-" else open(args.script)
+        results = open(args.results, "w") if args.results else sys.stdout
+        try:
+            failed = run_script(script, results, args.stop_on_error)
+        finally:
+            if script is not sys.stdin:
+                script.close()
+            if results is not sys.stdout:
+                results.close()
+        sys.exit(1 if failed else 0)
+
+    if args.command:
+        sys.exit(run_command_line(args.command))
+
+    if args.serve:
+        import asyncio
+        from service.SchedulerServer import SchedulerServer
+
+        host, _, port = args.serve.rpartition(":")
+        server = SchedulerServer(execute, host or "127.0.0.1", int(port), workers=args.workers)
+        try:
+            asyncio.run(server.serve())
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
 
     # start command line
     print()
@@ -0,0 +1,132 @@
+import argparse
+import datetime
+import os
+import random
+import re
+import tempfile
+import time
+from db.Migrator import Migrator
+from db.Queries import Queries
+from db.SQLiteBackend import SQLiteBackend
+
+
+# the hot read paths of Scheduler.py, with a function producing parameters for them
+queries = {
+    "show_appointments (patient)": (
+        Queries.patient_appointments,
+        lambda b: (b.random_patient(), 0, datetime.date.min, datetime.date.max, 2 ** 31 - 1),
+    ),
+    "show_appointments (caregiver)": (
+        Queries.caregiver_appointments,
+        lambda b: (b.random_caregiver(), 0, datetime.date.min, datetime.date.max, 2 ** 31 - 1),
+    ),
+    "cancel lookup": (
+        Queries.appointment_of_patient,
+        lambda b: (random.randint(1, b.reservations), b.random_patient()),
+    ),
+    "search_caregiver_schedule": (
+        Queries.caregivers_available_on,
+        lambda b: (b.random_date(),),
+    ),
+}
+
+# the migration adding the indexes under test
+index_version = 3
+
+
+class IndexBenchmark:
+    """
+    Seeds a scratch SQLite database with every migration applied but without
+    the indexes of the index migration, times the catalog statements of the hot
+    paths and prints their plans, then creates the indexes again and does the
+    same.
+    """
+
+    def __init__(self, path, patients=20000, caregivers=1000, reservations=200000, days=365, runs=200):
+        self.backend = SQLiteBackend(path, auto_migrate=False)
+        self.patients = patients
+        self.caregivers = caregivers
+        self.reservations = reservations
+        self.days = days
+        self.runs = runs
+        self.start_date = datetime.date(2027, 1, 1)
+
+    def random_patient(self):
+        return f"patient{random.randrange(self.patients)}"
+
+    def random_caregiver(self):
+        return f"caregiver{random.randrange(self.caregivers)}"
+
+    def random_date(self):
+        return self.start_date + datetime.timedelta(days=random.randrange(self.days))
+
+    def seed(self, conn):
+        cursor = conn.cursor()
+        blank = b"\0" * 16
+        cursor.executemany(Queries.patient_insert, [(f"patient{i}", blank, blank) for i in range(self.patients)])
+        cursor.executemany(Queries.caregiver_insert, [(f"caregiver{i}", blank, blank) for i in range(self.caregivers)])
+        cursor.execute(Queries.vaccine_insert, ("pfizer", self.reservations, self.reservations))
+        cursor.executemany(Queries.availability_restore,
+                           [(self.start_date + datetime.timedelta(days=d), f"caregiver{c}")
+                            for d in range(self.days) for c in range(self.caregivers) if random.random() < 0.3])
+        cursor.executemany(
+            "INSERT INTO Reserve (vaccine_name, appointment_date, patient_name, caregiver_name) VALUES (%s, %s, %s, %s)",
+            [("pfizer", self.random_date(), self.random_patient(), self.random_caregiver())
+             for _ in range(self.reservations)])
+        conn.commit()
+        cursor.execute("ANALYZE")
+
+    def measure(self, conn, label):
+        cursor = conn.cursor()
+        print(f"== {label}")
+        for name, (query, params) in queries.items():
+            sql = query.for_backend(self.backend)
+            plan = self.backend.explain(cursor, sql, params(self))
+            start = time.perf_counter()
+            for _ in range(self.runs):
+                cursor.execute(sql, params(self))
+                cursor.fetchall()
+            elapsed_ms = (time.perf_counter() - start) * 1000 / self.runs
+            print(f"{name}: {elapsed_ms:.3f} ms/query")
+            for line in plan:
+                print(f"    {line}")
+
+    # The statements of the index migration
+    def index_statements(self):
+        path = next(path for version, _, path in Migrator(self.backend).migrations() if version == index_version)
+        with open(path) as f:
+            return self.backend.split_script(f.read())
+
+    def run(self):
+        conn = self.backend.connect()
+        try:
+            Migrator(self.backend).migrate(conn)
+            cursor = conn.cursor()
+            statements = self.index_statements()
+            for statement in statements:
+                for index_name in re.findall(r"CREATE\s+INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", statement, re.I):
+                    cursor.execute(f"DROP INDEX {index_name}")
+            conn.commit()
+            self.seed(conn)
+            self.measure(conn, f"without the indexes of migration {index_version:04d}")
+            for statement in statements:
+                cursor.execute(statement)
+            conn.commit()
+            cursor.execute("ANALYZE")
+            self.measure(conn, f"with the indexes of migration {index_version:04d}")
+        finally:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query plans and timings before and after the Reserve indexes")
+    parser.add_argument("--reservations", type=int, default=200000)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        IndexBenchmark(os.path.join(directory, "bench.db"), reservations=args.reservations, runs=args.runs).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import Scheduler
+from db.AssignmentPolicy import get_assignment_policy
+from db.Backend import get_backend
+from db.ConnectionManager import ConnectionManager
+from db.QueryTracer import get_tracer
+from model.Caregiver import Caregiver
+from model.Patient import Patient
+from model.Session import Session
+from service.DoseAllocator import get_dose_allocator, reconcile
+
+
+# command -> weight of the default mix
+default_mix = {
+    "search_caregiver_schedule": 4,
+    "reserve": 3,
+    "cancel": 1,
+    "show_appointments": 4,
+    "upload_availability": 1,
+}
+
+vaccines = ["pfizer", "moderna", "janssen"]
+
+appointment_id = re.compile(r"Appointment ID: (\d+)")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in default_mix:
+            raise ValueError(f"Unknown command {name!r} in mix, expected one of {', '.join(default_mix)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, p):
+    # nearest rank
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(p / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LoadBenchmark:
+    """
+    Seeds a scratch SQLite database with caregivers, patients, vaccines and
+    availability over a date horizon, then has many simulated users run a
+    weighted mix of commands through Scheduler.execute from their own threads,
+    each with its own Session and the shared connection pool.
+
+    Reports throughput, latency percentiles per command, commands that failed
+    on a database error (lock timeouts, constraint violations), double
+    bookings found by checking the tables afterwards, and pool connection
+    counts.
+    """
+
+    def __init__(self, caregivers=100, patients=2000, days=60, doses=100000,
+                 users=16, ops=200, mix=None, seed=1):
+        self.caregivers = caregivers
+        self.patients = patients
+        self.days = days
+        self.doses = doses
+        self.users = users
+        self.ops = ops
+        self.mix = mix or default_mix
+        self.seed = seed
+        self.start_date = datetime.date(2027, 1, 1)
+
+        self._lock = threading.Lock()
+        self.latencies = {name: [] for name in self.mix}
+        self.statuses = {name: {} for name in self.mix}
+        self.db_errors = 0
+        self.peak_in_use = 0
+
+    def seed_database(self):
+        random.seed(self.seed)
+        blank = b"\0" * 16
+        conn = get_backend().connect()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany("INSERT INTO Patients VALUES (%s, %s, %s)",
+                               [(f"patient{i}", blank, blank) for i in range(self.patients)])
+            cursor.executemany("INSERT INTO Caregivers (Username, Salt, Hash) VALUES (%s, %s, %s)",
+                               [(f"caregiver{i}", blank, blank) for i in range(self.caregivers)])
+            cursor.executemany("INSERT INTO Vaccines (Name, Doses, TotalAdded) VALUES (%s, %d, %d)",
+                               [(name, self.doses, self.doses) for name in vaccines])
+            cursor.executemany("INSERT INTO Availabilities VALUES (%s, %s)",
+                               [(self.start_date + datetime.timedelta(days=d), f"caregiver{c}")
+                                for d in range(self.days) for c in range(self.caregivers) if random.random() < 0.5])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def date(self, rng):
+        return (self.start_date + datetime.timedelta(days=rng.randrange(self.days))).strftime("%m-%d-%Y")
+
+    def user(self, number):
+        rng = random.Random(self.seed * 1000003 + number)
+        patient = Session()
+        patient.patient = Patient(f"patient{number % self.patients}")
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        booked = []
+
+        for _ in range(self.ops):
+            name = rng.choices(names, weights)[0]
+            session = patient
+            if name == "search_caregiver_schedule":
+                tokens = [name, self.date(rng)]
+            elif name == "reserve":
+                tokens = [name, self.date(rng), rng.choice(vaccines)]
+            elif name == "cancel":
+                if not booked:
+                    continue
+                tokens = [name, booked.pop(rng.randrange(len(booked)))]
+            elif name == "show_appointments":
+                tokens = [name]
+            else:
+                session = Session()
+                session.caregiver = Caregiver(f"caregiver{rng.randrange(self.caregivers)}")
+                tokens = [name, self.date(rng)]
+
+            result = Scheduler.execute(session, tokens)
+            if name == "reserve" and result["status"] == "ok":
+                booked.append(appointment_id.search(result["output"]).group(1))
+            with self._lock:
+                self.latencies[name].append(result["elapsed_ms"])
+                self.statuses[name][result["status"]] = self.statuses[name].get(result["status"], 0) + 1
+                if "Error:" in result["output"]:
+                    self.db_errors += 1
+
+    def watch_pool(self, stop):
+        while not stop.wait(0.01):
+            self.peak_in_use = max(self.peak_in_use, ConnectionManager.pool_stats()["in_use"])
+
+    # Rows that break the booking invariants, by kind
+    def double_bookings(self):
+        conn = get_backend().connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT COUNT(*) FROM (
+                    SELECT caregiver_name, appointment_date
+                    FROM Reserve
+                    GROUP BY caregiver_name, appointment_date
+                    HAVING COUNT(*) > 1
+                ) t
+            """)
+            same_slot = cursor.fetchone()[0]
+            cursor.execute("""
+                SELECT COUNT(*)
+                FROM Reserve r
+                JOIN Availabilities a ON a.Username = r.caregiver_name AND a.Time = r.appointment_date
+            """)
+            slot_still_free = cursor.fetchone()[0]
+            dose_drift = sum(row["doses"] + row["leased"] + row["reserved"] - row["total_added"]
+                             for row in reconcile(cursor))
+            cursor.execute("""
+                SELECT COUNT(*)
+                FROM Caregivers c
+                WHERE c.Appointments <> (SELECT COUNT(*) FROM Reserve r WHERE r.caregiver_name = c.Username)
+            """)
+            load_drift = cursor.fetchone()[0]
+        finally:
+            conn.close()
+        return {"same_slot": same_slot, "slot_still_free": slot_still_free, "dose_drift": dose_drift,
+                "load_drift": load_drift}
+
+    # Spread of appointments over caregivers under the assignment policy
+    def caregiver_load(self):
+        conn = get_backend().connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(Appointments), MAX(Appointments), AVG(Appointments * 1.0) FROM Caregivers")
+            low, high, mean = cursor.fetchone()
+        finally:
+            conn.close()
+        return {"policy": get_assignment_policy().name, "min": low, "max": high, "mean": round(mean, 2)}
+
+    def run(self):
+        self.seed_database()
+
+        stop = threading.Event()
+        watcher = threading.Thread(target=self.watch_pool, args=(stop,), daemon=True)
+        threads = [threading.Thread(target=self.user, args=(n,)) for n in range(self.users)]
+        watcher.start()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        watcher.join()
+
+        commands = {}
+        for name, values in self.latencies.items():
+            values.sort()
+            commands[name] = {
+                "count": len(values),
+                "statuses": self.statuses[name],
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+            }
+        total = sum(c["count"] for c in commands.values())
+        pool = ConnectionManager.pool_stats()
+        return {
+            "users": self.users,
+            "commands_run": total,
+            "seconds": round(elapsed, 3),
+            "throughput": round(total / elapsed, 1) if elapsed else 0.0,
+            "commands": commands,
+            "db_errors": self.db_errors,
+            "double_bookings": self.double_bookings(),
+            "caregiver_load": self.caregiver_load(),
+            "dose_leases": get_dose_allocator().stats() if get_dose_allocator() is not None else None,
+            "statements": get_tracer().top(5),
+            "connections": {
+                "created": pool["creates"],
+                "peak_in_use": self.peak_in_use,
+                "max_size": pool["max_size"],
+                "checkout_waits": pool["waits"],
+            },
+        }
+
+
+# Return the ways report is worse than baseline by more than tolerance (a fraction)
+def regressions(report, baseline, tolerance):
+    found = []
+    if report["throughput"] < baseline["throughput"] * (1 - tolerance):
+        found.append(f"throughput {report['throughput']}/s < baseline {baseline['throughput']}/s")
+    for name, stats in report["commands"].items():
+        base = baseline["commands"].get(name)
+        if base is None:
+            continue
+        for p in ("p95", "p99"):
+            if stats[p] > base[p] * (1 + tolerance):
+                found.append(f"{name} {p} {stats[p]:.3f} ms > baseline {base[p]:.3f} ms")
+    if any(report["double_bookings"].values()):
+        found.append(f"double bookings {report['double_bookings']}")
+    return found
+
+
+def print_report(report):
+    print(f"{report['commands_run']} commands from {report['users']} users in {report['seconds']} s "
+          f"({report['throughput']} commands/s)")
+    print(f"{'command':<28}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  statuses")
+    for name, stats in report["commands"].items():
+        print(f"{name:<28}{stats['count']:>7}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}  "
+              f"{stats['statuses']}")
+    print(f"database errors: {report['db_errors']}")
+    print(f"double bookings: {report['double_bookings']}")
+    print(f"caregiver load: {report['caregiver_load']}")
+    if report["dose_leases"] is not None:
+        print(f"dose leases: {report['dose_leases']}")
+        print(f"double bookings after returning leases: {report['double_bookings_after_release']}")
+    print(f"connections: {report['connections']}")
+    print("statements by total time:")
+    for statement in report["statements"]:
+        print(f"  {statement['total_ms']:>10.3f} ms {statement['count']:>6} runs  {statement['sql'][:100]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent booking workload against a scratch SQLite database")
+    parser.add_argument("--caregivers", type=int, default=100)
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=60, help="availability horizon")
+    parser.add_argument("--users", type=int, default=16, help="concurrent simulated users")
+    parser.add_argument("--ops", type=int, default=200, help="commands per user")
+    parser.add_argument("--mix", type=parse_mix, help="e.g. reserve=3,cancel=1,show_appointments=4")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the report here")
+    parser.add_argument("--save-baseline", help="write the report here as the new baseline")
+    parser.add_argument("--baseline", help="fail if the run regresses against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression, as a fraction")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # read when the backend and the pool are first created
+        os.environ["Backend"] = "sqlite"
+        os.environ["SQLitePath"] = os.path.join(directory, "load.db")
+        benchmark = LoadBenchmark(args.caregivers, args.patients, args.days,
+                                  users=args.users, ops=args.ops, mix=args.mix, seed=args.seed)
+        report = benchmark.run()
+        if get_dose_allocator() is not None:
+            # return the leased doses while the database still exists and check the totals again
+            get_dose_allocator().release_all()
+            report["double_bookings_after_release"] = benchmark.double_bookings()
+        ConnectionManager.get_pool().close_all()
+
+    print_report(report)
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for problem in found:
+            print(f"REGRESSION: {problem}")
+        if found:
+            sys.exit(1)
+    elif any(report["double_bookings"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+from db.AssignmentPolicy import Alphabetical
+from db.Backend import get_backend
+from db.ConnectionManager import ConnectionManager
+from service.SlotPlanner import SlotPlanner
+
+
+class PlanBenchmark:
+    """
+    Compares the slot planner with booking one request at a time on a
+    synthetic week: requests arrive in random order, want one of a few
+    vaccines with uneven popularity, prefer the first days of the week and
+    accept up to flex more days; every vaccine gets the same number of doses
+    and every day the same number of slots. Reports the run time and the
+    slots each approach fills. With commit=True the requests and slots are
+    also written to a scratch SQLite database and SlotPlanner.run books them.
+    """
+
+    def __init__(self, requests=100000, slots=10000, days=7, vaccines=3, flex=3, seed=1):
+        self.requests = requests
+        self.slots = slots
+        self.days = days
+        self.vaccines = [f"vaccine{i}" for i in range(vaccines)]
+        self.flex = flex
+        self.seed = seed
+        self.start_date = datetime.date.today() + datetime.timedelta(days=1)
+
+    def generate(self):
+        rng = random.Random(self.seed)
+        dates = [self.start_date + datetime.timedelta(days=d) for d in range(self.days)]
+        caregivers = max(1, self.slots // self.days)
+        slots = [(date, f"caregiver{c}") for date in dates for c in range(caregivers)][:self.slots]
+
+        # vaccine i is half as popular as vaccine i - 1, day d half as wanted as day d - 1
+        popularity = [0.5 ** i for i in range(len(self.vaccines))]
+        preference = [0.5 ** d for d in range(self.days)]
+        requests = []
+        for waitlist_id in range(1, self.requests + 1):
+            vaccine_name = rng.choices(self.vaccines, popularity)[0]
+            first = rng.choices(range(self.days), preference)[0]
+            last = min(self.days - 1, first + rng.randint(0, self.flex))
+            requests.append((waitlist_id, f"patient{waitlist_id}", vaccine_name, dates[first], dates[last]))
+        doses = {vaccine_name: -(-len(slots) // len(self.vaccines)) for vaccine_name in self.vaccines}
+        return requests, slots, doses
+
+    def run(self):
+        requests, slots, doses = self.generate()
+        report = {"requests": len(requests), "slots": len(slots), "doses": sum(doses.values())}
+        planners = {
+            "greedy": SlotPlanner.greedy,
+            "max_flow": SlotPlanner(Alphabetical()).plan,
+            "max_flow_fair": SlotPlanner(Alphabetical(), fair=True).plan,
+        }
+        for name, plan in planners.items():
+            start = time.perf_counter()
+            booked = plan(requests, slots, doses)
+            elapsed = time.perf_counter() - start
+            self.check(booked, requests, slots, doses)
+            waited = [waitlist_id for waitlist_id, *_ in booked]
+            report[name] = {
+                "ms": round(elapsed * 1000, 1),
+                "booked": len(booked),
+                "utilization": round(len(booked) / len(slots), 4),
+                # the newest request booked: lower means the oldest requests were served first
+                "newest_booked": max(waited, default=0),
+            }
+        return report
+
+    # A plan may use each slot once, only the days a request accepts, and at most the doses there are
+    @staticmethod
+    def check(booked, requests, slots, doses):
+        windows = {request[0]: request for request in requests}
+        free = set(slots)
+        used = {}
+        for waitlist_id, patient_name, vaccine_name, caregiver_name, date in booked:
+            _, _, wanted, first, last = windows[waitlist_id]
+            assert wanted == vaccine_name and first <= date <= last, waitlist_id
+            free.remove((date, caregiver_name))
+            used[vaccine_name] = used.get(vaccine_name, 0) + 1
+        assert all(used[name] <= doses[name] for name in used)
+        assert len({waitlist_id for waitlist_id, *_ in booked}) == len(booked)
+
+    # Book the same week through the database; returns the SlotPlan
+    def run_committed(self, fair=False):
+        requests, slots, doses = self.generate()
+        blank = b"\0" * 16
+        caregivers = sorted({caregiver_name for _, caregiver_name in slots})
+        conn = get_backend().connect()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany("INSERT INTO Patients VALUES (%s, %s, %s)",
+                               [(patient_name, blank, blank) for _, patient_name, *_ in requests])
+            cursor.executemany("INSERT INTO Caregivers (Username, Salt, Hash) VALUES (%s, %s, %s)",
+                               [(caregiver_name, blank, blank) for caregiver_name in caregivers])
+            cursor.executemany("INSERT INTO Vaccines (Name, Doses, TotalAdded) VALUES (%s, %d, %d)",
+                               [(name, count, count) for name, count in doses.items()])
+            cursor.executemany("INSERT INTO Availabilities VALUES (%s, %s)", slots)
+            now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+            cursor.executemany("""
+                INSERT INTO Waitlist (WaitlistId, patient_name, vaccine_name, Time, LatestTime, RequestedAt)
+                VALUES (%d, %s, %s, %s, %s, %s)
+            """, [(*request, now) for request in requests])
+            conn.commit()
+        finally:
+            conn.close()
+        end_date = self.start_date + datetime.timedelta(days=self.days - 1)
+        return SlotPlanner(Alphabetical(), fair=fair).run(self.start_date, end_date)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Slot planner against booking one request at a time")
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--slots", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--vaccines", type=int, default=3)
+    parser.add_argument("--flex", type=int, default=3, help="most extra days a request accepts")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--commit", action="store_true", help="also book through a scratch SQLite database")
+    args = parser.parse_args()
+
+    benchmark = PlanBenchmark(args.requests, args.slots, args.days, args.vaccines, args.flex, args.seed)
+    report = benchmark.run()
+    print(f"{report['requests']} requests, {report['slots']} slots, {report['doses']} doses")
+    print(f"{'':16}{'ms':>10}{'booked':>10}{'used':>9}{'newest':>10}")
+    for name in ("greedy", "max_flow", "max_flow_fair"):
+        result = report[name]
+        print(f"{name:16}{result['ms']:>10.1f}{result['booked']:>10}{result['utilization']:>9.1%}"
+              f"{result['newest_booked']:>10}")
+    gain = report["max_flow"]["booked"] - report["greedy"]["booked"]
+    print(f"max flow books {gain} more ({gain / report['slots']:+.1%} of the slots)")
+
+    if args.commit:
+        with tempfile.TemporaryDirectory() as directory:
+            # read when the backend and the pool are first created
+            os.environ["Backend"] = "sqlite"
+            os.environ["SQLitePath"] = os.path.join(directory, "plan.db")
+            print(benchmark.run_committed())
+            ConnectionManager.get_pool().close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# the scheduler directory, where Scheduler.py is imported from
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that must not be imported before a command needs them
+deferred = ("pymssql", "sqlite3", "asyncio", "multiprocessing", "concurrent.futures", "model.Patient",
+            "model.Caregiver", "model.Vaccine", "db.ConnectionManager", "service.CredentialVerifier")
+
+
+# Import Scheduler in a fresh interpreter under -X importtime; returns
+# {module: (self us, cumulative us, depth)} for Scheduler and the modules it imported
+def import_times():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import Scheduler"],
+                            cwd=root, capture_output=True, text=True, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+
+    # a module is reported after the modules it imported, one level deeper
+    end = next(i for i, entry in enumerate(entries) if entry[0] == "Scheduler" and entry[3] == 0)
+    start = end
+    while start > 0 and entries[start - 1][3] > 0:
+        start -= 1
+    return {name: (self_us, cumulative_us, depth) for name, self_us, cumulative_us, depth in entries[start:end + 1]}
+
+
+def run(runs):
+    samples = [import_times() for _ in range(runs)]
+    totals = [sample["Scheduler"][1] / 1000 for sample in samples]
+    median_run = samples[totals.index(sorted(totals)[len(totals) // 2])]
+    direct = sorted(((name, cumulative / 1000) for name, (_, cumulative, depth) in median_run.items() if depth == 1),
+                    key=lambda item: item[1], reverse=True)
+    return {
+        "at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "runs": runs,
+        "median_ms": round(statistics.median(totals), 3),
+        "min_ms": round(min(totals), 3),
+        "max_ms": round(max(totals), 3),
+        "modules": len(median_run),
+        "direct_imports": [{"module": name, "ms": round(ms, 3)} for name, ms in direct],
+        "eager": [name for name in deferred if name in median_run],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time importing Scheduler.py with -X importtime")
+    parser.add_argument("--runs", type=int, default=10, help="fresh interpreters to time")
+    parser.add_argument("--budget-ms", type=float, help="fail if the median import time is above this")
+    parser.add_argument("--history", help="append the result to this JSON lines file and compare with the last one")
+    args = parser.parse_args()
+
+    report = run(args.runs)
+    print(f"import Scheduler: median {report['median_ms']:.1f} ms, min {report['min_ms']:.1f} ms, "
+          f"max {report['max_ms']:.1f} ms over {report['runs']} runs, {report['modules']} modules")
+    for entry in report["direct_imports"][:10]:
+        print(f"  {entry['ms']:>8.1f} ms  {entry['module']}")
+
+    failed = []
+    if report["eager"]:
+        failed.append(f"imported at startup: {', '.join(report['eager'])}")
+    if args.budget_ms is not None and report["median_ms"] > args.budget_ms:
+        failed.append(f"median {report['median_ms']:.1f} ms > budget {args.budget_ms:.1f} ms")
+
+    if args.history:
+        previous = None
+        if os.path.exists(args.history):
+            with open(args.history) as f:
+                lines = [line for line in f if line.strip()]
+            if lines:
+                previous = json.loads(lines[-1])
+        if previous is not None:
+            print(f"previous run {previous['at']}: median {previous['median_ms']:.1f} ms "
+                  f"({report['median_ms'] - previous['median_ms']:+.1f} ms)")
+        with open(args.history, "a") as f:
+            f.write(json.dumps(report) + "\n")
+
+    for problem in failed:
+        print(f"REGRESSION: {problem}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import os
+import random
+import threading
+
+
+class AssignmentPolicy:
+    """
+    Chooses which of the caregivers available on a date gets a new appointment.
+
+    A policy is an ORDER BY over the candidate Availabilities rows a joined with
+    their Caregivers rows c; the backend claims the first row in that order
+    that no concurrent reservation holds. choose() makes the same choice in
+    memory for the availability index. assigned() is told the caregiver that
+    was booked.
+    """
+
+    name = None
+
+    # Return (ORDER BY clause, params) for backend
+    def order_by(self, backend):
+        raise NotImplementedError
+
+    # Return the caregiver to book among names, loads giving their appointment counts in the same order
+    def choose(self, names, loads):
+        raise NotImplementedError
+
+    def assigned(self, caregiver_name):
+        pass
+
+
+class Alphabetical(AssignmentPolicy):
+    name = "alphabetical"
+
+    def order_by(self, backend):
+        return "a.Username", ()
+
+    def choose(self, names, loads):
+        return min(names)
+
+
+class LeastLoaded(AssignmentPolicy):
+    """
+    The caregiver with the fewest appointments, from the Caregivers.Appointments
+    counter that reserve and cancel maintain; ties go alphabetically.
+    """
+
+    name = "least_loaded"
+
+    def order_by(self, backend):
+        return "c.Appointments, a.Username", ()
+
+    def choose(self, names, loads):
+        return min(zip(loads, names))[1]
+
+
+class RoundRobin(AssignmentPolicy):
+    """
+    The first caregiver after the one this process booked last, wrapping
+    around to the start of the alphabet.
+    """
+
+    name = "round_robin"
+
+    def __init__(self):
+        self.last = ""
+        self._lock = threading.Lock()
+
+    def order_by(self, backend):
+        with self._lock:
+            last = self.last
+        return "CASE WHEN a.Username > %s THEN 0 ELSE 1 END, a.Username", (last,)
+
+    def choose(self, names, loads):
+        with self._lock:
+            last = self.last
+        return min(names, key=lambda name: (name <= last, name))
+
+    def assigned(self, caregiver_name):
+        with self._lock:
+            self.last = caregiver_name
+
+
+class Randomized(AssignmentPolicy):
+    name = "random"
+
+    def order_by(self, backend):
+        return backend.random_order, ()
+
+    def choose(self, names, loads):
+        return random.choice(names)
+
+
+policies = {policy.name: policy for policy in (Alphabetical, LeastLoaded, RoundRobin, Randomized)}
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+# Return the process-wide policy named by the "AssignmentPolicy" environment variable
+def get_assignment_policy():
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                name = os.getenv("AssignmentPolicy", LeastLoaded.name).lower()
+                if name not in policies:
+                    raise ValueError(f"Unknown assignment policy {name!r}, expected one of {', '.join(policies)}")
+                _policy = policies[name]()
+    return _policy
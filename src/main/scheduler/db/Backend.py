@@ -0,0 +1,317 @@
+import importlib
+import os
+import re
+import threading
+import time
+from db.Queries import Query
+from db.QueryTracer import get_tracer
+from util.Metrics import get_metrics
+
+
+class DBError(Exception):
+    """
+    Driver-neutral database error. The driver's own exception is kept as __cause__.
+    """
+    pass
+
+
+class Cursor:
+    """
+    Thin wrapper over a driver cursor that accepts the pymssql parameter style
+    (%s / %d placeholders, a bare value for a single parameter) on every backend
+    and raises DBError instead of driver-specific exceptions.
+    """
+
+    def __init__(self, backend, cursor):
+        self.backend = backend
+        self._cursor = cursor
+        # traced operation of the last statement, while its rows are being fetched
+        self._fetching = None
+
+    def execute(self, operation, params=None):
+        trace = (operation, params)
+        if isinstance(operation, Query):
+            operation = operation.for_backend(self.backend)
+            trace = (operation, params)
+            operation, params = self.backend.parameterize(operation, params)
+        prepared = self.backend.prepare(operation)
+        if params is None:
+            self._run("execute", self._cursor.execute, prepared, trace=trace)
+        else:
+            self._run("execute", self._cursor.execute, prepared, self.backend.adapt_params(params), trace=trace)
+
+    def executemany(self, operation, seq_of_params):
+        prepared = self.backend.prepare(operation)
+        self._run("execute", self._cursor.executemany, prepared, [self.backend.adapt_params(p) for p in seq_of_params],
+                  trace=(operation, None))
+
+    def fetchone(self):
+        row = self._run("fetch", self._cursor.fetchone)
+        if row is not None and self._fetching is not None:
+            get_tracer().fetched(self._fetching, 1)
+        return row
+
+    def fetchmany(self, size):
+        rows = self._run("fetch", self._cursor.fetchmany, size)
+        if rows and self._fetching is not None:
+            get_tracer().fetched(self._fetching, len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._run("fetch", self._cursor.fetchall)
+        if rows and self._fetching is not None:
+            get_tracer().fetched(self._fetching, len(rows))
+        return rows
+
+    # Call the driver, timing it and translating its errors; trace is the
+    # (operation, params) of a statement to hand to the query tracer
+    def _run(self, op, fn, *args, trace=None):
+        failed = False
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        except self.backend.driver_errors as e:
+            failed = True
+            get_metrics().counter("scheduler_db_errors_total", op=op).inc()
+            raise DBError(str(e)) from e
+        finally:
+            elapsed = time.perf_counter() - start
+            get_metrics().histogram("scheduler_db_seconds", op=op).observe(elapsed)
+            if trace is not None:
+                # the driver's rowcount is -1 for a statement that returns rows, count them as they are fetched
+                returns_rows = not failed and self._cursor.description is not None
+                self._fetching = trace[0] if returns_rows else None
+                rowcount = None if failed or returns_rows else self._cursor.rowcount
+                get_tracer().record(trace[0], trace[1], elapsed, rowcount, failed)
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        try:
+            self._cursor.close()
+        except self.backend.driver_errors as e:
+            raise DBError(str(e)) from e
+
+
+class Connection:
+    def __init__(self, backend, conn):
+        self.backend = backend
+        self._conn = conn
+
+    def cursor(self, as_dict=False):
+        try:
+            return Cursor(self.backend, self.backend.raw_cursor(self._conn, as_dict))
+        except self.backend.driver_errors as e:
+            raise DBError(str(e)) from e
+
+    def commit(self):
+        try:
+            self._conn.commit()
+        except self.backend.driver_errors as e:
+            raise DBError(str(e)) from e
+
+    def rollback(self):
+        try:
+            self._conn.rollback()
+        except self.backend.driver_errors as e:
+            raise DBError(str(e)) from e
+
+    def close(self):
+        try:
+            self._conn.close()
+        except self.backend.driver_errors as e:
+            raise DBError(str(e)) from e
+
+
+class Backend:
+    """
+    Storage backend interface.
+
+    A backend opens driver connections, adapts the pymssql-style SQL used
+    throughout the scheduler to its driver, and implements the operations whose
+    SQL differs between database engines.
+    """
+
+    name = None
+    # exception classes raised by the driver, translated to DBError by the wrappers
+    driver_errors = ()
+    # DDL creating the table that records applied migrations, see db/Migrator.py
+    schema_version_ddl = None
+    # clause appended after ORDER BY that returns at most as many rows as its %d parameter
+    limit_clause = None
+    # ORDER BY expression giving a random order
+    random_order = None
+    # usernames per statement in existing_users, keeping each well below the driver's parameter limit
+    user_chunk = 500
+
+    def connect(self):
+        try:
+            return Connection(self, self.open())
+        except self.driver_errors as e:
+            raise DBError(str(e)) from e
+
+    def open(self):
+        raise NotImplementedError
+
+    def raw_cursor(self, conn, as_dict):
+        raise NotImplementedError
+
+    def prepare(self, operation):
+        return operation
+
+    def adapt_params(self, params):
+        return params
+
+    # Return the (operation, params) to run for a catalog statement (see db/Queries.py);
+    # a backend can send it as a server-side parameterized statement instead of plain text
+    def parameterize(self, query, params):
+        return query, params
+
+    # Start a transaction on the cursor's connection that also covers DDL
+    def begin(self, cursor):
+        pass
+
+    # Split a migration script into the statements or batches to execute one by one;
+    # batches are separated by lines holding only GO
+    def split_script(self, script):
+        batches = re.split(r"^\s*GO\s*$", script, flags=re.MULTILINE | re.IGNORECASE)
+        return [batch for batch in batches if batch.strip()]
+
+    # Whether statement, from a migration script, is already reflected in the
+    # schema and must be skipped; for statements the engine cannot guard with
+    # IF NOT EXISTS and the like
+    def already_applied(self, cursor, statement):
+        return False
+
+    # Return the query plan of operation as a list of text lines, without running it
+    def explain(self, cursor, operation, params=None):
+        raise NotImplementedError
+
+    def ping(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        cursor.close()
+
+    # Claim the caregiver slot for appointment_date that policy (see
+    # db/AssignmentPolicy.py) ranks first, take one dose of vaccine_name, insert
+    # into Reserve and count the appointment against the caregiver inside the
+    # cursor's transaction without committing. The dose comes from Vaccines, or
+    # from the open lease lease_id when given (see service/DoseAllocator.py).
+    # Given caregiver_name, only that caregiver's slot is claimed.
+    # The cursor must have been opened with as_dict=True.
+    # Returns (status, appointment_id, caregiver_name), status being one of the
+    # ReservationEngine statuses.
+    def reserve(self, cursor, patient_name, vaccine_name, appointment_date, policy, lease_id=None,
+                caregiver_name=None):
+        raise NotImplementedError
+
+    # Insert one Availabilities row per date for username inside the cursor's
+    # transaction, skipping dates that are already there. Returns the number of
+    # rows inserted.
+    def insert_availabilities(self, cursor, username, dates):
+        raise NotImplementedError
+
+    # Insert every (username, salt, hash) of rows into table (Patients or
+    # Caregivers) inside the cursor's transaction, skipping usernames that are
+    # already taken, also by a concurrent insert. Returns the number of rows inserted.
+    def insert_users(self, cursor, table, rows):
+        raise NotImplementedError
+
+    # The usernames that are taken in table (Patients or Caregivers)
+    def existing_users(self, cursor, table, usernames):
+        existing = []
+        for i in range(0, len(usernames), self.user_chunk):
+            chunk = usernames[i:i + self.user_chunk]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(f"SELECT Username FROM {table} WHERE Username IN ({placeholders})", tuple(chunk))
+            existing.extend(row[0] for row in cursor.fetchall())
+        return existing
+
+    # Add doses to Vaccines for every (vaccine_name, doses) of shipment, which
+    # names each vaccine once, inside the cursor's transaction: relative
+    # increments of Doses and TotalAdded, inserting the vaccines that are new.
+    # Returns [(vaccine_name, doses before, doses after)] ordered by name.
+    def add_doses(self, cursor, shipment):
+        raise NotImplementedError
+
+    # Take caregiver_name off every day from date_from to date_to inside the
+    # cursor's transaction: delete their availability, move each of their
+    # appointments on those days to another caregiver free that day, picked in
+    # the order of policy (see db/AssignmentPolicy.py), and cancel the ones left
+    # over, returning their doses to Vaccines or to their open lease. Set-based:
+    # a fixed number of statements whatever the number of appointments.
+    # Returns (availabilities removed, [(appointment_id, new caregiver, date)],
+    # [(appointment_id, patient, date, lease_id if the dose went back to that lease)]).
+    def cancel_caregiver_days(self, cursor, caregiver_name, date_from, date_to, policy):
+        raise NotImplementedError
+
+    # Book up to batch_size of the oldest waitlist requests with a free slot on a
+    # day they accept, not before today, inside the cursor's transaction: each
+    # request chooses the earliest such day, the n-th request choosing a day (by
+    # WaitlistId) gets the n-th free caregiver of that day in the order of
+    # policy, while its vaccine has doses left in stock, and is removed from
+    # Waitlist. Set-based like cancel_caregiver_days. Requests a batch skips stay
+    # queued, so callers repeat until nothing is matched. Returns [(waitlist_id, appointment_id,
+    # patient, vaccine, caregiver, date, requested at)] ordered by waitlist_id.
+    def match_waitlist(self, cursor, today, batch_size, policy):
+        raise NotImplementedError
+
+    # Every free caregiver slot from date_from to date_to as [(date, caregiver)],
+    # ordered by date and then in the order of policy
+    def free_slots(self, cursor, date_from, date_to, policy):
+        order_by, order_params = policy.order_by(self)
+        cursor.execute(f"""
+            SELECT a.Time, a.Username
+            FROM Availabilities a
+            JOIN Caregivers c ON c.Username = a.Username
+            WHERE a.Time >= %s AND a.Time <= %s
+            ORDER BY a.Time, {order_by}
+        """, (date_from, date_to, *order_params))
+        return [tuple(row) for row in cursor.fetchall()]
+
+    # Book a plan of [(waitlist_id, patient, vaccine, caregiver, date)] inside
+    # the cursor's transaction with a fixed number of statements: claim each
+    # slot, take the doses per vaccine, insert into Reserve and remove the
+    # requests from Waitlist. Returns False, leaving the transaction to be
+    # rolled back, when a slot, a dose or a request of the plan is gone.
+    def book_plan(self, cursor, plan):
+        raise NotImplementedError
+
+
+# backend name -> (module, class), imported on first use so that only the
+# selected driver has to be installed
+backends = {
+    "mssql": ("db.MSSQLBackend", "MSSQLBackend"),
+    "sqlite": ("db.SQLiteBackend", "SQLiteBackend"),
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+# Return the process-wide backend selected by the "Backend" environment variable
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = os.getenv("Backend", "mssql").lower()
+                if name not in backends:
+                    raise ValueError(f"Unknown backend {name!r}, expected one of {', '.join(backends)}")
+                module_name, class_name = backends[name]
+                _backend = getattr(importlib.import_module(module_name), class_name)()
+    return _backend
@@ -1,29 +1,97 @@
-import pymssql
-import os
-
-
-class ConnectionManager:
-
-    def __init__(self):
-        self.server_name = os.getenv("Server") + ".database.windows.net"
-        self.db_name = os.getenv("DBName")
-        self.user = os.getenv("UserID")
-        self.password = os.getenv("Password")
-        self.conn = None
-
-    def create_connection(self):
-        try:
-            self.conn = pymssql.connect(server=self.server_name, user=self.user, password=self.password, database=self.db_name)
-        except pymssql.Error as db_err:
-            print("Database Programming Error in SQL connection processing! ")
-            print(db_err)
-            quit()
-        return self.conn
-
-    def close_connection(self):
-        try:
-            self.conn.close()
-        except pymssql.Error as db_err:
-            print("Database Programming Error in SQL connection processing! ")
-            print(db_err)
-            quit()
+import atexit
+import contextlib
+import threading
+import os
+from db.Backend import DBError, get_backend
+from db.ConnectionPool import ConnectionPool, PoolTimeoutError
+from util.Metrics import get_metrics
+
+
+class ConnectionManager:
+    # one pool per process, shared by every ConnectionManager instance
+    _pool = None
+    _pool_lock = threading.Lock()
+    # per thread connection kept checked out by pinned()
+    _pinned = threading.local()
+
+    def __init__(self):
+        self.conn = None
+        self.uses_pinned = False
+
+    # Check out a pooled connection; close_connection() hands it back to the pool
+    def create_connection(self):
+        pinned = getattr(ConnectionManager._pinned, "conn", None)
+        if pinned is not None and not ConnectionManager._pinned.in_use:
+            ConnectionManager._pinned.in_use = True
+            self.uses_pinned = True
+            self.conn = pinned
+            return self.conn
+        try:
+            with get_metrics().timer("scheduler_connection_acquire_seconds"):
+                self.conn = ConnectionManager.get_pool().checkout()
+        except PoolTimeoutError:
+            # every pooled connection stayed checked out for the whole checkout timeout
+            print("Server busy: no database connection became free, please try again later.")
+            quit()
+        except DBError as db_err:
+            print("Database Programming Error in SQL connection processing! ")
+            print(db_err)
+            quit()
+        return self.conn
+
+    def close_connection(self):
+        # safe to call more than once, the connection is only returned the first time
+        if self.conn is None:
+            return
+        conn = self.conn
+        self.conn = None
+        try:
+            if self.uses_pinned:
+                # the connection stays with the thread, like the pool drop any unfinished transaction
+                self.uses_pinned = False
+                ConnectionManager._pinned.in_use = False
+                conn.rollback()
+                return
+            ConnectionManager.get_pool().checkin(conn)
+        except DBError as db_err:
+            print("Database Programming Error in SQL connection processing! ")
+            print(db_err)
+            quit()
+
+    # Within the block every ConnectionManager of this thread reuses one connection,
+    # unless it is already in use by another ConnectionManager further up the stack
+    @classmethod
+    @contextlib.contextmanager
+    def pinned(cls):
+        if getattr(cls._pinned, "conn", None) is not None:
+            yield
+            return
+        conn = cls.get_pool().checkout()
+        cls._pinned.conn = conn
+        cls._pinned.in_use = False
+        try:
+            yield
+        finally:
+            cls._pinned.conn = None
+            cls.get_pool().checkin(conn)
+
+    @classmethod
+    def get_pool(cls):
+        if cls._pool is None:
+            with cls._pool_lock:
+                if cls._pool is None:
+                    backend = get_backend()
+                    pool = ConnectionPool(
+                        backend.connect,
+                        ping=backend.ping,
+                        max_size=int(os.getenv("PoolMaxSize", "10")),
+                        idle_timeout=float(os.getenv("PoolIdleTimeout", "300")),
+                        checkout_timeout=float(os.getenv("PoolCheckoutTimeout", "30")),
+                    )
+                    atexit.register(pool.close_all)
+                    cls._pool = pool
+        return cls._pool
+
+    @classmethod
+    def pool_stats(cls):
+        return cls.get_pool().stats()
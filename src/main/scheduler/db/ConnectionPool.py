@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Bounded pool of reusable DB-API connections.
+
+    Connections are handed out with checkout() and given back with checkin().
+    Idle connections are reused most-recently-used first, evicted once they
+    have been idle for longer than idle_timeout, and pinged before reuse if
+    they have been idle for longer than ping_after.
+    """
+
+    def __init__(self, factory, ping=None, max_size=10, idle_timeout=300.0,
+                 ping_after=5.0, checkout_timeout=30.0):
+        self.factory = factory
+        self.ping = ping
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self.checkout_timeout = checkout_timeout
+
+        # idle connections as (conn, last_used) pairs, most recently used last
+        self._idle = deque()
+        # number of open connections, idle or checked out
+        self._size = 0
+        self._cond = threading.Condition()
+
+        # stats
+        self.hits = 0
+        self.waits = 0
+        self.creates = 0
+        self.evictions = 0
+        self.discards = 0
+
+    def checkout(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            conn = None
+            create = False
+            with self._cond:
+                stale = self._take_stale()
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                elif self._size < self.max_size:
+                    # reserve the slot now, open the connection outside the lock
+                    self._size += 1
+                    create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError("Timed out waiting for a database connection")
+                    self.waits += 1
+                    self._cond.wait(remaining)
+            self._close_all(stale)
+
+            if create:
+                return self._create()
+            if conn is None:
+                continue
+            if time.monotonic() - last_used < self.ping_after or self._is_alive(conn):
+                with self._cond:
+                    self.hits += 1
+                return conn
+            self._discard(conn)
+
+    def checkin(self, conn, broken=False):
+        if not broken:
+            try:
+                # never hand out a connection with a half-finished transaction
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        self._close_all(idle)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "waits": self.waits,
+                "creates": self.creates,
+                "evictions": self.evictions,
+                "discards": self.discards,
+            }
+
+    def _create(self):
+        try:
+            conn = self.factory()
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.creates += 1
+        return conn
+
+    def _is_alive(self, conn):
+        if self.ping is None:
+            return True
+        try:
+            self.ping(conn)
+            return True
+        except Exception:
+            return False
+
+    def _take_stale(self):
+        # called with the lock held; the oldest idle connections sit at the left
+        stale = []
+        cutoff = time.monotonic() - self.idle_timeout
+        while self._idle and self._idle[0][1] < cutoff:
+            stale.append(self._idle.popleft()[0])
+        self._size -= len(stale)
+        self.evictions += len(stale)
+        if stale:
+            self._cond.notify_all()
+        return stale
+
+    def _discard(self, conn):
+        with self._cond:
+            self._size -= 1
+            self.discards += 1
+            self._cond.notify()
+        self._close_all([conn])
+
+    @staticmethod
+    def _close_all(conns):
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
@@ -0,0 +1,451 @@
+import datetime
+import pymssql
+import os
+import re
+from db.Backend import Backend
+from db.Queries import Queries
+
+
+class MSSQLBackend(Backend):
+    name = "mssql"
+    driver_errors = (pymssql.Error,)
+
+    reserve_batch = """
+        SET NOCOUNT ON;
+        DECLARE @caregiver VARCHAR(255) = NULL;
+        DECLARE @status VARCHAR(16) = 'ok';
+        DECLARE @appointment TABLE (appointment_id INT);
+
+        SELECT TOP (1) @caregiver = a.Username
+        FROM Availabilities a WITH (UPDLOCK, READPAST, ROWLOCK)
+        JOIN Caregivers c ON c.Username = a.Username
+        WHERE a.Time = %s {only}
+        ORDER BY {order_by};
+
+        IF @caregiver IS NULL
+            SET @status = 'no_caregiver';
+        ELSE
+        BEGIN
+            {take_dose}
+
+            IF @status = 'ok'
+            BEGIN
+                DELETE FROM Availabilities WHERE Time = %s AND Username = @caregiver;
+
+                INSERT INTO Reserve (vaccine_name, appointment_date, patient_name, caregiver_name, lease_id)
+                OUTPUT inserted.appointment_id INTO @appointment
+                VALUES (%s, %s, %s, @caregiver, %s);
+
+                UPDATE Caregivers SET Appointments = Appointments + 1 WHERE Username = @caregiver;
+            END
+        END
+
+        SELECT @status AS status,
+               (SELECT appointment_id FROM @appointment) AS appointment_id,
+               @caregiver AS caregiver_name;
+    """
+
+    cancel_days_batch = """
+        SET NOCOUNT ON;
+        DECLARE @caregiver VARCHAR(255) = %s, @from DATE = %s, @to DATE = %s;
+        DECLARE @moves TABLE (appointment_id INT PRIMARY KEY, caregiver_name VARCHAR(255), Time DATE);
+        DECLARE @canceled TABLE (appointment_id INT PRIMARY KEY, patient_name VARCHAR(255),
+                                 appointment_date DATE, vaccine_name VARCHAR(255), lease_id VARCHAR(32));
+
+        DELETE FROM Availabilities WHERE Username = @caregiver AND Time BETWEEN @from AND @to;
+        DECLARE @removed INT = @@ROWCOUNT;
+
+        WITH appointments AS (
+            SELECT appointment_id, appointment_date,
+                   ROW_NUMBER() OVER (PARTITION BY appointment_date ORDER BY appointment_id) AS n
+            FROM Reserve WITH (UPDLOCK)
+            WHERE caregiver_name = @caregiver AND appointment_date BETWEEN @from AND @to
+        ), slots AS (
+            SELECT a.Time, a.Username,
+                   ROW_NUMBER() OVER (PARTITION BY a.Time ORDER BY {order_by}) AS n
+            FROM Availabilities a WITH (UPDLOCK, READPAST, ROWLOCK)
+            JOIN Caregivers c ON c.Username = a.Username
+            WHERE a.Time BETWEEN @from AND @to
+              AND a.Time IN (SELECT appointment_date FROM appointments)
+        )
+        INSERT INTO @moves (appointment_id, caregiver_name, Time)
+        SELECT p.appointment_id, s.Username, s.Time
+        FROM appointments p
+        JOIN slots s ON s.Time = p.appointment_date AND s.n = p.n;
+
+        UPDATE r SET caregiver_name = m.caregiver_name
+        FROM Reserve r JOIN @moves m ON m.appointment_id = r.appointment_id;
+
+        DELETE a FROM Availabilities a JOIN @moves m ON m.Time = a.Time AND m.caregiver_name = a.Username;
+
+        UPDATE c SET Appointments = c.Appointments + m.n
+        FROM Caregivers c
+        JOIN (SELECT caregiver_name, COUNT(*) AS n FROM @moves GROUP BY caregiver_name) m
+          ON m.caregiver_name = c.Username;
+
+        -- what could not be moved is canceled; a dose whose lease is still open goes back to the lease
+        UPDATE l SET ExpiresAt = l.ExpiresAt
+        FROM DoseLeases l
+        JOIN Reserve r ON r.lease_id = l.LeaseId
+        WHERE r.caregiver_name = @caregiver AND r.appointment_date BETWEEN @from AND @to;
+
+        INSERT INTO @canceled (appointment_id, patient_name, appointment_date, vaccine_name, lease_id)
+        SELECT r.appointment_id, r.patient_name, r.appointment_date, r.vaccine_name, l.LeaseId
+        FROM Reserve r
+        LEFT JOIN DoseLeases l ON l.LeaseId = r.lease_id
+        WHERE r.caregiver_name = @caregiver AND r.appointment_date BETWEEN @from AND @to;
+
+        UPDATE v SET Doses = v.Doses + d.n
+        FROM Vaccines v
+        JOIN (SELECT vaccine_name, COUNT(*) AS n FROM @canceled WHERE lease_id IS NULL GROUP BY vaccine_name) d
+          ON d.vaccine_name = v.Name;
+
+        DELETE r FROM Reserve r JOIN @canceled x ON x.appointment_id = r.appointment_id;
+
+        UPDATE Caregivers
+        SET Appointments = Appointments - (SELECT COUNT(*) FROM @moves) - (SELECT COUNT(*) FROM @canceled)
+        WHERE Username = @caregiver;
+
+        SELECT 'removed', NULL, NULL, NULL, NULL, @removed
+        UNION ALL
+        SELECT 'moved', appointment_id, caregiver_name, Time, NULL, NULL FROM @moves
+        UNION ALL
+        SELECT 'canceled', appointment_id, patient_name, appointment_date, lease_id, NULL FROM @canceled;
+    """
+
+    match_waitlist_batch = """
+        SET NOCOUNT ON;
+        DECLARE @today DATE = %s, @batch INT = %s;
+        DECLARE @chosen TABLE (WaitlistId INT PRIMARY KEY, patient_name VARCHAR(255), vaccine_name VARCHAR(255),
+                               Time DATE, RequestedAt DATETIME2, n INT);
+        DECLARE @matches TABLE (WaitlistId INT PRIMARY KEY, patient_name VARCHAR(255), vaccine_name VARCHAR(255),
+                                Time DATE, RequestedAt DATETIME2, caregiver_name VARCHAR(255));
+        DECLARE @booked TABLE (appointment_id INT, caregiver_name VARCHAR(255), appointment_date DATE);
+
+        -- the batch and the earliest day with a free slot each request accepts, skipping slots
+        -- locked by concurrent bookings like the slots read below
+        INSERT INTO @chosen (WaitlistId, patient_name, vaccine_name, Time, RequestedAt)
+        SELECT TOP (@batch) w.WaitlistId, w.patient_name, w.vaccine_name, f.Time, w.RequestedAt
+        FROM Waitlist w WITH (UPDLOCK, READPAST, ROWLOCK)
+        CROSS APPLY (
+            SELECT MIN(a.Time) AS Time FROM Availabilities a WITH (READPAST)
+            WHERE a.Time >= @today AND {accepts}
+        ) f
+        WHERE f.Time IS NOT NULL
+          AND COALESCE(w.LatestTime, w.Time) >= @today
+          AND EXISTS (SELECT 1 FROM Vaccines v WHERE v.Name = w.vaccine_name AND v.Doses > 0)
+        ORDER BY w.WaitlistId;
+
+        -- n-th request of its day among those its vaccine has doses for
+        WITH dosed AS (
+            SELECT c.WaitlistId, ROW_NUMBER() OVER (PARTITION BY c.Time ORDER BY c.WaitlistId) AS n
+            FROM (
+                SELECT WaitlistId, vaccine_name, Time,
+                       ROW_NUMBER() OVER (PARTITION BY vaccine_name ORDER BY WaitlistId) AS k
+                FROM @chosen
+            ) c
+            JOIN Vaccines v WITH (UPDLOCK, ROWLOCK) ON v.Name = c.vaccine_name
+            WHERE c.k <= v.Doses
+        )
+        UPDATE c SET n = d.n FROM @chosen c JOIN dosed d ON d.WaitlistId = c.WaitlistId;
+
+        WITH slots AS (
+            SELECT a.Time, a.Username,
+                   ROW_NUMBER() OVER (PARTITION BY a.Time ORDER BY {order_by}) AS n
+            FROM Availabilities a WITH (UPDLOCK, READPAST, ROWLOCK)
+            JOIN Caregivers c ON c.Username = a.Username
+            WHERE a.Time IN (SELECT Time FROM @chosen WHERE n IS NOT NULL)
+        )
+        INSERT INTO @matches (WaitlistId, patient_name, vaccine_name, Time, RequestedAt, caregiver_name)
+        SELECT c.WaitlistId, c.patient_name, c.vaccine_name, c.Time, c.RequestedAt, s.Username
+        FROM @chosen c
+        JOIN slots s ON s.Time = c.Time AND s.n = c.n;
+
+        DELETE a FROM Availabilities a JOIN @matches m ON m.Time = a.Time AND m.caregiver_name = a.Username;
+
+        UPDATE v SET Doses = v.Doses - m.n
+        FROM Vaccines v
+        JOIN (SELECT vaccine_name, COUNT(*) AS n FROM @matches GROUP BY vaccine_name) m
+          ON m.vaccine_name = v.Name;
+
+        INSERT INTO Reserve (vaccine_name, appointment_date, patient_name, caregiver_name)
+        OUTPUT INSERTED.appointment_id, INSERTED.caregiver_name, INSERTED.appointment_date
+        INTO @booked
+        SELECT vaccine_name, Time, patient_name, caregiver_name FROM @matches;
+
+        UPDATE c SET Appointments = c.Appointments + m.n
+        FROM Caregivers c
+        JOIN (SELECT caregiver_name, COUNT(*) AS n FROM @matches GROUP BY caregiver_name) m
+          ON m.caregiver_name = c.Username;
+
+        DELETE w FROM Waitlist w JOIN @matches m ON m.WaitlistId = w.WaitlistId;
+
+        -- every slot is claimed once, so its caregiver and day identify the request
+        SELECT m.WaitlistId, b.appointment_id, m.patient_name, m.vaccine_name, m.caregiver_name, m.Time,
+               m.RequestedAt
+        FROM @matches m
+        JOIN @booked b ON b.caregiver_name = m.caregiver_name AND b.appointment_date = m.Time
+        ORDER BY m.WaitlistId;
+    """
+
+    book_plan_batch = """
+        SET NOCOUNT ON;
+        DECLARE @n INT = (SELECT COUNT(*) FROM #Plan);
+
+        DELETE a FROM Availabilities a WITH (ROWLOCK)
+        JOIN #Plan p ON p.Time = a.Time AND p.caregiver_name = a.Username;
+        IF @@ROWCOUNT <> @n BEGIN SELECT CAST(0 AS BIT); RETURN; END
+
+        UPDATE v SET Doses = v.Doses - m.n
+        FROM Vaccines v WITH (ROWLOCK)
+        JOIN (SELECT vaccine_name, COUNT(*) AS n FROM #Plan GROUP BY vaccine_name) m ON m.vaccine_name = v.Name
+        WHERE v.Doses >= m.n;
+        IF @@ROWCOUNT <> (SELECT COUNT(DISTINCT vaccine_name) FROM #Plan) BEGIN SELECT CAST(0 AS BIT); RETURN; END
+
+        DELETE w FROM Waitlist w WITH (ROWLOCK) JOIN #Plan p ON p.WaitlistId = w.WaitlistId;
+        IF @@ROWCOUNT <> @n BEGIN SELECT CAST(0 AS BIT); RETURN; END
+
+        INSERT INTO Reserve (vaccine_name, appointment_date, patient_name, caregiver_name)
+        SELECT vaccine_name, Time, patient_name, caregiver_name FROM #Plan ORDER BY WaitlistId;
+
+        UPDATE c SET Appointments = c.Appointments + m.n
+        FROM Caregivers c
+        JOIN (SELECT caregiver_name, COUNT(*) AS n FROM #Plan GROUP BY caregiver_name) m
+          ON m.caregiver_name = c.Username;
+
+        SELECT CAST(1 AS BIT);
+    """
+
+    # {take_dose} of reserve_batch without a lease: take the dose from stock
+    take_from_stock = """
+            UPDATE Vaccines WITH (ROWLOCK)
+            SET Doses = Doses - 1
+            WHERE Name = %s AND Doses > 0;
+
+            IF @@ROWCOUNT = 0
+                SET @status = 'no_doses';
+    """
+
+    # {take_dose} of reserve_batch with a lease: the shared lock on the lease row
+    # keeps close_lease from counting its bookings until this one commits
+    take_from_lease = """
+            IF NOT EXISTS (SELECT 1 FROM DoseLeases WITH (REPEATABLEREAD, ROWLOCK) WHERE LeaseId = %s)
+                SET @status = 'lease_lost';
+    """
+
+    schema_version_ddl = """
+        IF OBJECT_ID('SchemaVersion') IS NULL
+        CREATE TABLE SchemaVersion (
+            Version INT PRIMARY KEY,
+            Name VARCHAR(255),
+            AppliedAt DATETIME2 DEFAULT SYSUTCDATETIME()
+        )
+    """
+
+    limit_clause = "OFFSET 0 ROWS FETCH NEXT %d ROWS ONLY"
+    random_order = "NEWID()"
+
+    # rows per INSERT, keeping each statement well below the 2100 parameter limit
+    availability_chunk = 500
+
+    # users per INSERT in insert_users, three parameters each
+    user_chunk = 500
+
+    # vaccines per MERGE in add_doses, keeping each statement well below the 2100 parameter limit
+    shipment_chunk = 1000
+
+    # plan rows per INSERT in book_plan, five parameters each
+    plan_chunk = 400
+
+    placeholder = re.compile(r"%([sd%])")
+
+    def __init__(self):
+        self.server_name = os.getenv("Server") + ".database.windows.net"
+        self.db_name = os.getenv("DBName")
+        self.user = os.getenv("UserID")
+        self.password = os.getenv("Password")
+        self.parameterized = os.getenv("PreparedStatements", "1") != "0"
+        # (query, parameter types) -> sp_executesql batch
+        self._parameterized = {}
+
+    def open(self):
+        return pymssql.connect(server=self.server_name, user=self.user, password=self.password, database=self.db_name)
+
+    def raw_cursor(self, conn, as_dict):
+        return conn.cursor(as_dict=as_dict)
+
+    # pymssql interpolates parameters into the text on the client, so every call
+    # would be a new ad-hoc statement to the server. Catalog statements go through
+    # sp_executesql instead: the statement text and its parameter declarations
+    # stay the same across calls and the server caches one plan for them.
+    def parameterize(self, query, params):
+        if not self.parameterized or params is None:
+            return query, params
+        values = tuple(params) if isinstance(params, (tuple, list)) else (params,)
+        types = tuple(sql_type(value) for value in values)
+        batch = self._parameterized.get((query, types))
+        if batch is None:
+            numbers = iter(range(1, len(values) + 1))
+            body = self.placeholder.sub(lambda m: "%%" if m.group(1) == "%" else f"@p{next(numbers)}", query)
+            declarations = ", ".join(f"@p{i} {t}" for i, t in enumerate(types, 1))
+            arguments = ", ".join(f"@p{i} = %s" for i in range(1, len(values) + 1))
+            body = body.replace("'", "''")
+            batch = f"EXEC sp_executesql N'{body}', N'{declarations}', {arguments}"
+            self._parameterized[(query, types)] = batch
+        return batch, values
+
+    def explain(self, cursor, operation, params=None):
+        cursor.execute("SET SHOWPLAN_TEXT ON")
+        try:
+            cursor.execute(operation, params)
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.execute("SET SHOWPLAN_TEXT OFF")
+
+    # One batch: the slot is claimed with UPDLOCK/READPAST so concurrent bookings
+    # skip rows another session has already claimed instead of double-booking them,
+    # Doses is only decremented while positive, and the new id comes back through OUTPUT.
+    def reserve(self, cursor, patient_name, vaccine_name, appointment_date, policy, lease_id=None,
+                caregiver_name=None):
+        order_by, order_params = policy.order_by(self)
+        only, only_params = ("AND a.Username = %s", (caregiver_name,)) if caregiver_name else ("", ())
+        take_dose = self.take_from_stock if lease_id is None else self.take_from_lease
+        params = (appointment_date, *only_params, *order_params, vaccine_name if lease_id is None else lease_id,
+                  appointment_date, vaccine_name, appointment_date, patient_name, lease_id)
+        cursor.execute(self.reserve_batch.format(only=only, order_by=order_by, take_dose=take_dose), params)
+        row = cursor.fetchone()
+        return row['status'], row['appointment_id'], row['caregiver_name']
+
+
+    # Multi-row VALUES inserts of up to availability_chunk rows; NOT EXISTS under
+    # UPDLOCK/HOLDLOCK skips the dates already present as a set.
+    def insert_availabilities(self, cursor, username, dates):
+        inserted = 0
+        for i in range(0, len(dates), self.availability_chunk):
+            chunk = dates[i:i + self.availability_chunk]
+            values = ", ".join(["(%s, %s)"] * len(chunk))
+            params = []
+            for d in chunk:
+                params.extend((d, username))
+            cursor.execute(f"""
+                INSERT INTO Availabilities (Time, Username)
+                SELECT v.Time, v.Username
+                FROM (VALUES {values}) AS v(Time, Username)
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM Availabilities a WITH (UPDLOCK, HOLDLOCK)
+                    WHERE a.Time = v.Time AND a.Username = v.Username
+                )
+                -- a day the caregiver already has an appointment on is not free again
+                AND NOT EXISTS (
+                    SELECT 1 FROM Reserve r WITH (UPDLOCK, HOLDLOCK)
+                    WHERE r.caregiver_name = v.Username AND r.appointment_date = v.Time
+                )
+            """, tuple(params))
+            inserted += cursor.rowcount
+        return inserted
+
+    def insert_users(self, cursor, table, rows):
+        inserted = 0
+        for i in range(0, len(rows), self.user_chunk):
+            chunk = rows[i:i + self.user_chunk]
+            values = ", ".join(["(%s, %s, %s)"] * len(chunk))
+            cursor.execute(f"""
+                INSERT INTO {table} (Username, Salt, Hash)
+                SELECT v.Username, v.Salt, v.Hash
+                FROM (VALUES {values}) AS v(Username, Salt, Hash)
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {table} u WITH (UPDLOCK, HOLDLOCK)
+                    WHERE u.Username = v.Username
+                )
+            """, tuple(value for row in chunk for value in row))
+            inserted += cursor.rowcount
+        return inserted
+
+    # One MERGE per chunk under HOLDLOCK, so a vaccine that two shipments add at
+    # the same time is inserted once and incremented by the other; OUTPUT returns
+    # the doses before and after each row changed.
+    def add_doses(self, cursor, shipment):
+        changed = []
+        for i in range(0, len(shipment), self.shipment_chunk):
+            chunk = shipment[i:i + self.shipment_chunk]
+            params = []
+            for vaccine_name, doses in chunk:
+                params.extend((vaccine_name, doses))
+            cursor.execute(f"""
+                MERGE Vaccines WITH (HOLDLOCK) AS v
+                USING (VALUES {", ".join(["(%s, %d)"] * len(chunk))}) AS s(Name, Doses)
+                ON v.Name = s.Name
+                WHEN MATCHED THEN
+                    UPDATE SET Doses = v.Doses + s.Doses, TotalAdded = v.TotalAdded + s.Doses
+                WHEN NOT MATCHED THEN
+                    INSERT (Name, Doses, TotalAdded) VALUES (s.Name, s.Doses, s.Doses)
+                OUTPUT inserted.Name, ISNULL(deleted.Doses, 0), inserted.Doses;
+            """, tuple(params))
+            changed.extend(tuple(row) for row in cursor.fetchall())
+        return sorted(changed)
+
+    # One batch: the n-th appointment of a day (by id) goes to the n-th free
+    # caregiver of that day in policy order. The slots are claimed with
+    # UPDLOCK/READPAST like reserve_batch, and open leases of the canceled
+    # bookings are locked before their doses are counted, like cancel.
+    def cancel_caregiver_days(self, cursor, caregiver_name, date_from, date_to, policy):
+        order_by, order_params = policy.order_by(self)
+        cursor.execute(self.cancel_days_batch.format(order_by=order_by),
+                       (caregiver_name, date_from, date_to, *order_params))
+        removed, moved, canceled = 0, [], []
+        for kind, appointment_id, name, date, lease_id, count in cursor.fetchall():
+            if kind == "removed":
+                removed = count
+            elif kind == "moved":
+                moved.append((appointment_id, name, date))
+            else:
+                canceled.append((appointment_id, name, date, lease_id))
+        return removed, moved, canceled
+
+    # One batch, locking like reserve_batch: waitlist rows and slots another
+    # matcher or booking holds are skipped, and the vaccine rows are locked
+    # before their doses are compared.
+    def match_waitlist(self, cursor, today, batch_size, policy):
+        order_by, order_params = policy.order_by(self)
+        accepts = Queries.waitlist_accepts.format(w="w", first="a.Time", last="a.Time")
+        cursor.execute(self.match_waitlist_batch.format(order_by=order_by, accepts=accepts),
+                       (today, batch_size, *order_params))
+        return [tuple(row) for row in cursor.fetchall()]
+
+    # The plan is loaded into a session temporary table with multi-row inserts,
+    # then booked in one batch that stops at the first row count that does not match.
+    def book_plan(self, cursor, plan):
+        cursor.execute("""
+            IF OBJECT_ID('tempdb..#Plan') IS NOT NULL DROP TABLE #Plan;
+            CREATE TABLE #Plan (
+                WaitlistId INT PRIMARY KEY,
+                patient_name VARCHAR(255),
+                vaccine_name VARCHAR(255),
+                caregiver_name VARCHAR(255),
+                Time DATE
+            );
+        """)
+        for i in range(0, len(plan), self.plan_chunk):
+            chunk = plan[i:i + self.plan_chunk]
+            cursor.execute(f"INSERT INTO #Plan VALUES {', '.join(['(%d, %s, %s, %s, %s)'] * len(chunk))}",
+                           tuple(value for row in chunk for value in row))
+        cursor.execute(self.book_plan_batch)
+        return bool(cursor.fetchone()[0])
+
+
+# The sp_executesql parameter type for a Python value; the same type for every
+# value of a kind, so calls share a plan
+def sql_type(value):
+    if isinstance(value, bool):
+        return "BIT"
+    if isinstance(value, int):
+        return "INT" if -2 ** 31 <= value < 2 ** 31 else "BIGINT"
+    if isinstance(value, float):
+        return "FLOAT"
+    if isinstance(value, (bytes, bytearray)):
+        return "VARBINARY(MAX)"
+    if isinstance(value, datetime.datetime):
+        return "DATETIME2"
+    if isinstance(value, datetime.date):
+        return "DATE"
+    return "VARCHAR(8000)"
@@ -0,0 +1,93 @@
+import argparse
+import os
+import re
+from db.Backend import get_backend
+from db.ConnectionManager import ConnectionManager
+
+
+migrations_path = os.path.join(os.path.dirname(__file__), "..", "..", "resources", "migrations")
+
+
+class Migrator:
+    """
+    Versioned schema migrations.
+
+    Migrations are the files resources/migrations/<backend>/NNNN_<name>.sql,
+    applied in version order. Each one runs in its own transaction together with
+    the SchemaVersion row recording it, so a failed migration leaves no trace
+    and is retried on the next run. Migrations are written to be idempotent so
+    databases that predate this table can be adopted by simply migrating them;
+    statements the engine cannot guard itself, such as SQLite's ADD COLUMN,
+    are skipped when the backend finds them applied (Backend.already_applied).
+    """
+
+    file_name = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+    def __init__(self, backend=None):
+        self.backend = backend or get_backend()
+        self.directory = os.path.join(migrations_path, self.backend.name)
+
+    # All known migrations as (version, name, path), sorted by version
+    def migrations(self):
+        found = []
+        for file in os.listdir(self.directory):
+            match = self.file_name.match(file)
+            if match:
+                found.append((int(match.group(1)), match.group(2), os.path.join(self.directory, file)))
+        return sorted(found)
+
+    def applied_versions(self, conn):
+        cursor = conn.cursor()
+        cursor.execute(self.backend.schema_version_ddl)
+        conn.commit()
+        cursor.execute("SELECT Version FROM SchemaVersion")
+        return {row[0] for row in cursor.fetchall()}
+
+    def pending(self, conn, target=None):
+        applied = self.applied_versions(conn)
+        return [m for m in self.migrations()
+                if m[0] not in applied and (target is None or m[0] <= target)]
+
+    # Apply the pending migrations up to target (all when None); returns the versions applied
+    def migrate(self, conn, target=None):
+        done = []
+        for version, name, path in self.pending(conn, target):
+            with open(path) as f:
+                script = f.read()
+            cursor = conn.cursor()
+            try:
+                self.backend.begin(cursor)
+                for statement in self.backend.split_script(script):
+                    if not self.backend.already_applied(cursor, statement):
+                        cursor.execute(statement)
+                cursor.execute("INSERT INTO SchemaVersion (Version, Name) VALUES (%d, %s)", (version, name))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            done.append(version)
+        return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument("--target", type=int, help="stop after this version")
+    parser.add_argument("--status", action="store_true", help="only list pending migrations")
+    args = parser.parse_args()
+
+    migrator = Migrator()
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    try:
+        if args.status:
+            for version, name, _ in migrator.pending(conn, args.target):
+                print(f"pending {version:04d} {name}")
+            return
+        for version in migrator.migrate(conn, args.target):
+            print(f"applied {version:04d}")
+    finally:
+        cm.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+class Query(str):
+    """
+    A catalog statement: SQL text with pymssql placeholders that db.Backend.Cursor
+    accepts wherever it accepts a string. The name is the attribute it is
+    assigned to in Queries and is what the query tracer reports it under.
+
+    The text is canonical (whitespace collapsed) so every call sends the same
+    statement and the server keeps one plan for it. {limit_clause} in the text
+    is replaced with the backend's limit_clause by for_backend().
+    """
+
+    def __new__(cls, sql, name=None):
+        query = super().__new__(cls, " ".join(sql.split()))
+        query.name = name
+        query._by_backend = {}
+        return query
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    # This statement with the backend-specific parts filled in
+    def for_backend(self, backend):
+        if "{" not in self:
+            return self
+        query = self._by_backend.get(backend.name)
+        if query is None:
+            query = self._by_backend[backend.name] = Query(self.format(limit_clause=backend.limit_clause), self.name)
+        return query
+
+
+class Queries:
+    """
+    Every statement Scheduler.py, the models and the services run. Statements
+    whose text depends on the backend or the assignment policy, or that take a
+    variable number of rows, live in the backends (see Backend.reserve,
+    Backend.insert_availabilities and Backend.existing_users).
+    """
+
+    # users
+    patient_exists = Query("SELECT 1 FROM Patients WHERE Username = %s")
+    patient_credentials = Query("SELECT Salt, Hash FROM Patients WHERE Username = %s")
+    patient_insert = Query("INSERT INTO Patients (Username, Salt, Hash) VALUES (%s, %s, %s)")
+    patient_rehash = Query("UPDATE Patients SET Salt = %s, Hash = %s WHERE Username = %s AND Hash = %s")
+    caregiver_exists = Query("SELECT 1 FROM Caregivers WHERE Username = %s")
+    caregiver_credentials = Query("SELECT Salt, Hash FROM Caregivers WHERE Username = %s")
+    caregiver_insert = Query("INSERT INTO Caregivers (Username, Salt, Hash) VALUES (%s, %s, %s)")
+    caregiver_rehash = Query("UPDATE Caregivers SET Salt = %s, Hash = %s WHERE Username = %s AND Hash = %s")
+
+    # availability
+    caregivers_available_on = Query("SELECT Username FROM Availabilities WHERE Time = %s ORDER BY Username")
+    available_per_day = Query("""
+        SELECT Time, COUNT(*)
+        FROM Availabilities
+        WHERE Time >= %s AND Time <= %s
+        GROUP BY Time
+        ORDER BY Time
+    """)
+    available_in_range = Query("""
+        SELECT Time, Username
+        FROM Availabilities
+        WHERE Time >= %s AND Time <= %s
+        ORDER BY Time, Username
+    """)
+    caregiver_available_dates = Query(
+        "SELECT Time FROM Availabilities WHERE Username = %s AND Time >= %s AND Time <= %s")
+    availability_restore = Query("INSERT INTO Availabilities (Time, Username) VALUES (%s, %s)")
+    # every free slot with its caregiver's appointment count, for service/AvailabilityIndex.py
+    availability_with_loads = Query("""
+        SELECT a.Time, a.Username, c.Appointments
+        FROM Availabilities a
+        JOIN Caregivers c ON c.Username = a.Username
+    """)
+
+    # vaccines
+    vaccine_get = Query("SELECT Name, Doses FROM Vaccines WHERE Name = %s")
+    vaccine_insert = Query("INSERT INTO Vaccines (Name, Doses, TotalAdded) VALUES (%s, %d, %d)")
+    # relative updates: bookings and dose leases change Doses concurrently
+    vaccine_add_doses = Query("UPDATE Vaccines SET Doses = Doses + %d, TotalAdded = TotalAdded + %d WHERE Name = %s")
+    vaccine_remove_doses = Query("""
+        UPDATE Vaccines SET Doses = Doses - %d, TotalAdded = TotalAdded - %d
+        WHERE Name = %s AND Doses >= %d
+    """)
+    vaccine_return_dose = Query("UPDATE Vaccines SET Doses = Doses + 1 WHERE Name = %s")
+    # doses in stock plus those still unused in dose leases, for service/InventoryCache.py
+    vaccine_inventory = Query("""
+        SELECT v.Name,
+               v.Doses
+                 + COALESCE((SELECT SUM(l.Granted) FROM DoseLeases l WHERE l.Vaccine = v.Name), 0)
+                 - (SELECT COUNT(*) FROM Reserve r JOIN DoseLeases l ON l.LeaseId = r.lease_id
+                    WHERE l.Vaccine = v.Name)
+        FROM Vaccines v
+        ORDER BY v.Name
+    """)
+
+    # dose leases, see service/DoseAllocator.py
+    dose_lease_take = Query("UPDATE Vaccines SET Doses = Doses - %d WHERE Name = %s AND Doses >= %d")
+    dose_lease_insert = Query("""
+        INSERT INTO DoseLeases (LeaseId, Instance, Vaccine, Granted, ExpiresAt)
+        VALUES (%s, %s, %s, %d, %s)
+    """)
+    dose_leases_expired = Query("SELECT LeaseId FROM DoseLeases WHERE ExpiresAt < %s")
+    dose_leases_expired_of_vaccine = Query("SELECT LeaseId FROM DoseLeases WHERE Vaccine = %s AND ExpiresAt < %s")
+    dose_lease_get = Query("SELECT Vaccine, Granted FROM DoseLeases WHERE LeaseId = %s")
+    dose_lease_delete = Query("DELETE FROM DoseLeases WHERE LeaseId = %s")
+    dose_lease_bookings = Query("SELECT COUNT(*) FROM Reserve WHERE lease_id = %s")
+    dose_lease_return = Query("UPDATE Vaccines SET Doses = Doses + %d WHERE Name = %s")
+    # Doses + leased + reserved = TotalAdded for every vaccine
+    dose_reconcile = Query("""
+        SELECT v.Name, v.TotalAdded, v.Doses,
+               COALESCE((SELECT SUM(l.Granted) FROM DoseLeases l WHERE l.Vaccine = v.Name), 0)
+                 - (SELECT COUNT(*) FROM Reserve r JOIN DoseLeases l ON l.LeaseId = r.lease_id
+                    WHERE l.Vaccine = v.Name),
+               (SELECT COUNT(*) FROM Reserve r WHERE r.vaccine_name = v.Name)
+        FROM Vaccines v
+        ORDER BY v.Name
+    """)
+
+    # appointments
+    appointment_of_patient = Query("""
+        SELECT vaccine_name, appointment_date, caregiver_name, lease_id
+        FROM Reserve
+        WHERE appointment_id = %d AND patient_name = %s
+    """)
+    appointment_delete = Query("DELETE FROM Reserve WHERE appointment_id = %d")
+    caregiver_appointment_removed = Query(
+        "UPDATE Caregivers SET Appointments = Appointments - 1 WHERE Username = %s")
+    # keeps an open lease from being closed until the canceling transaction commits
+    dose_lease_touch = Query("UPDATE DoseLeases SET ExpiresAt = ExpiresAt WHERE LeaseId = %s")
+    # pages of a user's appointments: (username, after id, from date, to date, limit)
+    patient_appointments = Query("""
+        SELECT appointment_id, vaccine_name, appointment_date, caregiver_name
+        FROM Reserve
+        WHERE patient_name = %s AND appointment_id > %d AND appointment_date >= %s AND appointment_date <= %s
+        ORDER BY appointment_id {limit_clause}
+    """)
+    caregiver_appointments = Query("""
+        SELECT appointment_id, vaccine_name, appointment_date, patient_name
+        FROM Reserve
+        WHERE caregiver_name = %s AND appointment_id > %d AND appointment_date >= %s AND appointment_date <= %s
+        ORDER BY appointment_id {limit_clause}
+    """)
+
+    # waitlist: (patient, date, latest date or None, requested at, vaccine, patient, vaccine, date);
+    # nothing is inserted for an unknown vaccine or a request that is already waiting
+    waitlist_insert = Query("""
+        INSERT INTO Waitlist (patient_name, vaccine_name, Time, LatestTime, RequestedAt)
+        SELECT %s, v.Name, %s, %s, %s
+        FROM Vaccines v
+        WHERE v.Name = %s
+          AND NOT EXISTS (SELECT 1 FROM Waitlist WHERE patient_name = %s AND vaccine_name = %s AND Time = %s)
+    """)
+    # A waitlist request accepts every day from its Time to its LatestTime, only its
+    # Time when it has none. Filled with the request's alias w and two SQL
+    # expressions, this is true when it accepts some day from first to last; the
+    # matcher and the planner use it with first not before today.
+    waitlist_accepts = "{w}.Time <= {last} AND COALESCE({w}.LatestTime, {w}.Time) >= {first}"
+    # the oldest request of a patient for a vaccine and day: (patient, vaccine, date)
+    waitlist_find = Query("""
+        SELECT MIN(WaitlistId) FROM Waitlist WHERE patient_name = %s AND vaccine_name = %s AND Time = %s
+    """)
+    # place of request %d among the requests waiting for a day it accepts, 1 for the oldest
+    waitlist_position = Query(f"""
+        SELECT COUNT(*)
+        FROM Waitlist r
+        JOIN Waitlist e ON e.WaitlistId <= r.WaitlistId
+        WHERE r.WaitlistId = %d
+          AND {waitlist_accepts.format(w="e", first="r.Time", last="COALESCE(r.LatestTime, r.Time)")}
+    """)
+    waitlist_depth = Query("SELECT COUNT(*) FROM Waitlist WHERE COALESCE(LatestTime, Time) >= %s")
+    waitlist_expire = Query("DELETE FROM Waitlist WHERE COALESCE(LatestTime, Time) < %s")
+    # requests that accept a day from ... to ...: (to, from)
+    waitlist_in_range = Query(f"""
+        SELECT w.WaitlistId, w.patient_name, w.vaccine_name, w.Time, w.LatestTime
+        FROM Waitlist w
+        WHERE {waitlist_accepts.format(w="w", first="%s", last="%s")}
+        ORDER BY w.WaitlistId
+    """)
+    vaccine_doses = Query("SELECT Name, Doses FROM Vaccines")
+
+    @classmethod
+    def all(cls):
+        return [value for value in vars(cls).values() if isinstance(value, Query)]
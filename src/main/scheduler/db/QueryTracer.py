@@ -0,0 +1,178 @@
+import datetime
+import json
+import os
+import re
+import sys
+import threading
+
+
+class QueryTracer:
+    """
+    Records every statement run through a db.Backend.Cursor.
+
+    Statements are normalized (placeholders and literals become ?, whitespace
+    is collapsed, repeated VALUES tuples are folded) and aggregated into
+    per-statement count, total and max time, rows and errors; rows are those a
+    statement changed or, for one that returns rows, those fetched from it. A
+    statement that takes at least slow_ms, or any statement when trace_all is
+    set, is also written to the log as a JSON line with its parameters; bytes
+    parameters (salts and password hashes) are never written. Catalog statements (see
+    db/Queries.py) are also reported under their name.
+    """
+
+    # the sizes in column types such as VARCHAR(255) are part of the statement, not literals
+    literals = re.compile(r"(?P<type>\b(?:n?var)?(?:char|binary)\s*\(\s*(?:\d+|max)\s*\)"
+                          r"|\b(?:decimal|numeric|datetime2|float)\s*\([\d\s,]*\))"
+                          r"|'(?:[^']|'')*'|(?<![\w.])\d+(?:\.\d+)?(?![\w.])|%[sd]", re.IGNORECASE)
+    comments = re.compile(r"--[^\n]*")
+    repeated_tuples = re.compile(r"(\((?:\?,\s*)*\?\))(?:\s*,\s*\((?:\?,\s*)*\?\))+")
+
+    def __init__(self, slow_ms=None, log_path=None, trace_all=False):
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self.trace_all = trace_all
+        # operation text -> normalized text
+        self._normalized = {}
+        # normalized text -> [count, seconds, max seconds, rows, errors]
+        self._totals = {}
+        # normalized text -> catalog name
+        self._names = {}
+        self._lock = threading.Lock()
+        self._log = None
+
+        # stats
+        self.slow = 0
+
+    def normalize(self, operation):
+        text = self._normalized.get(operation)
+        if text is None:
+            text = self.comments.sub(" ", operation)
+            text = self.literals.sub(lambda m: m.group("type") or "?", text)
+            text = " ".join(text.split())
+            text = self.repeated_tuples.sub(r"\1, ...", text)
+            if len(self._normalized) >= 4096:
+                self._normalized.clear()
+            self._normalized[operation] = text
+        return text
+
+    # rowcount is None when unknown: the statement failed or returns rows, which
+    # are counted as they are fetched (see fetched)
+    def record(self, operation, params, seconds, rowcount, failed=False):
+        text = self.normalize(operation)
+        name = getattr(operation, "name", None)
+        with self._lock:
+            totals = self._totals.get(text)
+            if totals is None:
+                totals = self._totals[text] = [0, 0.0, 0.0, 0, 0]
+            if name is not None:
+                self._names[text] = name
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+            totals[3] += max(rowcount or 0, 0)
+            totals[4] += failed
+
+        slow = self.slow_ms is not None and seconds * 1000 >= self.slow_ms
+        if slow or self.trace_all:
+            if slow:
+                self.slow += 1
+            self._write({
+                "at": datetime.datetime.now().isoformat(timespec="milliseconds"),
+                "slow": slow,
+                "ms": round(seconds * 1000, 3),
+                "rows": rowcount,
+                "failed": failed,
+                "name": name,
+                "sql": text,
+                "params": redact(params),
+            })
+
+    # Count rows fetched from operation, recorded before
+    def fetched(self, operation, rows):
+        text = self.normalize(operation)
+        with self._lock:
+            totals = self._totals.get(text)
+            if totals is not None:
+                totals[3] += rows
+
+    # The n statements with the most total time, as dicts
+    def top(self, n=10):
+        with self._lock:
+            items = [(text, list(totals)) for text, totals in self._totals.items()]
+        items.sort(key=lambda item: item[1][1], reverse=True)
+        return [self._entry(text, totals) for text, totals in items[:n]]
+
+    # Catalog name -> the dict top() returns, for the catalog statements run so far
+    def by_name(self):
+        with self._lock:
+            return {name: self._entry(text, list(self._totals[text])) for text, name in self._names.items()}
+
+    def _entry(self, text, totals):
+        count, seconds, max_seconds, rows, errors = totals
+        return {
+            "name": self._names.get(text),
+            "sql": text,
+            "count": count,
+            "total_ms": round(seconds * 1000, 3),
+            "mean_ms": round(seconds * 1000 / count, 3),
+            "max_ms": round(max_seconds * 1000, 3),
+            "rows": rows,
+            "errors": errors,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+            self._names.clear()
+            self.slow = 0
+
+    def _write(self, entry):
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            if self._log is None:
+                self._log = open(self.log_path, "a") if self.log_path else sys.stderr
+            self._log.write(line)
+            self._log.flush()
+
+
+def redact(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: _redact_value(v) for k, v in params.items()}
+    if isinstance(params, (tuple, list)):
+        return [_redact_value(v) for v in params]
+    return [_redact_value(params)]
+
+
+def _redact_value(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "<redacted>"
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, str) and len(value) > 64:
+        return value[:64] + "..."
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return repr(value)
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+# Return the process-wide tracer. "SlowQueryMs" sets the slow-query threshold
+# (no slow-query log when unset), "SlowQueryLog" the log file (stderr by
+# default) and "SQLTrace=1" logs every statement.
+def get_tracer():
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                slow_ms = os.getenv("SlowQueryMs")
+                _tracer = QueryTracer(
+                    slow_ms=float(slow_ms) if slow_ms else None,
+                    log_path=os.getenv("SlowQueryLog"),
+                    trace_all=os.getenv("SQLTrace") == "1",
+                )
+    return _tracer
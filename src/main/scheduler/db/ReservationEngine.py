@@ -0,0 +1,99 @@
+from db.AssignmentPolicy import get_assignment_policy
+from db.Backend import DBError, get_backend
+from db.ConnectionManager import ConnectionManager
+from service.AvailabilityIndex import get_availability_index
+from service.DoseAllocator import get_dose_allocator
+from service.InventoryCache import get_inventory_cache
+
+
+class ReservationEngine:
+    """
+    Books an appointment in a single transaction.
+
+    The backend claims the free caregiver slot for the date that the
+    assignment policy ranks first, decrements the vaccine only while Doses > 0
+    and inserts into Reserve, returning the new appointment id directly. See
+    MSSQLBackend.reserve and SQLiteBackend.reserve. With dose leasing on the
+    dose comes from a lease of this instance instead (see DoseAllocator).
+    With the availability index on, the caregiver is picked in memory and the
+    backend only claims that caregiver's slot, falling back to picking in the
+    database when the index was wrong or knows no free caregiver (see
+    AvailabilityIndex).
+    """
+
+    OK = "ok"
+    NO_CAREGIVER = "no_caregiver"
+    NO_DOSES = "no_doses"
+
+    # internal: the dose lease was closed before the booking committed, take another
+    LEASE_LOST = "lease_lost"
+
+    def __init__(self, policy=None, allocator=None, index=None):
+        self.policy = policy or get_assignment_policy()
+        self.allocator = allocator or get_dose_allocator()
+        self.index = index or get_availability_index()
+
+    # Returns (status, appointment_id, caregiver_name); the id and caregiver are only set when status is OK
+    def reserve(self, patient_name, vaccine_name, appointment_date):
+        use_index = self.index is not None
+        for _ in range(3):
+            lease_id = None
+            if self.allocator is not None:
+                lease_id = self.allocator.take(vaccine_name)
+                if lease_id is None:
+                    return self.NO_DOSES, None, None
+
+            # None when the index is off or knows no free caregiver: the database picks, and
+            # decides whether there is none, since the index may not have seen another process's uploads yet
+            chosen = self.index.take(appointment_date, self.policy) if use_index else None
+
+            try:
+                status, appointment_id, caregiver_name = self._book(
+                    patient_name, vaccine_name, appointment_date, lease_id, chosen)
+            except DBError:
+                if chosen is not None:
+                    self.index.add(chosen, [appointment_date])
+                raise
+
+            if self.index is not None:
+                if status == self.OK:
+                    if chosen is None:
+                        self.index.remove(caregiver_name, appointment_date)
+                    self.index.appointment_added(caregiver_name)
+                elif chosen is not None and status == self.NO_CAREGIVER:
+                    # the index held a slot that is gone; let the database pick
+                    self.index.stale(chosen, appointment_date)
+                    use_index = False
+                    continue
+                elif chosen is not None:
+                    self.index.add(chosen, [appointment_date])
+
+            if status != self.LEASE_LOST:
+                return status, appointment_id, caregiver_name
+            self.allocator.drop(lease_id)
+        return self.NO_DOSES, None, None
+
+    def _book(self, patient_name, vaccine_name, appointment_date, lease_id, caregiver_name=None):
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor(as_dict=True)
+
+        try:
+            status, appointment_id, caregiver_name = get_backend().reserve(
+                cursor, patient_name, vaccine_name, appointment_date, self.policy, lease_id, caregiver_name)
+            if status != self.OK:
+                conn.rollback()
+                if lease_id is not None and status != self.LEASE_LOST:
+                    self.allocator.give_back(lease_id)
+                return status, None, None
+            conn.commit()
+            self.policy.assigned(caregiver_name)
+            get_inventory_cache().invalidate()
+            return self.OK, appointment_id, caregiver_name
+        except DBError:
+            conn.rollback()
+            if lease_id is not None:
+                self.allocator.give_back(lease_id)
+            raise
+        finally:
+            cm.close_connection()
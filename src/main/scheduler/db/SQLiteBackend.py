@@ -0,0 +1,408 @@
+import datetime
+import os
+import re
+import sqlite3
+import threading
+from db.Backend import Backend, Connection
+from db.Migrator import Migrator
+from db.Queries import Queries
+
+
+sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda d: d.isoformat(" "))
+sqlite3.register_converter("date", lambda b: datetime.date.fromisoformat(b.decode()))
+sqlite3.register_converter("timestamp", lambda b: datetime.datetime.fromisoformat(b.decode()))
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteBackend(Backend):
+    """
+    Embedded backend for single-site deployments, local development and load
+    testing. The database file is opened in WAL mode so readers do not block the
+    writer, and pending migrations are applied when the first connection opens.
+    """
+
+    name = "sqlite"
+    driver_errors = (sqlite3.Error,)
+
+    schema_version_ddl = """
+        CREATE TABLE IF NOT EXISTS SchemaVersion (
+            Version INTEGER PRIMARY KEY,
+            Name VARCHAR(255),
+            AppliedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+
+    limit_clause = "LIMIT %d"
+    random_order = "RANDOM()"
+
+    placeholder = re.compile(r"%([sd%])")
+
+    add_column = re.compile(r"^\s*ALTER\s+TABLE\s+(\w+)\s+ADD\s+(?:COLUMN\s+)?(\w+)", re.IGNORECASE | re.MULTILINE)
+
+    # vaccines per upsert in add_doses, keeping each statement below the parameter limit
+    shipment_chunk = 500
+
+    def __init__(self, path=None, auto_migrate=True):
+        self.path = path or os.getenv("SQLitePath", "scheduler.db")
+        self.auto_migrate = auto_migrate
+        self.timeout = float(os.getenv("SQLiteBusyTimeout", "30"))
+        self._prepared = {}
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def open(self):
+        # writes start with BEGIN IMMEDIATE so two writers never deadlock upgrading read locks
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level="IMMEDIATE",
+                               detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        self._migrate(conn)
+        return conn
+
+    def raw_cursor(self, conn, as_dict):
+        cursor = conn.cursor()
+        if as_dict:
+            cursor.row_factory = _dict_row
+        return cursor
+
+    # DDL does not open a transaction implicitly in the sqlite3 module
+    def begin(self, cursor):
+        cursor.execute("BEGIN IMMEDIATE")
+
+    def split_script(self, script):
+        statements = []
+        current = ""
+        for line in script.splitlines(keepends=True):
+            current += line
+            if sqlite3.complete_statement(current):
+                statements.append(current)
+                current = ""
+        # anything left over is an unterminated last statement, unless it is only comments
+        if any(line.strip() and not line.strip().startswith("--") for line in current.splitlines()):
+            statements.append(current)
+        return statements
+
+    # SQLite has no ADD COLUMN IF NOT EXISTS, so a column the table already has is not added again
+    def already_applied(self, cursor, statement):
+        match = self.add_column.search(statement)
+        if match is None:
+            return False
+        cursor.execute(f"PRAGMA table_info({match.group(1)})")
+        return any(row[1].lower() == match.group(2).lower() for row in cursor.fetchall())
+
+    def explain(self, cursor, operation, params=None):
+        cursor.execute("EXPLAIN QUERY PLAN " + operation, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+    # Translate pymssql placeholders to qmark style; the translations are cached per statement
+    def prepare(self, operation):
+        prepared = self._prepared.get(operation)
+        if prepared is None:
+            prepared = self.placeholder.sub(lambda m: "%" if m.group(1) == "%" else "?", operation)
+            self._prepared[operation] = prepared
+        return prepared
+
+    def adapt_params(self, params):
+        if isinstance(params, (tuple, list, dict)):
+            return params
+        return (params,)
+
+    # The claiming DELETE is the first statement, so BEGIN IMMEDIATE takes the write
+    # lock before the slot is chosen and concurrent bookings serialize on it.
+    def reserve(self, cursor, patient_name, vaccine_name, appointment_date, policy, lease_id=None,
+                caregiver_name=None):
+        order_by, order_params = policy.order_by(self)
+        only, only_params = ("AND a.Username = %s", (caregiver_name,)) if caregiver_name else ("", ())
+        cursor.execute(f"""
+            DELETE FROM Availabilities
+            WHERE rowid = (
+                SELECT a.rowid FROM Availabilities a
+                JOIN Caregivers c ON c.Username = a.Username
+                WHERE a.Time = %s {only}
+                ORDER BY {order_by}
+                LIMIT 1
+            )
+            RETURNING Username
+        """, (appointment_date, *only_params, *order_params))
+        row = cursor.fetchone()
+        if row is None:
+            return "no_caregiver", None, None
+        caregiver_name = row['Username']
+
+        if lease_id is None:
+            cursor.execute("UPDATE Vaccines SET Doses = Doses - 1 WHERE Name = %s AND Doses > 0", vaccine_name)
+            if cursor.rowcount == 0:
+                return "no_doses", None, None
+        else:
+            # writers are serialized, so the lease cannot be closed before this commits
+            cursor.execute("SELECT 1 FROM DoseLeases WHERE LeaseId = %s", lease_id)
+            if cursor.fetchone() is None:
+                return "lease_lost", None, None
+
+        cursor.execute("""
+            INSERT INTO Reserve (vaccine_name, appointment_date, patient_name, caregiver_name, lease_id)
+            VALUES (%s, %s, %s, %s, %s)
+            RETURNING appointment_id
+        """, (vaccine_name, appointment_date, patient_name, caregiver_name, lease_id))
+        appointment_id = cursor.fetchone()['appointment_id']
+
+        cursor.execute("UPDATE Caregivers SET Appointments = Appointments + 1 WHERE Username = %s", caregiver_name)
+        return "ok", appointment_id, caregiver_name
+
+    def insert_availabilities(self, cursor, username, dates):
+        # a day the caregiver already has an appointment on is not free again
+        cursor.executemany("""
+            INSERT INTO Availabilities (Time, Username)
+            SELECT %s, %s
+            WHERE NOT EXISTS (SELECT 1 FROM Reserve WHERE caregiver_name = %s AND appointment_date = %s)
+            ON CONFLICT (Time, Username) DO NOTHING
+        """, [(d, username, username, d) for d in dates])
+        return cursor.rowcount
+
+    def insert_users(self, cursor, table, rows):
+        cursor.executemany(f"""
+            INSERT INTO {table} (Username, Salt, Hash) VALUES (%s, %s, %s)
+            ON CONFLICT (Username) DO NOTHING
+        """, rows)
+        return cursor.rowcount
+
+    # Multi-row upserts; writers are serialized, so the doses before are the doses after minus those added
+    def add_doses(self, cursor, shipment):
+        after = {}
+        for i in range(0, len(shipment), self.shipment_chunk):
+            chunk = shipment[i:i + self.shipment_chunk]
+            params = []
+            for vaccine_name, doses in chunk:
+                params.extend((vaccine_name, doses, doses))
+            cursor.execute(f"""
+                INSERT INTO Vaccines (Name, Doses, TotalAdded)
+                VALUES {", ".join(["(%s, %d, %d)"] * len(chunk))}
+                ON CONFLICT (Name) DO UPDATE
+                SET Doses = Doses + excluded.Doses, TotalAdded = TotalAdded + excluded.TotalAdded
+                RETURNING Name, Doses
+            """, tuple(params))
+            after.update(cursor.fetchall())
+        return [(vaccine_name, after[vaccine_name] - doses, after[vaccine_name])
+                for vaccine_name, doses in sorted(shipment)]
+
+    # The moves are matched in a temporary table: the n-th appointment of a day
+    # (by id) goes to the n-th free caregiver of that day in policy order.
+    # Writers are serialized, so an open lease cannot close before this commits.
+    def cancel_caregiver_days(self, cursor, caregiver_name, date_from, date_to, policy):
+        order_by, order_params = policy.order_by(self)
+        span = (caregiver_name, date_from, date_to)
+        cursor.execute("DELETE FROM Availabilities WHERE Username = %s AND Time >= %s AND Time <= %s", span)
+        removed = cursor.rowcount
+
+        cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS Moves (
+                appointment_id INTEGER PRIMARY KEY,
+                caregiver_name VARCHAR(255),
+                Time DATE
+            )
+        """)
+        cursor.execute("DELETE FROM temp.Moves")
+        cursor.execute(f"""
+            INSERT INTO temp.Moves (appointment_id, caregiver_name, Time)
+            WITH appointments AS (
+                SELECT appointment_id, appointment_date,
+                       ROW_NUMBER() OVER (PARTITION BY appointment_date ORDER BY appointment_id) AS n
+                FROM Reserve
+                WHERE caregiver_name = %s AND appointment_date >= %s AND appointment_date <= %s
+            ), slots AS (
+                SELECT a.Time, a.Username,
+                       ROW_NUMBER() OVER (PARTITION BY a.Time ORDER BY {order_by}) AS n
+                FROM Availabilities a
+                JOIN Caregivers c ON c.Username = a.Username
+                WHERE a.Time >= %s AND a.Time <= %s
+                  AND a.Time IN (SELECT appointment_date FROM appointments)
+            )
+            SELECT p.appointment_id, s.Username, s.Time
+            FROM appointments p
+            JOIN slots s ON s.Time = p.appointment_date AND s.n = p.n
+        """, (*span, *order_params, date_from, date_to))
+        cursor.execute("""
+            UPDATE Reserve SET caregiver_name = m.caregiver_name
+            FROM temp.Moves m
+            WHERE m.appointment_id = Reserve.appointment_id
+        """)
+        cursor.execute("""
+            DELETE FROM Availabilities
+            WHERE (Time, Username) IN (SELECT Time, caregiver_name FROM temp.Moves)
+        """)
+        cursor.execute("""
+            UPDATE Caregivers SET Appointments = Appointments + m.n
+            FROM (SELECT caregiver_name, COUNT(*) AS n FROM temp.Moves GROUP BY caregiver_name) m
+            WHERE m.caregiver_name = Caregivers.Username
+        """)
+        cursor.execute("SELECT appointment_id, caregiver_name, Time FROM temp.Moves ORDER BY appointment_id")
+        moved = [tuple(row) for row in cursor.fetchall()]
+
+        # what could not be moved is canceled; a dose whose lease is still open goes back to the lease
+        cursor.execute("""
+            SELECT r.appointment_id, r.patient_name, r.appointment_date, l.LeaseId
+            FROM Reserve r
+            LEFT JOIN DoseLeases l ON l.LeaseId = r.lease_id
+            WHERE r.caregiver_name = %s AND r.appointment_date >= %s AND r.appointment_date <= %s
+            ORDER BY r.appointment_id
+        """, span)
+        canceled = [tuple(row) for row in cursor.fetchall()]
+        if canceled:
+            cursor.execute("""
+                UPDATE Vaccines SET Doses = Doses + d.n
+                FROM (
+                    SELECT r.vaccine_name, COUNT(*) AS n
+                    FROM Reserve r
+                    WHERE r.caregiver_name = %s AND r.appointment_date >= %s AND r.appointment_date <= %s
+                      AND NOT EXISTS (SELECT 1 FROM DoseLeases l WHERE l.LeaseId = r.lease_id)
+                    GROUP BY r.vaccine_name
+                ) d
+                WHERE d.vaccine_name = Vaccines.Name
+            """, span)
+            cursor.execute("""
+                DELETE FROM Reserve
+                WHERE caregiver_name = %s AND appointment_date >= %s AND appointment_date <= %s
+            """, span)
+        if moved or canceled:
+            cursor.execute("UPDATE Caregivers SET Appointments = Appointments - %d WHERE Username = %s",
+                           (len(moved) + len(canceled), caregiver_name))
+        return removed, moved, canceled
+
+    # Matched in a temporary table like cancel_caregiver_days: a request keeps
+    # its place among the requests for its vaccine while there are doses, then
+    # among the requests for its day while there are free caregivers.
+    def match_waitlist(self, cursor, today, batch_size, policy):
+        order_by, order_params = policy.order_by(self)
+        accepts = Queries.waitlist_accepts.format(w="w", first="a.Time", last="a.Time")
+        cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS Matches (
+                WaitlistId INTEGER PRIMARY KEY,
+                patient_name VARCHAR(255),
+                vaccine_name VARCHAR(255),
+                Time DATE,
+                RequestedAt TIMESTAMP,
+                caregiver_name VARCHAR(255)
+            )
+        """)
+        cursor.execute("DELETE FROM temp.Matches")
+        cursor.execute(f"""
+            INSERT INTO temp.Matches (WaitlistId, patient_name, vaccine_name, Time, RequestedAt, caregiver_name)
+            WITH chosen AS (
+                -- the earliest day with a free slot that the request accepts
+                SELECT w.WaitlistId, w.patient_name, w.vaccine_name, w.RequestedAt,
+                       (SELECT MIN(a.Time) FROM Availabilities a WHERE a.Time >= %s AND {accepts}) AS Time
+                FROM Waitlist w
+                WHERE COALESCE(w.LatestTime, w.Time) >= %s
+                  AND EXISTS (SELECT 1 FROM Vaccines v WHERE v.Name = w.vaccine_name AND v.Doses > 0)
+            ), batch AS (
+                SELECT c.WaitlistId, c.patient_name, c.vaccine_name, c.Time, c.RequestedAt,
+                       ROW_NUMBER() OVER (PARTITION BY c.vaccine_name ORDER BY c.WaitlistId) AS k
+                FROM chosen c
+                WHERE c.Time IS NOT NULL
+                ORDER BY c.WaitlistId
+                LIMIT %d
+            ), dosed AS (
+                SELECT b.WaitlistId, b.patient_name, b.vaccine_name, b.Time, b.RequestedAt,
+                       ROW_NUMBER() OVER (PARTITION BY b.Time ORDER BY b.WaitlistId) AS n
+                FROM batch b
+                JOIN Vaccines v ON v.Name = b.vaccine_name
+                WHERE b.k <= v.Doses
+            ), slots AS (
+                SELECT a.Time, a.Username,
+                       ROW_NUMBER() OVER (PARTITION BY a.Time ORDER BY {order_by}) AS n
+                FROM Availabilities a
+                JOIN Caregivers c ON c.Username = a.Username
+                WHERE a.Time IN (SELECT Time FROM dosed)
+            )
+            SELECT d.WaitlistId, d.patient_name, d.vaccine_name, d.Time, d.RequestedAt, s.Username
+            FROM dosed d
+            JOIN slots s ON s.Time = d.Time AND s.n = d.n
+        """, (today, today, batch_size, *order_params))
+        if cursor.rowcount == 0:
+            return []
+
+        cursor.execute("""
+            DELETE FROM Availabilities
+            WHERE (Time, Username) IN (SELECT Time, caregiver_name FROM temp.Matches)
+        """)
+        cursor.execute("""
+            UPDATE Vaccines SET Doses = Doses - m.n
+            FROM (SELECT vaccine_name, COUNT(*) AS n FROM temp.Matches GROUP BY vaccine_name) m
+            WHERE m.vaccine_name = Vaccines.Name
+        """)
+        cursor.execute("""
+            INSERT INTO Reserve (vaccine_name, appointment_date, patient_name, caregiver_name)
+            SELECT vaccine_name, Time, patient_name, caregiver_name FROM temp.Matches ORDER BY WaitlistId
+            RETURNING appointment_id, caregiver_name, appointment_date
+        """)
+        # every slot is claimed once, so its caregiver and day identify the request
+        booked = {(row[1], row[2]): row[0] for row in cursor.fetchall()}
+        cursor.execute("""
+            UPDATE Caregivers SET Appointments = Appointments + m.n
+            FROM (SELECT caregiver_name, COUNT(*) AS n FROM temp.Matches GROUP BY caregiver_name) m
+            WHERE m.caregiver_name = Caregivers.Username
+        """)
+        cursor.execute("DELETE FROM Waitlist WHERE WaitlistId IN (SELECT WaitlistId FROM temp.Matches)")
+        cursor.execute("""
+            SELECT WaitlistId, patient_name, vaccine_name, caregiver_name, Time, RequestedAt
+            FROM temp.Matches
+            ORDER BY WaitlistId
+        """)
+        return [(waitlist_id, booked[(caregiver_name, date)], patient_name, vaccine_name,
+                 caregiver_name, date, requested_at)
+                for waitlist_id, patient_name, vaccine_name, caregiver_name, date, requested_at in cursor.fetchall()]
+
+    # The plan goes into a temporary table; every check is a row count
+    def book_plan(self, cursor, plan):
+        cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS Plan (
+                WaitlistId INTEGER PRIMARY KEY,
+                patient_name VARCHAR(255),
+                vaccine_name VARCHAR(255),
+                caregiver_name VARCHAR(255),
+                Time DATE
+            )
+        """)
+        cursor.execute("DELETE FROM temp.Plan")
+        cursor.executemany("INSERT INTO temp.Plan VALUES (%s, %s, %s, %s, %s)", plan)
+
+        cursor.execute("""
+            DELETE FROM Availabilities
+            WHERE (Time, Username) IN (SELECT Time, caregiver_name FROM temp.Plan)
+        """)
+        if cursor.rowcount != len(plan):
+            return False
+        cursor.execute("""
+            UPDATE Vaccines SET Doses = Doses - m.n
+            FROM (SELECT vaccine_name, COUNT(*) AS n FROM temp.Plan GROUP BY vaccine_name) m
+            WHERE m.vaccine_name = Vaccines.Name AND Vaccines.Doses >= m.n
+        """)
+        if cursor.rowcount != len({vaccine_name for _, _, vaccine_name, _, _ in plan}):
+            return False
+        cursor.execute("DELETE FROM Waitlist WHERE WaitlistId IN (SELECT WaitlistId FROM temp.Plan)")
+        if cursor.rowcount != len(plan):
+            return False
+
+        cursor.execute("""
+            INSERT INTO Reserve (vaccine_name, appointment_date, patient_name, caregiver_name)
+            SELECT vaccine_name, Time, patient_name, caregiver_name FROM temp.Plan ORDER BY WaitlistId
+        """)
+        cursor.execute("""
+            UPDATE Caregivers SET Appointments = Appointments + m.n
+            FROM (SELECT caregiver_name, COUNT(*) AS n FROM temp.Plan GROUP BY caregiver_name) m
+            WHERE m.caregiver_name = Caregivers.Username
+        """)
+        return True
+
+    def _migrate(self, conn):
+        if self._schema_ready or not self.auto_migrate:
+            return
+        with self._schema_lock:
+            if not self._schema_ready:
+                Migrator(self).migrate(Connection(self, conn))
+                self._schema_ready = True
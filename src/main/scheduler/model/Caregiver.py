@@ -1,9 +1,9 @@
-import sys
-sys.path.append("../util/*")
-sys.path.append("../db/*")
-from util.Util import Util
 from db.ConnectionManager import ConnectionManager
-import pymssql
+from db.Backend import DBError, get_backend
+from db.Queries import Queries
+from service.CredentialVerifier import get_verifier
+from service.AvailabilityIndex import get_availability_index
+from util.PasswordHash import PasswordHash
 
 
 class Caregiver:
@@ -19,27 +19,46 @@ class Caregiver:
         conn = cm.create_connection()
         cursor = conn.cursor(as_dict=True)
 
-        get_caregiver_details = "SELECT Salt, Hash FROM Caregivers WHERE Username = %s"
         try:
-            cursor.execute(get_caregiver_details, self.username)
-            for row in cursor:
-                curr_salt = row['Salt']
-                curr_hash = row['Hash']
-                calculated_hash = Util.generate_hash(self.password, curr_salt)
-                if not curr_hash == calculated_hash:
-                    print("Incorrect password")
-                    cm.close_connection()
-                    return None
-                else:
-                    self.salt = curr_salt
-                    self.hash = calculated_hash
-                    cm.close_connection()
-                    return self
-        except pymssql.Error as e:
+            cursor.execute(Queries.caregiver_credentials, self.username)
+            row = cursor.fetchone()
+        except DBError as e:
             raise e
+        finally:
+            # give the connection back before the slow hash runs
+            cm.close_connection()
+        if row is None:
+            return None
+
+        curr_salt = row['Salt']
+        curr_hash = row['Hash']
+        if not get_verifier().verify(self.password, curr_salt, curr_hash):
+            print("Incorrect password")
+            return None
+        self.salt = curr_salt
+        self.hash = curr_hash
+        if not PasswordHash.decode(curr_hash, curr_salt).is_current():
+            self.rehash()
+        return self
+
+    # Re-hash the password with the configured algorithm and cost after a successful login
+    def rehash(self):
+        password_hash = get_verifier().hash_password(self.password)
+
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(Queries.caregiver_rehash, (password_hash.salt, password_hash.encode(), self.username, self.hash))
+            conn.commit()
+            self.salt = password_hash.salt
+            self.hash = password_hash.encode()
+        except DBError:
+            # keep the old hash, the login itself succeeded and the next one tries again
+            pass
         finally:
             cm.close_connection()
-        return None
 
     def get_username(self):
         return self.username
@@ -55,28 +74,41 @@ class Caregiver:
         conn = cm.create_connection()
         cursor = conn.cursor()
 
-        add_caregivers = "INSERT INTO Caregivers VALUES (%s, %s, %s)"
         try:
-            cursor.execute(add_caregivers, (self.username, self.salt, self.hash))
+            cursor.execute(Queries.caregiver_insert, (self.username, self.salt, self.hash))
             # you must call commit() to persist your data if you don't set autocommit to True
             conn.commit()
-        except pymssql.Error:
+        except DBError:
             raise
         finally:
             cm.close_connection()
 
     # Insert availability with parameter date d
     def upload_availability(self, d):
+        return self.upload_availabilities([d])
+
+    # Insert availability for every date in dates in one transaction, skipping
+    # dates already uploaded. Returns the number of dates added.
+    def upload_availabilities(self, dates):
+        dates = sorted(set(dates))
+        if not dates:
+            return 0
+
         cm = ConnectionManager()
         conn = cm.create_connection()
         cursor = conn.cursor()
 
-        add_availability = "INSERT INTO Availabilities VALUES (%s , %s)"
         try:
-            cursor.execute(add_availability, (d, self.username))
+            inserted = get_backend().insert_availabilities(cursor, self.username, dates)
             # you must call commit() to persist your data if you don't set autocommit to True
             conn.commit()
-        except pymssql.Error:
+            index = get_availability_index()
+            if index is not None and inserted:
+                # dates already booked were skipped, so read back which ones are available
+                cursor.execute(Queries.caregiver_available_dates, (self.username, dates[0], dates[-1]))
+                index.add(self.username, [row[0] for row in cursor.fetchall()])
+            return inserted
+        except DBError:
             # print("Error occurred when updating caregiver availability")
             raise
         finally:
@@ -1,9 +1,8 @@
-import sys
-sys.path.append("../util/*")
-sys.path.append("../db/*")
-from util.Util import Util
 from db.ConnectionManager import ConnectionManager
-import pymssql
+from db.Backend import DBError
+from db.Queries import Queries
+from service.CredentialVerifier import get_verifier
+from util.PasswordHash import PasswordHash
 
 
 class Patient:
@@ -19,27 +18,46 @@ class Patient:
         conn = cm.create_connection()
         cursor = conn.cursor(as_dict=True)
 
-        get_patient_details = "SELECT Salt, Hash FROM Patients WHERE Username = %s"
         try:
-            cursor.execute(get_patient_details, self.username)
-            for row in cursor:
-                curr_salt = row['Salt']
-                curr_hash = row['Hash']
-                calculated_hash = Util.generate_hash(self.password, curr_salt)
-                if not curr_hash == calculated_hash:
-                    print("Incorret password")
-                    cm.close_connection()
-                    return None
-                else:
-                    self.salt = curr_salt
-                    self.hash = calculated_hash
-                    cm.close_connection()
-                    return self
-        except pymssql.Error as e:
+            cursor.execute(Queries.patient_credentials, self.username)
+            row = cursor.fetchone()
+        except DBError as e:
             raise e
+        finally:
+            # give the connection back before the slow hash runs
+            cm.close_connection()
+        if row is None:
+            return None
+
+        curr_salt = row['Salt']
+        curr_hash = row['Hash']
+        if not get_verifier().verify(self.password, curr_salt, curr_hash):
+            print("Incorret password")
+            return None
+        self.salt = curr_salt
+        self.hash = curr_hash
+        if not PasswordHash.decode(curr_hash, curr_salt).is_current():
+            self.rehash()
+        return self
+
+    # Re-hash the password with the configured algorithm and cost after a successful login
+    def rehash(self):
+        password_hash = get_verifier().hash_password(self.password)
+
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(Queries.patient_rehash, (password_hash.salt, password_hash.encode(), self.username, self.hash))
+            conn.commit()
+            self.salt = password_hash.salt
+            self.hash = password_hash.encode()
+        except DBError:
+            # keep the old hash, the login itself succeeded and the next one tries again
+            pass
         finally:
             cm.close_connection()
-        return None
     
     def get_username(self):
         return self.username
@@ -55,11 +73,10 @@ class Patient:
         conn = cm.create_connection()
         cursor = conn.cursor()
 
-        add_patients = "INSERT INTO Patients VALUES (%s, %s, %s)"
         try:
-            cursor.execute(add_patients, (self.username, self.salt, self.hash))
+            cursor.execute(Queries.patient_insert, (self.username, self.salt, self.hash))
             conn.commit()
-        except pymssql.Error:
+        except DBError:
             raise
         finally:
             cm.close_connection()
\ No newline at end of file
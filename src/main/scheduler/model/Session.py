@@ -0,0 +1,17 @@
+class Session:
+    """
+    Keeps track of the user logged in on one connection to the scheduler.
+    Note: it is always true that at most one of caregiver and patient is not None
+          since only one user can be logged in per session at a time
+    """
+
+    def __init__(self):
+        self.patient = None
+        self.caregiver = None
+
+    def get_username(self):
+        if self.patient is not None:
+            return self.patient.get_username()
+        if self.caregiver is not None:
+            return self.caregiver.get_username()
+        return None
@@ -1,7 +1,7 @@
-import sys
-sys.path.append("../db/*")
 from db.ConnectionManager import ConnectionManager
-import pymssql
+from db.Backend import DBError
+from db.Queries import Queries
+from service.InventoryCache import get_inventory_cache
 
 
 class Vaccine:
@@ -15,13 +15,12 @@ class Vaccine:
         conn = cm.create_connection()
         cursor = conn.cursor()
 
-        get_vaccine = "SELECT Name, Doses FROM Vaccines WHERE Name = %s"
         try:
-            cursor.execute(get_vaccine, self.vaccine_name)
+            cursor.execute(Queries.vaccine_get, self.vaccine_name)
             for row in cursor:
                 self.available_doses = row[1]
                 return self
-        except pymssql.Error:
+        except DBError:
             # print("Error occurred when getting Vaccine")
             raise
         finally:
@@ -42,12 +41,12 @@ class Vaccine:
         conn = cm.create_connection()
         cursor = conn.cursor()
 
-        add_doses = "INSERT INTO VACCINES VALUES (%s, %d)"
         try:
-            cursor.execute(add_doses, (self.vaccine_name, self.available_doses))
+            cursor.execute(Queries.vaccine_insert, (self.vaccine_name, self.available_doses, self.available_doses))
             # you must call commit() to persist your data if you don't set autocommit to True
             conn.commit()
-        except pymssql.Error:
+            get_inventory_cache().invalidate()
+        except DBError:
             # print("Error occurred when insert Vaccines")
             raise
         finally:
@@ -63,12 +62,13 @@ class Vaccine:
         conn = cm.create_connection()
         cursor = conn.cursor()
 
-        update_vaccine_availability = "UPDATE vaccines SET Doses = %d WHERE name = %s"
+        # relative update: bookings and dose leases change Doses concurrently
         try:
-            cursor.execute(update_vaccine_availability, (self.available_doses, self.vaccine_name))
+            cursor.execute(Queries.vaccine_add_doses, (num, num, self.vaccine_name))
             # you must call commit() to persist your data if you don't set autocommit to True
             conn.commit()
-        except pymssql.Error:
+            get_inventory_cache().invalidate()
+        except DBError:
             # print("Error occurred when updating vaccine availability")
             raise
         finally:
@@ -77,19 +77,23 @@ class Vaccine:
     # Decrement the available doses
     def decrease_available_doses(self, num):
         if self.available_doses - num < 0:
-            ValueError("Not enough available doses!")
-        self.available_doses -= num
+            raise ValueError("Not enough available doses!")
 
         cm = ConnectionManager()
         conn = cm.create_connection()
         cursor = conn.cursor()
 
-        update_vaccine_availability = "UPDATE vaccines SET Doses = %d WHERE name = %s"
+        # doses taken out of stock no longer count as added
         try:
-            cursor.execute(update_vaccine_availability, (self.available_doses, self.vaccine_name))
+            cursor.execute(Queries.vaccine_remove_doses, (num, num, self.vaccine_name, num))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                raise ValueError("Not enough available doses!")
+            self.available_doses -= num
             # you must call commit() to persist your data if you don't set autocommit to True
             conn.commit()
-        except pymssql.Error:
+            get_inventory_cache().invalidate()
+        except DBError:
             # print("Error occurred when updating vaccine availability")
             raise
         finally:
@@ -0,0 +1,297 @@
+import argparse
+import datetime
+import os
+import random
+import sys
+import threading
+import time
+from db.AssignmentPolicy import get_assignment_policy
+from db.ConnectionManager import ConnectionManager
+from db.Queries import Queries
+
+
+class AvailabilityIndex:
+    """
+    In-memory copy of Availabilities for search_caregiver_schedule and for
+    picking the caregiver a reservation claims.
+
+    Caregivers get dense ids and every date a bitset (a bytearray) with bit id
+    set when that caregiver is available, so 10k caregivers take 1.25 KB per
+    date. It is loaded with one streaming query and updated after every write
+    this process commits; the database stays the source of truth and a claim
+    of a slot the index wrongly holds simply fails. Writes by other processes
+    show up at the next reload, after at most ttl seconds. Appointment counts
+    per caregiver are kept alongside as a hint for the least_loaded policy.
+    """
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        # username -> dense id, and back
+        self._ids = {}
+        self._names = []
+        # id -> appointment count
+        self._loads = []
+        # date ordinal -> bitset over caregiver ids, and how many bits are set
+        self._dates = {}
+        self._counts = {}
+        self._loaded_at = None
+        # writes made while a reload runs, replayed on top of its result
+        self._journal = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+        # stats
+        self.loads = 0
+        self.stale_claims = 0
+
+    def load(self):
+        with self._reload_lock:
+            self._load()
+
+    def ensure_fresh(self):
+        if not self._stale():
+            return
+        if self._loaded_at is None:
+            # nothing to serve yet: one thread loads, the others wait for it
+            with self._reload_lock:
+                if self._stale():
+                    self._load()
+        elif self._reload_lock.acquire(blocking=False):
+            # one thread reloads while the others keep using the current copy
+            try:
+                if self._stale():
+                    self._load()
+            finally:
+                self._reload_lock.release()
+
+    def _stale(self):
+        loaded_at = self._loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at >= self.ttl
+
+    # Called with the reload lock held
+    def _load(self):
+        with self._lock:
+            self._journal = []
+        try:
+            ids, names, loads, dates, counts = self._read()
+        except BaseException:
+            with self._lock:
+                self._journal = None
+            raise
+        with self._lock:
+            self._ids, self._names, self._loads, self._dates, self._counts = ids, names, loads, dates, counts
+            journal, self._journal = self._journal, None
+            for op in journal:
+                op()
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    # Sorted usernames available on date
+    def caregivers(self, date):
+        self.ensure_fresh()
+        with self._lock:
+            bits = self._dates.get(date.toordinal())
+            return sorted(self._names[i] for i in self._members(bits)) if bits else []
+
+    # [(date, count)] for the dates from date_from to date_to with anyone available
+    def counts(self, date_from, date_to):
+        self.ensure_fresh()
+        with self._lock:
+            return [(datetime.date.fromordinal(day), count)
+                    for day, count in self._range(self._counts, date_from, date_to)]
+
+    # [(date, sorted usernames)] for the dates from date_from to date_to with anyone available
+    def schedule(self, date_from, date_to):
+        self.ensure_fresh()
+        with self._lock:
+            return [(datetime.date.fromordinal(day), sorted(self._names[i] for i in self._members(self._dates[day])))
+                    for day, count in self._range(self._counts, date_from, date_to)]
+
+    # Pick the caregiver policy prefers on date and mark them taken; None if nobody is available.
+    # Call add() to put them back if the booking does not happen.
+    def take(self, date, policy):
+        self.ensure_fresh()
+        with self._lock:
+            bits = self._dates.get(date.toordinal())
+            ids = self._members(bits) if bits else []
+            if not ids:
+                return None
+            name = policy.choose([self._names[i] for i in ids], [self._loads[i] for i in ids])
+            self._apply(self._clear, name, date.toordinal())
+            return name
+
+    def add(self, username, dates):
+        with self._lock:
+            for date in dates:
+                self._apply(self._set, username, date.toordinal())
+
+    def remove(self, username, date):
+        with self._lock:
+            self._apply(self._clear, username, date.toordinal())
+
+    # The claim of a slot the index held failed in the database
+    def stale(self, username, date):
+        self.remove(username, date)
+        with self._lock:
+            self.stale_claims += 1
+
+    def appointment_added(self, username, delta=1):
+        with self._lock:
+            self._apply(self._add_load, username, delta)
+
+    def memory_bytes(self):
+        with self._lock:
+            total = sys.getsizeof(self._dates) + sys.getsizeof(self._ids) + sys.getsizeof(self._names)
+            total += sys.getsizeof(self._loads) + sys.getsizeof(self._counts)
+            total += sum(sys.getsizeof(bits) for bits in self._dates.values())
+            total += sum(sys.getsizeof(name) for name in self._names)
+            return total
+
+    def stats(self):
+        with self._lock:
+            caregivers, dates = len(self._names), sum(1 for count in self._counts.values() if count)
+        return {
+            "caregivers": caregivers,
+            "dates": dates,
+            "memory_bytes": self.memory_bytes(),
+            "loads": self.loads,
+            "stale_claims": self.stale_claims,
+        }
+
+    def _read(self):
+        ids, names, loads, dates, counts = {}, [], [], {}, {}
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(Queries.availability_with_loads)
+            for time_, username, appointments in cursor:
+                i = ids.get(username)
+                if i is None:
+                    i = ids[username] = len(names)
+                    names.append(username)
+                    loads.append(appointments)
+                day = time_.toordinal()
+                bits = dates.get(day)
+                if bits is None:
+                    bits = dates[day] = bytearray()
+                if _set_bit(bits, i):
+                    counts[day] = counts.get(day, 0) + 1
+        finally:
+            cm.close_connection()
+        return ids, names, loads, dates, counts
+
+    # Apply op(*args) now and again after a reload in progress. Called with the lock held.
+    def _apply(self, op, *args):
+        op(*args)
+        if self._journal is not None:
+            self._journal.append(lambda: op(*args))
+
+    def _id(self, username):
+        i = self._ids.get(username)
+        if i is None:
+            i = self._ids[username] = len(self._names)
+            self._names.append(username)
+            self._loads.append(0)
+        return i
+
+    def _set(self, username, day):
+        bits = self._dates.get(day)
+        if bits is None:
+            bits = self._dates[day] = bytearray()
+        if _set_bit(bits, self._id(username)):
+            self._counts[day] = self._counts.get(day, 0) + 1
+
+    def _clear(self, username, day):
+        i = self._ids.get(username)
+        bits = self._dates.get(day)
+        if i is not None and bits is not None and i // 8 < len(bits) and bits[i // 8] & (1 << (i % 8)):
+            bits[i // 8] &= ~(1 << (i % 8)) & 0xFF
+            self._counts[day] -= 1
+
+    def _add_load(self, username, delta):
+        i = self._id(username)
+        self._loads[i] = max(0, self._loads[i] + delta)
+
+    # Ids of the bits set in bits
+    def _members(self, bits):
+        return [base + bit
+                for base, byte in zip(range(0, len(bits) * 8, 8), bits) if byte
+                for bit in _bit_positions[byte]]
+
+    # [(day, count)] of the days from date_from to date_to with a nonzero count
+    def _range(self, counts, date_from, date_to):
+        first, last = date_from.toordinal(), date_to.toordinal()
+        if last - first + 1 <= len(counts):
+            days = ((day, counts.get(day)) for day in range(first, last + 1))
+        else:
+            days = sorted((day, count) for day, count in counts.items() if first <= day <= last)
+        return [(day, count) for day, count in days if count]
+
+
+# byte value -> positions of its set bits
+_bit_positions = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+# Set bit i, growing bits as needed; returns whether it was clear before
+def _set_bit(bits, i):
+    if i // 8 >= len(bits):
+        bits.extend(bytes(i // 8 + 1 - len(bits)))
+    if bits[i // 8] & (1 << (i % 8)):
+        return False
+    bits[i // 8] |= 1 << (i % 8)
+    return True
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+# Return the process-wide index, or None unless "AvailabilityIndex" is 1;
+# "AvailabilityIndexTTL" is the reload interval in seconds
+def get_availability_index():
+    global _index
+    if _index is None:
+        if os.getenv("AvailabilityIndex") != "1":
+            return None
+        with _index_lock:
+            if _index is None:
+                _index = AvailabilityIndex(ttl=float(os.getenv("AvailabilityIndexTTL", "60")))
+    return _index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and lookup time of the availability index")
+    parser.add_argument("--caregivers", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--fill", type=float, default=0.5, help="share of slots available")
+    args = parser.parse_args()
+
+    index = AvailabilityIndex(ttl=float("inf"))
+    index._loaded_at = time.monotonic()
+    start_date = datetime.date(2027, 1, 1)
+    dates = [start_date + datetime.timedelta(days=d) for d in range(args.days)]
+    for c in range(args.caregivers):
+        index.add(f"caregiver{c}", [d for d in dates if random.random() < args.fill])
+    print(f"{args.caregivers} caregivers x {args.days} days: {index.memory_bytes() / 1024:.0f} KiB")
+
+    runs = 1000
+    start = time.perf_counter()
+    for _ in range(runs):
+        index.counts(dates[0], dates[-1])
+    print(f"counts over {args.days} days: {(time.perf_counter() - start) * 1000 / runs:.3f} ms")
+    start = time.perf_counter()
+    for _ in range(runs):
+        index.caregivers(random.choice(dates))
+    print(f"caregivers on one day: {(time.perf_counter() - start) * 1000 / runs:.3f} ms")
+
+    policy = get_assignment_policy()
+    start = time.perf_counter()
+    for _ in range(runs):
+        date = random.choice(dates)
+        index.add(index.take(date, policy), [date])
+    print(f"{policy.name} pick on one day: {(time.perf_counter() - start) * 1000 / runs:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from util.Metrics import get_metrics
+from util.PasswordHash import PasswordHash
+
+
+class VerifierBusyError(Exception):
+    pass
+
+
+def _verify(password, salt, stored_hash):
+    started = time.monotonic()
+    ok = PasswordHash.decode(stored_hash, salt).matches(password)
+    return ok, started, time.monotonic() - started
+
+
+def _hash(password):
+    started = time.monotonic()
+    password_hash = PasswordHash.create(password)
+    return password_hash, started, time.monotonic() - started
+
+
+class CredentialVerifier:
+    """
+    Checks passwords against stored Salt/Hash pairs, and hashes new passwords,
+    in a process pool, so the key derivation neither holds a DB connection nor
+    the GIL of the caller.
+
+    At most max_pending verifications are queued or running at once. verify()
+    waits up to queue_timeout for a slot, verify_async() fails fast with
+    VerifierBusyError. Time spent waiting for a worker and time spent hashing
+    are tracked separately.
+    """
+
+    def __init__(self, workers=None, max_pending=64, queue_timeout=30.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+        # stats
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_seconds = 0.0
+        self.queue_seconds_max = 0.0
+        self.hash_seconds = 0.0
+        self.hash_seconds_max = 0.0
+
+    def verify(self, password, salt, stored_hash):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._reject()
+        return self._submit(_verify, password, salt, stored_hash).result()
+
+    async def verify_async(self, password, salt, stored_hash):
+        import asyncio
+
+        if not self._slots.acquire(blocking=False):
+            self._reject()
+        return await asyncio.wrap_future(self._submit(_verify, password, salt, stored_hash))
+
+    # Return a new PasswordHash for password with the configured algorithm and cost
+    def hash_password(self, password):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._reject()
+        return self._submit(_hash, password).result()
+
+    def stats(self):
+        with self._lock:
+            n = self.completed
+            return {
+                "completed": n,
+                "rejected": self.rejected,
+                "pending": self.pending,
+                "queue_ms_avg": 1000 * self.queue_seconds / n if n else 0.0,
+                "queue_ms_max": 1000 * self.queue_seconds_max,
+                "hash_ms_avg": 1000 * self.hash_seconds / n if n else 0.0,
+                "hash_ms_max": 1000 * self.hash_seconds_max,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    # Called with a slot held; the slot is released when the verification finishes
+    def _submit(self, fn, *args):
+        submitted = time.monotonic()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.pending += 1
+        result = Future()
+
+        def done(f):
+            with self._lock:
+                self.pending -= 1
+            self._slots.release()
+            try:
+                value, started, hash_seconds = f.result()
+            except BaseException as e:
+                result.set_exception(e)
+                return
+            self._record(fn.__name__.lstrip("_"), started - submitted, hash_seconds)
+            result.set_result(value)
+
+        future.add_done_callback(done)
+        return result
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn rather than fork: the verifier is used from multi-threaded front ends
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _record(self, op, queue_seconds, hash_seconds):
+        metrics = get_metrics()
+        metrics.histogram("scheduler_password_queue_seconds", op=op).observe(max(queue_seconds, 0.0))
+        metrics.histogram("scheduler_password_hash_seconds", op=op).observe(hash_seconds)
+        with self._lock:
+            self.completed += 1
+            self.queue_seconds += max(queue_seconds, 0.0)
+            self.queue_seconds_max = max(self.queue_seconds_max, queue_seconds)
+            self.hash_seconds += hash_seconds
+            self.hash_seconds_max = max(self.hash_seconds_max, hash_seconds)
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+        raise VerifierBusyError("Too many logins in progress, please try again")
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+# Return the process-wide verifier, sized by the "HashWorkers" environment variable
+def get_verifier():
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                workers = os.getenv("HashWorkers")
+                _verifier = CredentialVerifier(workers=int(workers) if workers else None)
+                atexit.register(_verifier.shutdown)
+    return _verifier
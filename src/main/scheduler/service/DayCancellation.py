@@ -0,0 +1,109 @@
+import argparse
+import datetime
+import sys
+import time
+from db.AssignmentPolicy import get_assignment_policy
+from db.Backend import get_backend
+from db.ConnectionManager import ConnectionManager
+from service.AvailabilityIndex import get_availability_index
+from service.DoseAllocator import get_dose_allocator
+from service.InventoryCache import get_inventory_cache
+
+
+class DayCancellationReport:
+    def __init__(self, caregiver_name, date_from, date_to):
+        self.caregiver_name = caregiver_name
+        self.date_from = date_from
+        self.date_to = date_to
+        self.availabilities_removed = 0
+        # [(appointment_id, new caregiver, date)]
+        self.moved = []
+        # [(appointment_id, patient, date, lease_id the dose went back to or None)]
+        self.canceled = []
+        self.elapsed = 0.0
+
+    def __str__(self):
+        return (f"{self.caregiver_name} off {self.date_from:%m-%d-%Y} to {self.date_to:%m-%d-%Y} in "
+                f"{self.elapsed * 1000:.1f} ms: {self.availabilities_removed} availabilities removed, "
+                f"{len(self.moved)} appointments reassigned, {len(self.canceled)} canceled")
+
+
+class DayCancellation:
+    """
+    Takes a caregiver off a range of days, e.g. when they call out sick.
+
+    Their availability on those days is deleted and their appointments are
+    moved to other caregivers free on the same day, picked by the assignment
+    policy; appointments no one is free for are canceled and their doses
+    returned. Everything happens in one transaction with a fixed number of
+    statements, see Backend.cancel_caregiver_days.
+    """
+
+    def __init__(self, policy=None):
+        self.policy = policy or get_assignment_policy()
+
+    def cancel(self, caregiver_name, date_from, date_to=None):
+        date_to = date_to or date_from
+        report = DayCancellationReport(caregiver_name, date_from, date_to)
+        start = time.perf_counter()
+
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+        try:
+            report.availabilities_removed, report.moved, report.canceled = get_backend().cancel_caregiver_days(
+                cursor, caregiver_name, date_from, date_to, self.policy)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cm.close_connection()
+        report.elapsed = time.perf_counter() - start
+
+        if report.canceled:
+            get_inventory_cache().invalidate()
+        allocator = get_dose_allocator()
+        if allocator is not None:
+            for _, _, _, lease_id in report.canceled:
+                if lease_id is not None:
+                    allocator.returned(lease_id)
+        index = get_availability_index()
+        if index is not None:
+            day = date_from
+            while day <= date_to:
+                index.remove(caregiver_name, day)
+                day += datetime.timedelta(days=1)
+            for _, new_caregiver, date in report.moved:
+                index.remove(new_caregiver, date)
+                index.appointment_added(new_caregiver)
+            index.appointment_added(caregiver_name, -len(report.moved) - len(report.canceled))
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Take a caregiver off a range of days, reassigning their appointments")
+    parser.add_argument("caregiver")
+    parser.add_argument("date_from", help="mm-dd-yyyy")
+    parser.add_argument("date_to", nargs="?", help="mm-dd-yyyy, the first date by default")
+    args = parser.parse_args()
+
+    try:
+        date_from = datetime.datetime.strptime(args.date_from, "%m-%d-%Y").date()
+        date_to = datetime.datetime.strptime(args.date_to or args.date_from, "%m-%d-%Y").date()
+    except ValueError:
+        parser.error("dates must be mm-dd-yyyy")
+    if date_to < date_from:
+        parser.error("the end date must not be before the start date")
+
+    report = DayCancellation().cancel(args.caregiver, date_from, date_to)
+    for appointment_id, new_caregiver, date in report.moved:
+        print(f"reassigned {appointment_id} on {date:%m-%d-%Y} to {new_caregiver}")
+    for appointment_id, patient_name, date, _ in report.canceled:
+        print(f"canceled {appointment_id} of {patient_name} on {date:%m-%d-%Y}")
+    print(report)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+import argparse
+import atexit
+import datetime
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from db.ConnectionManager import ConnectionManager
+from db.Queries import Queries
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class Lease:
+    def __init__(self, lease_id, vaccine, remaining, expires_at):
+        self.lease_id = lease_id
+        self.vaccine = vaccine
+        # doses of the lease this instance has not handed out yet
+        self.remaining = remaining
+        self.expires_at = expires_at
+        # monotonic time the lease stopped being used, None while in use
+        self.retired_at = None
+
+
+class DoseAllocator:
+    """
+    Hands out doses from blocks leased from Vaccines, so bookings in this
+    instance do not all update the same Vaccines row.
+
+    A lease moves up to block_size doses from Vaccines.Doses into a DoseLeases
+    row owned by this instance. Bookings record the lease in Reserve.lease_id
+    instead of decrementing Doses and the lease row is never updated, so what
+    is left of a lease is always Granted minus the bookings against it.
+    Closing a lease moves that remainder back into Doses.
+
+    A lease is used for at most half of ttl and closed once it is used up or
+    too old, and at shutdown. Leases of an instance that died are closed by
+    the next instance leasing the same vaccine once they expire.
+    """
+
+    # seconds a retired lease is kept open for bookings already in flight
+    close_grace = 1.0
+
+    def __init__(self, block_size, ttl=300.0, instance=None):
+        self.block_size = block_size
+        self.ttl = ttl
+        self.instance = instance or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # lease id -> Lease, for the leases this instance holds
+        self._leases = {}
+        # vaccine -> lock held while leasing a block of it
+        self._acquiring = {}
+        self._lock = threading.Lock()
+
+        # stats
+        self.acquired = 0
+        self.closed = 0
+        self.reclaimed = 0
+
+    # Take one dose of vaccine; returns the id of the lease to book it against,
+    # or None when no doses are left to lease
+    def take(self, vaccine):
+        lease_id = self._take_local(vaccine)
+        if lease_id is not None:
+            return lease_id
+
+        # one thread leases the next block, the others wait for it
+        with self._lock:
+            acquiring = self._acquiring.setdefault(vaccine, threading.Lock())
+        with acquiring:
+            lease_id = self._take_local(vaccine)
+            if lease_id is not None:
+                return lease_id
+            lease = self._acquire(vaccine)
+            if lease is None:
+                return None
+            with self._lock:
+                lease.remaining -= 1
+                self._leases[lease.lease_id] = lease
+            return lease.lease_id
+
+    # The dose taken from lease_id was not booked after all
+    def give_back(self, lease_id):
+        with self._lock:
+            lease = self._leases.get(lease_id)
+            if lease is not None and lease.retired_at is None:
+                lease.remaining += 1
+
+    # A booking against lease_id was canceled while the lease was open, so its dose is back in the lease
+    def returned(self, lease_id):
+        self.give_back(lease_id)
+
+    # The lease was closed under this instance, e.g. after it expired
+    def drop(self, lease_id):
+        with self._lock:
+            self._leases.pop(lease_id, None)
+
+    # Close every lease of this instance, returning their doses to Vaccines
+    def release_all(self):
+        with self._lock:
+            lease_ids = list(self._leases)
+            self._leases.clear()
+        self._close_leases(lease_ids)
+
+    def stats(self):
+        with self._lock:
+            held = {}
+            for lease in self._leases.values():
+                if lease.retired_at is None:
+                    held[lease.vaccine] = held.get(lease.vaccine, 0) + lease.remaining
+            return {
+                "leases": len(self._leases),
+                "doses_held": held,
+                "acquired": self.acquired,
+                "closed": self.closed,
+                "reclaimed": self.reclaimed,
+            }
+
+    def _take_local(self, vaccine):
+        with self._lock:
+            lease = self._usable(vaccine)
+            if lease is None:
+                return None
+            lease.remaining -= 1
+            return lease.lease_id
+
+    # Called with the lock held
+    def _usable(self, vaccine):
+        now = _utcnow()
+        found = None
+        for lease in self._leases.values():
+            if lease.vaccine != vaccine or lease.retired_at is not None:
+                continue
+            if lease.remaining <= 0 or lease.expires_at - now < datetime.timedelta(seconds=self.ttl / 2):
+                lease.retired_at = time.monotonic()
+            elif found is None:
+                found = lease
+        return found
+
+    def _acquire(self, vaccine):
+        self._close_leases(self._retired(vaccine))
+        self.reclaim_expired(vaccine)
+
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+        try:
+            # Doses only changes through conditional updates, so retry if it moved under us
+            for _ in range(3):
+                cursor.execute(Queries.vaccine_get, vaccine)
+                row = cursor.fetchone()
+                if row is None or row[1] <= 0:
+                    return None
+                granted = min(self.block_size, row[1])
+                cursor.execute(Queries.dose_lease_take, (granted, vaccine, granted))
+                if cursor.rowcount != 1:
+                    conn.rollback()
+                    continue
+                lease = Lease(uuid.uuid4().hex, vaccine, granted,
+                              _utcnow() + datetime.timedelta(seconds=self.ttl))
+                cursor.execute(Queries.dose_lease_insert,
+                               (lease.lease_id, self.instance, vaccine, granted, lease.expires_at))
+                conn.commit()
+                with self._lock:
+                    self.acquired += 1
+                return lease
+            return None
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cm.close_connection()
+
+    # Retired leases of vaccine past their grace period, removed from this instance
+    def _retired(self, vaccine):
+        cutoff = time.monotonic() - self.close_grace
+        with self._lock:
+            lease_ids = [lease.lease_id for lease in self._leases.values()
+                         if lease.vaccine == vaccine and lease.retired_at is not None and lease.retired_at < cutoff]
+            for lease_id in lease_ids:
+                del self._leases[lease_id]
+        return lease_ids
+
+    # Close the expired leases of vaccine, whichever instance holds them
+    def reclaim_expired(self, vaccine=None):
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+        try:
+            now = _utcnow()
+            if vaccine is None:
+                cursor.execute(Queries.dose_leases_expired, now)
+            else:
+                cursor.execute(Queries.dose_leases_expired_of_vaccine, (vaccine, now))
+            lease_ids = [row[0] for row in cursor.fetchall()]
+        finally:
+            cm.close_connection()
+        self._close_leases(lease_ids)
+        with self._lock:
+            self.reclaimed += len(lease_ids)
+        return lease_ids
+
+    def _close_leases(self, lease_ids):
+        if not lease_ids:
+            return
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+        try:
+            for lease_id in lease_ids:
+                close_lease(cursor, lease_id)
+                conn.commit()
+                with self._lock:
+                    self.closed += 1
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cm.close_connection()
+
+
+# Close lease_id inside the cursor's transaction, moving its unused doses back
+# into Vaccines; returns how many were moved. The lease row is deleted before
+# its bookings are counted, so bookings still checking for it either finish
+# first and are counted or find it gone.
+def close_lease(cursor, lease_id):
+    cursor.execute(Queries.dose_lease_get, lease_id)
+    row = cursor.fetchone()
+    if row is None:
+        return 0
+    vaccine, granted = row[0], row[1]
+    cursor.execute(Queries.dose_lease_delete, lease_id)
+    if cursor.rowcount != 1:
+        return 0
+    cursor.execute(Queries.dose_lease_bookings, lease_id)
+    unused = granted - cursor.fetchone()[0]
+    if unused:
+        cursor.execute(Queries.dose_lease_return, (unused, vaccine))
+    return unused
+
+
+# Check Doses + leased + reserved = TotalAdded for every vaccine in one statement;
+# returns one dict per vaccine with the terms and whether they add up
+def reconcile(cursor):
+    cursor.execute(Queries.dose_reconcile)
+    return [{
+        "vaccine": name,
+        "total_added": total_added,
+        "doses": doses,
+        "leased": leased,
+        "reserved": reserved,
+        "ok": doses + leased + reserved == total_added,
+    } for name, total_added, doses, leased, reserved in cursor.fetchall()]
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+# Return the process-wide allocator, or None when leasing is off. "DoseLeaseSize"
+# sets the doses per lease (0, the default, books straight from Vaccines) and
+# "DoseLeaseTTL" the lease lifetime in seconds.
+def get_dose_allocator():
+    global _allocator
+    if _allocator is None:
+        size = int(os.getenv("DoseLeaseSize", "0"))
+        if size <= 0:
+            return None
+        with _allocator_lock:
+            if _allocator is None:
+                allocator = DoseAllocator(size, ttl=float(os.getenv("DoseLeaseTTL", "300")))
+                atexit.register(allocator.release_all)
+                _allocator = allocator
+    return _allocator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every dose is in stock, leased or reserved")
+    parser.add_argument("--reclaim", action="store_true", help="first close leases that have expired")
+    args = parser.parse_args()
+
+    if args.reclaim:
+        closed = DoseAllocator(1).reclaim_expired()
+        print(f"closed {len(closed)} expired leases")
+
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    try:
+        rows = reconcile(conn.cursor())
+    finally:
+        cm.close_connection()
+    for row in rows:
+        print(f"{'ok' if row['ok'] else 'MISMATCH'} {row['vaccine']}: {row['doses']} in stock + {row['leased']} leased "
+              f"+ {row['reserved']} reserved, {row['total_added']} added")
+    sys.exit(0 if all(row["ok"] for row in rows) else 1)
+
+
+if __name__ == "__main__":
+    main()
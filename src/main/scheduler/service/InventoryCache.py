@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+from db.ConnectionManager import ConnectionManager
+from db.Queries import Queries
+
+
+class InventoryCache:
+    """
+    Read-through cache of the Vaccines table for display paths such as
+    search_caregiver_schedule.
+
+    Every write to Vaccines in this process calls invalidate(), which bumps the
+    version; an entry is served only while its version is current and it is
+    younger than ttl seconds, so writes made by other processes show up after
+    at most ttl. Reservations never consult the cache: the dose check runs
+    inside the booking transaction.
+    """
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self.version = 0
+        # (version, loaded_at, rows) of the last load
+        self._entry = None
+        self._lock = threading.Lock()
+
+        # stats
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self.invalidations += 1
+            self._entry = None
+
+    # Return [(name, doses)] for every vaccine, ordered by name
+    def vaccines(self):
+        with self._lock:
+            entry = self._entry
+            version = self.version
+            if entry is not None and entry[0] == version and time.monotonic() - entry[1] < self.ttl:
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        rows = self._load()
+        with self._lock:
+            # a write that raced with the load bumped the version, so this entry is never served
+            self._entry = (version, time.monotonic(), rows)
+        return rows
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+    def _load(self):
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+
+        try:
+            # doses in stock plus those still unused in dose leases (service/DoseAllocator.py)
+            cursor.execute(Queries.vaccine_inventory)
+            return [(row[0], row[1]) for row in cursor.fetchall()]
+        finally:
+            cm.close_connection()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Return the process-wide cache; "InventoryCacheTTL" sets the TTL in seconds
+def get_inventory_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = InventoryCache(ttl=float(os.getenv("InventoryCacheTTL", "5")))
+    return _cache
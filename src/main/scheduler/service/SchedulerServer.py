@@ -0,0 +1,84 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from model.Session import Session
+
+
+class SchedulerServer:
+    """
+    Line protocol server for the scheduler commands.
+
+    Each client sends one command per line, exactly as typed at the prompt, and
+    gets back one JSON line per command in the format of script mode. Every
+    client has its own Session, so many users can be logged in at once; a
+    client's commands run one at a time and in order, "quit" closes it.
+
+    Handlers block on the database and on password hashing, so they run in a
+    pool of worker threads. At most max_in_flight commands are submitted at
+    once across all clients; the rest wait on the event loop instead of piling
+    up in the executor queue.
+    """
+
+    def __init__(self, execute, host="127.0.0.1", port=8765, workers=8, max_in_flight=None):
+        self.execute = execute
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_in_flight = max_in_flight or workers * 2
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scheduler")
+
+        # stats
+        self.clients = 0
+        self.commands = 0
+        self.errors = 0
+
+    async def serve(self, ready=None):
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        print(f"Listening on {self.host}:{self.port}")
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    async def handle_client(self, reader, writer):
+        session = Session()
+        self.clients += 1
+        loop = asyncio.get_running_loop()
+        number = 0
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                number += 1
+                line = line.decode("utf-8", "replace").strip()
+                if not line or line.startswith("#"):
+                    continue
+                tokens = line.split(" ")
+                if tokens[0].lower() == "quit":
+                    break
+
+                async with self._in_flight:
+                    result = await loop.run_in_executor(self._executor, self.execute, session, tokens, number)
+                self.commands += 1
+                if result["status"] != "ok":
+                    self.errors += 1
+                writer.write((json.dumps(result) + "\n").encode("utf-8"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    def stats(self):
+        return {
+            "clients": self.clients,
+            "commands": self.commands,
+            "errors": self.errors,
+        }
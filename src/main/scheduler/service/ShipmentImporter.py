@@ -0,0 +1,78 @@
+import csv
+import time
+from db.Backend import get_backend
+from db.ConnectionManager import ConnectionManager
+from service.InventoryCache import get_inventory_cache
+
+
+class ShipmentReport:
+    def __init__(self):
+        self.rows = 0
+        # [(vaccine, doses before, doses after)] ordered by vaccine
+        self.vaccines = []
+        self.elapsed = 0.0
+
+    def __str__(self):
+        added = sum(after - before for _, before, after in self.vaccines)
+        return (f"{self.rows} rows in {self.elapsed:.2f}s: {added} doses added to "
+                f"{len(self.vaccines)} vaccines")
+
+
+class ShipmentImporter:
+    """
+    Adds a shipment of doses to Vaccines.
+
+    A manifest is a CSV file of "vaccine,doses" lines, with an optional header
+    line; a vaccine listed more than once gets the sum. The whole manifest is
+    checked before anything is written and then applied in one transaction
+    with Backend.add_doses, so it is added completely or not at all and
+    concurrent shipments and bookings only ever add to or take from the counts.
+    """
+
+    def import_file(self, path):
+        with open(path, newline="") as f:
+            return self.import_rows(csv.reader(f))
+
+    # Raises ValueError naming the first bad line
+    def import_rows(self, rows):
+        report = ShipmentReport()
+        start = time.perf_counter()
+        shipment = {}
+        for number, row in enumerate(rows, 1):
+            if not row or not "".join(row).strip():
+                continue
+            if report.rows == 0 and [c.strip().lower() for c in row] == ["vaccine", "doses"]:
+                continue
+            report.rows += 1
+            if len(row) != 2 or not row[0].strip():
+                raise ValueError(f"line {number}: expected vaccine,doses")
+            vaccine_name = row[0].strip()
+            try:
+                doses = int(row[1])
+            except ValueError:
+                raise ValueError(f"line {number}: {row[1].strip()!r} is not a number of doses") from None
+            if doses <= 0:
+                raise ValueError(f"line {number}: the number of doses must be positive")
+            shipment[vaccine_name] = shipment.get(vaccine_name, 0) + doses
+        report.vaccines = self.apply(shipment)
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    # Add doses for every vaccine -> doses of shipment in one transaction;
+    # returns [(vaccine, doses before, doses after)] ordered by vaccine
+    def apply(self, shipment):
+        if not shipment:
+            return []
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+        try:
+            changed = get_backend().add_doses(cursor, sorted(shipment.items()))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cm.close_connection()
+        get_inventory_cache().invalidate()
+        return changed
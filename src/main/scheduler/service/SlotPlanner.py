@@ -0,0 +1,230 @@
+import argparse
+import datetime
+import sys
+import time
+from db.AssignmentPolicy import get_assignment_policy
+from db.Backend import DBError, get_backend
+from db.ConnectionManager import ConnectionManager
+from db.Queries import Queries
+from service.AvailabilityIndex import get_availability_index
+from service.InventoryCache import get_inventory_cache
+from util.MaxFlow import MaxFlow
+
+
+class SlotPlan:
+    def __init__(self, date_from, date_to):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.requests = 0
+        self.slots = 0
+        # [(waitlist_id, patient, vaccine, caregiver, date)] ordered by waitlist_id
+        self.booked = []
+        # what booking the requests one by one, earliest day first, would have booked
+        self.greedy = 0
+        self.plan_elapsed = 0.0
+        self.commit_elapsed = 0.0
+
+    def __str__(self):
+        used = 100.0 * len(self.booked) / self.slots if self.slots else 0.0
+        return (f"{self.date_from:%m-%d-%Y} to {self.date_to:%m-%d-%Y}: {len(self.booked)} of {self.requests} "
+                f"requests booked into {self.slots} slots ({used:.1f}% used, greedy {self.greedy}), "
+                f"planned in {self.plan_elapsed * 1000:.1f} ms, committed in {self.commit_elapsed * 1000:.1f} ms")
+
+
+class SlotPlanner:
+    """
+    Books the waitlist for a day or a week at once.
+
+    Requests that accept several days and limited doses make booking one
+    request at a time strand slots: an early flexible request takes the only
+    day a later request could use. The planner solves the whole range as a
+    maximum flow instead (source -> vaccine, capped by its doses -> request
+    class -> each day the class accepts -> sink, capped by the free slots of
+    the day). Requests with the same vaccine and days form one class, so the
+    graph has a few hundred nodes however many requests there are; within a
+    class the oldest requests are booked first, and on each day the oldest
+    requests get the caregivers the assignment policy ranks first.
+
+    With fair=True no request is passed over for a newer one: requests are
+    added oldest first whenever one more augmenting path exists, moving the
+    requests booked before to other days they accept as needed. That books
+    more than one request at a time would, but fewer than the maximum when
+    the doses of a popular vaccine go to its oldest requests rather than to
+    the ones the other vaccines cannot cover.
+    """
+
+    def __init__(self, policy=None, fair=False):
+        self.policy = policy or get_assignment_policy()
+        self.fair = fair
+
+    # Plan and book the waitlist from date_from to date_to in one transaction;
+    # with commit=False the plan is only computed
+    def run(self, date_from, date_to=None, commit=True):
+        date_to = date_to or date_from
+        report = SlotPlan(date_from, date_to)
+        today = datetime.date.today()
+        # on MSSQL the tables are read without locks, and the booking fails when they changed since
+        for _ in range(3):
+            cm = ConnectionManager()
+            conn = cm.create_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute(Queries.waitlist_expire, today)
+                # the requests accepting a day of the range that is not before today, as the matcher books them
+                first_day = max(date_from, today)
+                cursor.execute(Queries.waitlist_in_range, (date_to, first_day))
+                requests = [(waitlist_id, patient_name, vaccine_name, max(first, first_day),
+                             min(last or first, date_to))
+                            for waitlist_id, patient_name, vaccine_name, first, last in cursor.fetchall()]
+                requests = [request for request in requests if request[3] <= request[4]]
+                cursor.execute(Queries.vaccine_doses)
+                doses = {vaccine_name: count for vaccine_name, count in cursor.fetchall()}
+                slots = get_backend().free_slots(cursor, first_day, date_to, self.policy)
+
+                start = time.perf_counter()
+                report.booked = self.plan(requests, slots, doses)
+                report.plan_elapsed = time.perf_counter() - start
+                report.requests, report.slots = len(requests), len(slots)
+                report.greedy = len(self.greedy(requests, slots, doses))
+
+                if not commit or not report.booked:
+                    conn.rollback()
+                    return report
+                start = time.perf_counter()
+                booked = get_backend().book_plan(cursor, report.booked)
+                if booked:
+                    conn.commit()
+                    report.commit_elapsed = time.perf_counter() - start
+                    self._booked(report.booked)
+                    return report
+                conn.rollback()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                cm.close_connection()
+        raise DBError("The waitlist or the availability kept changing while planning, please try again")
+
+    # Assign requests [(waitlist_id, patient, vaccine, first day, last day)] to
+    # slots [(date, caregiver)] (ordered by date, then policy) using doses
+    # {vaccine: doses}; returns [(waitlist_id, patient, vaccine, caregiver, date)]
+    def plan(self, requests, slots, doses):
+        days = {}
+        for date, caregiver_name in slots:
+            days.setdefault(date, []).append(caregiver_name)
+        classes = {}
+        for request in sorted(requests):
+            _, _, vaccine_name, first, last = request
+            if doses.get(vaccine_name, 0) > 0:
+                classes.setdefault((vaccine_name, first, last), []).append(request)
+        vaccine_names = sorted({vaccine_name for vaccine_name, _, _ in classes})
+
+        # nodes: source, sink, vaccines, classes, days
+        source, sink = 0, 1
+        vaccine_node = {name: 2 + i for i, name in enumerate(vaccine_names)}
+        class_node = {key: 2 + len(vaccine_names) + i for i, key in enumerate(classes)}
+        day_node = {date: 2 + len(vaccine_names) + len(classes) + i for i, date in enumerate(days)}
+        graph = MaxFlow(2 + len(vaccine_names) + len(classes) + len(days))
+
+        for name in vaccine_names:
+            graph.add_edge(source, vaccine_node[name], doses[name])
+        for date, caregivers in days.items():
+            graph.add_edge(day_node[date], sink, len(caregivers))
+        class_edge, day_edges = {}, {}
+        for key, members in classes.items():
+            vaccine_name, first, last = key
+            # fair mode opens a class one request at a time
+            class_edge[key] = graph.add_edge(vaccine_node[vaccine_name], class_node[key],
+                                             0 if self.fair else len(members))
+            day_edges[key] = [(date, graph.add_edge(class_node[key], day_node[date], len(members)))
+                              for date in sorted(days) if first <= date <= last]
+
+        if self.fair:
+            closed = set()
+            for request in sorted(requests):
+                key = request[2:]
+                if key not in classes or key in closed:
+                    continue
+                graph.add_capacity(class_edge[key], 1)
+                if not graph.augment(source, sink):
+                    # a class that cannot grow stays closed, so each class fails once
+                    graph.add_capacity(class_edge[key], -1)
+                    closed.add(key)
+        else:
+            graph.max_flow(source, sink)
+
+        # the oldest requests of a class go to its days in date order
+        chosen = []
+        for key, members in classes.items():
+            position = 0
+            for date, edge in day_edges[key]:
+                for request in members[position:position + graph.flow(edge)]:
+                    chosen.append((request, date))
+                position += graph.flow(edge)
+        chosen.sort()
+        next_caregiver = {date: 0 for date in days}
+        plan = []
+        for (waitlist_id, patient_name, vaccine_name, _, _), date in chosen:
+            plan.append((waitlist_id, patient_name, vaccine_name, days[date][next_caregiver[date]], date))
+            next_caregiver[date] += 1
+        return plan
+
+    # Book the requests one by one, oldest first, on the earliest day they
+    # accept that still has a slot, as repeated reserve calls would
+    @staticmethod
+    def greedy(requests, slots, doses):
+        free = {}
+        for date, caregiver_name in slots:
+            free.setdefault(date, []).append(caregiver_name)
+        days = sorted(free)
+        left = dict(doses)
+        next_caregiver = {date: 0 for date in days}
+        plan = []
+        for waitlist_id, patient_name, vaccine_name, first, last in sorted(requests):
+            if left.get(vaccine_name, 0) <= 0:
+                continue
+            for date in days:
+                if first <= date <= last and next_caregiver[date] < len(free[date]):
+                    plan.append((waitlist_id, patient_name, vaccine_name, free[date][next_caregiver[date]], date))
+                    next_caregiver[date] += 1
+                    left[vaccine_name] -= 1
+                    break
+        return plan
+
+    # Let the caches of this process know about the committed bookings
+    def _booked(self, plan):
+        get_inventory_cache().invalidate()
+        index = get_availability_index()
+        for _, _, _, caregiver_name, date in plan:
+            self.policy.assigned(caregiver_name)
+            if index is not None:
+                index.remove(caregiver_name, date)
+                index.appointment_added(caregiver_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Book the waitlist for a range of days as a maximum matching")
+    parser.add_argument("date_from", help="mm-dd-yyyy")
+    parser.add_argument("date_to", nargs="?", help="mm-dd-yyyy, the first date by default")
+    parser.add_argument("--fair", action="store_true", help="book the oldest requests first among maximum plans")
+    parser.add_argument("--dry-run", action="store_true", help="only print the plan")
+    args = parser.parse_args()
+
+    try:
+        date_from = datetime.datetime.strptime(args.date_from, "%m-%d-%Y").date()
+        date_to = datetime.datetime.strptime(args.date_to or args.date_from, "%m-%d-%Y").date()
+    except ValueError:
+        parser.error("dates must be mm-dd-yyyy")
+    if date_to < date_from:
+        parser.error("the end date must not be before the start date")
+
+    report = SlotPlanner(fair=args.fair).run(date_from, date_to, commit=not args.dry_run)
+    for waitlist_id, patient_name, vaccine_name, caregiver_name, date in report.booked:
+        print(f"{'would book' if args.dry_run else 'booked'} {waitlist_id}: {patient_name} {vaccine_name} "
+              f"on {date:%m-%d-%Y} with {caregiver_name}")
+    print(report)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
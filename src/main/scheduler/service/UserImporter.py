@@ -0,0 +1,139 @@
+import csv
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from db.Backend import get_backend
+from db.ConnectionManager import ConnectionManager
+from util.PasswordHash import PasswordHash
+from util.Util import Util
+
+
+# role in the CSV -> table holding that kind of user
+tables = {
+    "patient": "Patients",
+    "caregiver": "Caregivers",
+}
+
+
+def _hash_password(password):
+    password_hash = PasswordHash.create(password)
+    return password_hash.salt, password_hash.encode()
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.existing = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.elapsed = 0.0
+
+    def throughput(self):
+        return self.created / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (f"{self.rows} rows in {self.elapsed:.2f}s: {self.created} created, "
+                f"{self.existing} already existed, {self.duplicates} duplicates, {self.invalid} invalid "
+                f"({self.throughput():.1f} users/s)")
+
+
+class UserImporter:
+    """
+    Bulk creation of patients and caregivers from a CSV file.
+
+    Each line is "role,username,password" with role being patient or caregiver;
+    a header line is skipped. The file is streamed in batches: every batch checks
+    which usernames already exist with a single query, hashes the new
+    passwords in a process pool across all cores and inserts the users in one
+    transaction. A username taken by someone else between the check and the
+    insert is skipped and counted as already existing.
+    """
+
+    def __init__(self, batch_size=500, workers=None, progress=None):
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        # called with the running ImportReport after every batch
+        self.progress = progress
+
+    def import_file(self, path):
+        with open(path, newline="") as f:
+            return self.import_rows(csv.reader(f))
+
+    def import_rows(self, rows):
+        report = ImportReport()
+        start = time.perf_counter()
+        seen = set()
+        batch = []
+        # spawned like the CredentialVerifier pool: forking copies the parent's threads and open connections
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            for row in rows:
+                if not row or (report.rows == 0 and [c.strip().lower() for c in row] == ["role", "username", "password"]):
+                    continue
+                report.rows += 1
+                if len(row) != 3 or row[0].strip().lower() not in tables or Util.password_problem(row[2]) is not None:
+                    report.invalid += 1
+                    continue
+                role, username, password = row[0].strip().lower(), row[1].strip(), row[2]
+                if (role, username) in seen:
+                    report.duplicates += 1
+                    continue
+                seen.add((role, username))
+                batch.append((role, username, password))
+                if len(batch) >= self.batch_size:
+                    self._import_batch(executor, batch, report, start)
+                    batch = []
+            if batch:
+                self._import_batch(executor, batch, report, start)
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    def _import_batch(self, executor, batch, report, start):
+        existing = self._existing_usernames(batch)
+        new_users = [(role, username, password) for role, username, password in batch
+                     if (role, username) not in existing]
+        report.existing += len(batch) - len(new_users)
+
+        # no connection is held while the pool hashes
+        chunksize = max(1, len(new_users) // (self.workers * 4))
+        hashes = executor.map(_hash_password, [password for _, _, password in new_users], chunksize=chunksize)
+        rows = {role: [] for role in tables}
+        for (role, username, _), (salt, hash) in zip(new_users, hashes):
+            rows[role].append((username, salt, hash))
+
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+
+        created = 0
+        try:
+            for role, table in tables.items():
+                if rows[role]:
+                    created += get_backend().insert_users(cursor, table, rows[role])
+            conn.commit()
+        finally:
+            cm.close_connection()
+        report.created += created
+        report.existing += len(new_users) - created
+
+        report.elapsed = time.perf_counter() - start
+        if self.progress is not None:
+            self.progress(report)
+
+    # Usernames of the batch that are already taken, as (role, username) pairs
+    def _existing_usernames(self, batch):
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+
+        existing = set()
+        try:
+            for role, table in tables.items():
+                usernames = [username for r, username, _ in batch if r == role]
+                if usernames:
+                    taken = get_backend().existing_users(cursor, table, usernames)
+                    existing.update((role, username) for username in taken)
+        finally:
+            cm.close_connection()
+        return existing
@@ -0,0 +1,183 @@
+import argparse
+import datetime
+import os
+import sys
+import threading
+import time
+from db.AssignmentPolicy import get_assignment_policy
+from db.Backend import get_backend
+from db.ConnectionManager import ConnectionManager
+from db.Queries import Queries
+from service.AvailabilityIndex import get_availability_index
+from service.InventoryCache import get_inventory_cache
+from util.Metrics import get_metrics
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class WaitlistMatcher:
+    """
+    Books waitlisted requests when slots or doses free up.
+
+    reserve --waitlist enqueues a request it could not book instead of leaving
+    the patient to retry. Uploads, cancellations and added doses then run a
+    matching pass: batches of the oldest requests are booked first come, first
+    served with Backend.match_waitlist, one transaction per batch, until a batch
+    books nothing. Passes only see the slots and doses in the database, so
+    another process's changes are picked up by its own passes or by
+    python -m service.WaitlistMatcher.
+    """
+
+    def __init__(self, batch_size=500, policy=None):
+        self.batch_size = batch_size
+        self.policy = policy or get_assignment_policy()
+        self._lock = threading.Lock()
+        self._enqueued = 0
+        self._matched = 0
+        self._passes = 0
+        self._last_depth = 0
+
+    # Queue the request, which accepts any day from date to latest if given;
+    # returns its place among the requests waiting for a day it accepts, or None for an unknown vaccine
+    def enqueue(self, patient_name, vaccine_name, date, latest=None):
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(Queries.waitlist_insert, (patient_name, date, latest, _utcnow(), vaccine_name,
+                                                     patient_name, vaccine_name, date))
+            added = cursor.rowcount == 1
+            cursor.execute(Queries.waitlist_find, (patient_name, vaccine_name, date))
+            waitlist_id = cursor.fetchone()[0]
+            position = 0
+            if waitlist_id is not None:
+                cursor.execute(Queries.waitlist_position, waitlist_id)
+                position = cursor.fetchone()[0]
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cm.close_connection()
+        if added:
+            with self._lock:
+                self._enqueued += 1
+        return position or None
+
+    # Requests still waiting for today or later
+    def depth(self):
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(Queries.waitlist_depth, datetime.date.today())
+            depth = cursor.fetchone()[0]
+        finally:
+            cm.close_connection()
+        with self._lock:
+            self._last_depth = depth
+        return depth
+
+    # Run a matching pass; returns [(waitlist_id, appointment_id, patient,
+    # vaccine, caregiver, date, requested at)] of the requests it booked
+    def match(self):
+        # a read first, so an empty waitlist costs no write transaction
+        if self.depth() == 0:
+            return []
+        start = time.perf_counter()
+        today = datetime.date.today()
+        booked = []
+        expire = True
+        while True:
+            batch = self._match_batch(today, expire)
+            expire = False
+            booked.extend(batch)
+            if not batch:
+                break
+            self._booked(batch)
+
+        elapsed = time.perf_counter() - start
+        metrics = get_metrics()
+        metrics.histogram("scheduler_waitlist_match_seconds").observe(elapsed)
+        now = _utcnow()
+        for *_, requested_at in booked:
+            metrics.histogram("scheduler_waitlist_wait_seconds").observe((now - requested_at).total_seconds())
+        metrics.counter("scheduler_waitlist_matched_total").inc(len(booked))
+        with self._lock:
+            self._passes += 1
+            self._matched += len(booked)
+        self.depth()
+        return booked
+
+    def stats(self):
+        with self._lock:
+            return {
+                "depth": self._last_depth,
+                "enqueued": self._enqueued,
+                "matched": self._matched,
+                "passes": self._passes,
+            }
+
+    def _match_batch(self, today, expire):
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+        try:
+            if expire:
+                cursor.execute(Queries.waitlist_expire, today)
+            batch = get_backend().match_waitlist(cursor, today, self.batch_size, self.policy)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cm.close_connection()
+        return batch
+
+    # Let the caches of this process know about the committed bookings
+    def _booked(self, batch):
+        get_inventory_cache().invalidate()
+        index = get_availability_index()
+        for _, _, _, _, caregiver_name, date, _ in batch:
+            self.policy.assigned(caregiver_name)
+            if index is not None:
+                index.remove(caregiver_name, date)
+                index.appointment_added(caregiver_name)
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+# Return the process-wide matcher; "WaitlistBatchSize" sets the requests per transaction
+def get_waitlist_matcher():
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _matcher = WaitlistMatcher(int(os.getenv("WaitlistBatchSize", "500")))
+    return _matcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Book waitlisted requests for the free slots and doses")
+    parser.add_argument("--batch-size", type=int, help="requests per transaction")
+    args = parser.parse_args()
+
+    matcher = get_waitlist_matcher()
+    if args.batch_size:
+        matcher.batch_size = args.batch_size
+    start = time.perf_counter()
+    booked = matcher.match()
+    elapsed = time.perf_counter() - start
+    for waitlist_id, appointment_id, patient_name, vaccine_name, caregiver_name, date, _ in booked:
+        print(f"booked {waitlist_id} as appointment {appointment_id}: {patient_name} {vaccine_name} "
+              f"on {date:%m-%d-%Y} with {caregiver_name}")
+    print(f"{len(booked)} requests booked in {elapsed * 1000:.1f} ms, {matcher.stats()['depth']} still waiting")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
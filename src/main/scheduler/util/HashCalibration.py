@@ -0,0 +1,53 @@
+import argparse
+import math
+import time
+from util.PasswordHash import PasswordHash
+
+
+class HashCalibration:
+    """
+    Picks the password hashing cost that makes one verification take about
+    target_ms on this machine. Both supported algorithms scale linearly with
+    their cost parameter, so a measurement at a small cost is extrapolated and
+    then confirmed. scrypt's N is rounded to the nearest power of two.
+    """
+
+    def __init__(self, algorithm="pbkdf2-sha256", target_ms=100.0, samples=3):
+        self.algorithm = algorithm
+        self.target_ms = target_ms
+        self.samples = samples
+
+    def measure_ms(self, cost):
+        params = dict(PasswordHash.default_params[self.algorithm])
+        params[PasswordHash.cost_param[self.algorithm]] = cost
+        salt = b"\0" * 16
+        best = None
+        for _ in range(self.samples):
+            start = time.perf_counter()
+            PasswordHash.derive(self.algorithm, params, "calibration", salt)
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def calibrate(self):
+        cost = 10000 if self.algorithm == "pbkdf2-sha256" else 1024
+        cost = max(1, int(cost * self.target_ms / self.measure_ms(cost)))
+        if self.algorithm == "scrypt":
+            cost = 1 << max(1, round(math.log2(cost)))
+        return cost, self.measure_ms(cost)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick the password hashing cost for a target verify time")
+    parser.add_argument("--algorithm", default="pbkdf2-sha256", choices=sorted(PasswordHash.default_params))
+    parser.add_argument("--target-ms", type=float, default=100.0)
+    args = parser.parse_args()
+
+    cost, measured = HashCalibration(args.algorithm, args.target_ms).calibrate()
+    print(f"# one verification takes {measured:.1f} ms on this machine")
+    print(f"HashAlgorithm={args.algorithm}")
+    print(f"HashCost={cost}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import importlib
+import threading
+
+
+class LazyImport:
+    """
+    Stands in for the attribute name of module, importing the module the first
+    time the stand-in is called or one of its attributes is read.
+
+    Used by Scheduler.py so that starting the CLI does not import the models,
+    the database layer or the services a command does not need. Not usable
+    where the real object is required, e.g. as an exception class in except.
+    """
+
+    def __init__(self, module, name):
+        self._module = module
+        self._name = name
+        self._target = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = getattr(importlib.import_module(self._module), self._name)
+        return self._target
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self):
+        state = "imported" if self._target is not None else "not imported"
+        return f"<LazyImport {self._module}.{self._name}, {state}>"
@@ -0,0 +1,125 @@
+import collections
+
+
+class MaxFlow:
+    """
+    Maximum flow with Dinic's algorithm.
+
+    Nodes are the integers 0 .. n - 1. Edges are kept in flat lists, edge e
+    and its reverse e ^ 1 side by side, so the residual capacity of an edge
+    is one list lookup. Augmenting paths are found iteratively, so the depth
+    of the graph is not limited by the recursion limit.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.heads = [[] for _ in range(n)]
+        self.to = []
+        self.capacity = []
+        self.initial = []
+
+    # Add an edge from u to v; returns its number for flow()
+    def add_edge(self, u, v, capacity):
+        edge = len(self.to)
+        self.heads[u].append(edge)
+        self.to.append(v)
+        self.capacity.append(capacity)
+        self.initial.append(capacity)
+        self.heads[v].append(edge + 1)
+        self.to.append(u)
+        self.capacity.append(0)
+        self.initial.append(0)
+        return edge
+
+    # The flow through edge after max_flow()
+    def flow(self, edge):
+        return self.initial[edge] - self.capacity[edge]
+
+    def add_capacity(self, edge, amount):
+        self.capacity[edge] += amount
+        self.initial[edge] += amount
+
+    # Push one unit along a shortest path with capacity left; returns False if there is none
+    def augment(self, source, sink):
+        parent = [-1] * self.n
+        parent[source] = source
+        queue = collections.deque([source])
+        while queue and parent[sink] < 0:
+            u = queue.popleft()
+            for edge in self.heads[u]:
+                v = self.to[edge]
+                if parent[v] < 0 and self.capacity[edge] > 0:
+                    parent[v] = edge
+                    queue.append(v)
+        if parent[sink] < 0:
+            return False
+        v = sink
+        while v != source:
+            edge = parent[v]
+            self.capacity[edge] -= 1
+            self.capacity[edge ^ 1] += 1
+            v = self.to[edge ^ 1]
+        return True
+
+    def max_flow(self, source, sink):
+        total = 0
+        while True:
+            level = self._levels(source, sink)
+            if level[sink] < 0:
+                return total
+            total += self._blocking_flow(source, sink, level)
+
+    # Breadth-first distances from source over edges with capacity left, -1 if unreachable
+    def _levels(self, source, sink):
+        level = [-1] * self.n
+        level[source] = 0
+        queue = collections.deque([source])
+        while queue:
+            u = queue.popleft()
+            for edge in self.heads[u]:
+                v = self.to[edge]
+                if level[v] < 0 and self.capacity[edge] > 0:
+                    level[v] = level[u] + 1
+                    if v == sink:
+                        return level
+                    queue.append(v)
+        return level
+
+    # Saturate every shortest path: walk forward along the level graph, push
+    # the bottleneck at the sink and retreat from dead ends
+    def _blocking_flow(self, source, sink, level):
+        heads, to, capacity = self.heads, self.to, self.capacity
+        next_edge = [0] * self.n
+        total = 0
+        path = []
+        u = source
+        while True:
+            if u == sink:
+                pushed = min(capacity[edge] for edge in path)
+                for edge in path:
+                    capacity[edge] -= pushed
+                    capacity[edge ^ 1] += pushed
+                total += pushed
+                # go back to the tail of the first saturated edge
+                first = next(i for i, edge in enumerate(path) if capacity[edge] == 0)
+                del path[first:]
+                u = to[path[-1]] if path else source
+                continue
+            edges = heads[u]
+            i = next_edge[u]
+            while i < len(edges):
+                edge = edges[i]
+                if capacity[edge] > 0 and level[to[edge]] == level[u] + 1:
+                    break
+                i += 1
+            next_edge[u] = i
+            if i < len(edges):
+                path.append(edges[i])
+                u = to[edges[i]]
+                continue
+            # dead end: no more flow through u in this phase
+            if u == source:
+                return total
+            level[u] = -1
+            path.pop()
+            u = to[path[-1]] if path else source
@@ -0,0 +1,181 @@
+import atexit
+import bisect
+import contextlib
+import os
+import threading
+import time
+
+
+# upper bounds in seconds of the latency buckets, from 100 microseconds to 10 seconds
+default_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets: recording a value is a binary search
+    and two additions under a lock, so it can stay on in production.
+    """
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = buckets
+        # one count per bucket plus the +Inf bucket, not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+            self.count += 1
+
+    # Approximate quantile q (0 < q < 1): the upper bound of the bucket holding it
+    def quantile(self, q):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Metrics:
+    """
+    Registry of counters and latency histograms, keyed by name and labels.
+    render() returns them in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        return histogram
+
+    def counter(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        counter = self._counters.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(key, Counter())
+        return counter
+
+    # Record the time spent in the block into the histogram name{labels}
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name, **labels).observe(time.perf_counter() - start)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        described = set()
+        for (name, labels), counter in counters:
+            self._header(lines, described, name, "counter")
+            lines.append(f"{name}{_labels(labels)} {counter.value}")
+        for (name, labels), histogram in histograms:
+            self._header(lines, described, name, "histogram")
+            with histogram._lock:
+                counts = list(histogram.counts)
+                total, count = histogram.sum, histogram.count
+            cumulative = 0
+            for bound, n in zip(histogram.buckets, counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels + (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total!r}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    # One line per histogram: count, mean and approximate p50/p95/p99 in ms
+    def summary(self):
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        lines = []
+        for (name, labels), histogram in histograms:
+            if not histogram.count:
+                continue
+            mean_ms = 1000 * histogram.sum / histogram.count
+            quantiles = " ".join(f"p{int(q * 100)}<={1000 * histogram.quantile(q):g}ms" for q in (0.5, 0.95, 0.99))
+            lines.append(f"{name}{_labels(labels)} count={histogram.count} mean={mean_ms:.3f}ms {quantiles}")
+        return lines
+
+    def write(self, path):
+        # replace the file atomically so a scraper never reads half of it
+        temp = f"{path}.tmp"
+        with open(temp, "w") as f:
+            f.write(self.render())
+        os.replace(temp, path)
+
+    def _header(self, lines, described, name, kind):
+        if name in described:
+            return
+        described.add(name)
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+# Return the process-wide registry; when "MetricsFile" is set it is written there at exit
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                metrics = Metrics()
+                metrics.describe("scheduler_command_seconds", "Time to run a command, by command and status.")
+                metrics.describe("scheduler_connection_acquire_seconds", "Time to get a connection from the pool.")
+                metrics.describe("scheduler_db_seconds", "Time spent in cursor calls, by operation.")
+                metrics.describe("scheduler_password_hash_seconds", "Time to hash or verify a password in a worker.")
+                metrics.describe("scheduler_password_queue_seconds", "Time a password waited for a worker.")
+                metrics.describe("scheduler_db_errors_total", "Cursor calls that raised DBError.")
+                path = os.getenv("MetricsFile")
+                if path:
+                    atexit.register(metrics.write, path)
+                _metrics = metrics
+    return _metrics
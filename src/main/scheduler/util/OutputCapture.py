@@ -0,0 +1,52 @@
+import contextlib
+import io
+import sys
+import threading
+
+
+class _ThreadStdout:
+    """
+    Stands in for sys.stdout and sends each write to the buffer the current
+    thread is capturing into, or to the real stdout when it is not capturing.
+    contextlib.redirect_stdout swaps the process-wide sys.stdout, so it cannot
+    be used while commands run on several threads at once.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def target(self):
+        return getattr(self.local, "buffer", None) or self.stream
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        return self.target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+_install_lock = threading.Lock()
+
+
+def _installed():
+    with _install_lock:
+        if not isinstance(sys.stdout, _ThreadStdout):
+            sys.stdout = _ThreadStdout(sys.stdout)
+        return sys.stdout
+
+
+# Collect everything the current thread prints inside the block into the returned StringIO
+@contextlib.contextmanager
+def capture_output():
+    router = _installed()
+    buffer = io.StringIO()
+    previous = getattr(router.local, "buffer", None)
+    router.local.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        router.local.buffer = previous
@@ -0,0 +1,100 @@
+import base64
+import hashlib
+import hmac
+import os
+from util.Util import Util
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+class PasswordHash:
+    """
+    Self-describing password hash stored in the Hash column as
+    $<algorithm>$<name>=<value>,...$<salt>$<digest> (base64 without padding), e.g.
+    $pbkdf2-sha256$i=100000,l=32$<salt>$<digest> or $scrypt$n=16384,r=8,p=1,l=32$<salt>$<digest>.
+
+    Hashes written before this format existed are the raw 16-byte PBKDF2-SHA256
+    digest with 100000 iterations and the salt in the Salt column; they still
+    verify and are always reported as stale.
+
+    New hashes use the algorithm in the "HashAlgorithm" environment variable
+    (pbkdf2-sha256 by default, or scrypt) with the cost in "HashCost": the
+    iteration count for pbkdf2-sha256, N for scrypt.
+    """
+
+    default_params = {
+        "pbkdf2-sha256": {"i": 100000, "l": 32},
+        "scrypt": {"n": 16384, "r": 8, "p": 1, "l": 32},
+    }
+    # parameter that "HashCost" sets for each algorithm
+    cost_param = {
+        "pbkdf2-sha256": "i",
+        "scrypt": "n",
+    }
+
+    def __init__(self, algorithm, params, salt, digest, legacy=False):
+        if algorithm not in self.default_params:
+            raise ValueError(f"Unknown password hash algorithm {algorithm!r}")
+        self.algorithm = algorithm
+        self.params = params
+        self.salt = salt
+        self.digest = digest
+        self.legacy = legacy
+
+    @classmethod
+    def configured(cls):
+        algorithm = os.getenv("HashAlgorithm", "pbkdf2-sha256")
+        if algorithm not in cls.default_params:
+            raise ValueError(f"Unknown password hash algorithm {algorithm!r}")
+        params = dict(cls.default_params[algorithm])
+        cost = os.getenv("HashCost")
+        if cost:
+            params[cls.cost_param[algorithm]] = int(cost)
+        return algorithm, params
+
+    @classmethod
+    def create(cls, password, algorithm=None, params=None):
+        if algorithm is None:
+            algorithm, configured_params = cls.configured()
+            params = params or configured_params
+        params = params or dict(cls.default_params[algorithm])
+        salt = Util.generate_salt()
+        return cls(algorithm, params, salt, cls.derive(algorithm, params, password, salt))
+
+    # Parse a stored Hash column value; legacy_salt is the Salt column, needed for legacy hashes
+    @classmethod
+    def decode(cls, stored, legacy_salt=None):
+        stored = bytes(stored)
+        if len(stored) == 16 or not stored.startswith(b"$"):
+            return cls("pbkdf2-sha256", {"i": 100000, "l": 16}, legacy_salt, stored, legacy=True)
+        _, algorithm, params, salt, digest = stored.decode("ascii").split("$")
+        params = {name: int(value) for name, value in (p.split("=") for p in params.split(","))}
+        return cls(algorithm, params, _unb64(salt), _unb64(digest))
+
+    def encode(self):
+        params = ",".join(f"{name}={value}" for name, value in self.params.items())
+        return f"${self.algorithm}${params}${_b64(self.salt)}${_b64(self.digest)}".encode("ascii")
+
+    def matches(self, password):
+        return hmac.compare_digest(self.derive(self.algorithm, self.params, password, self.salt), self.digest)
+
+    # False when the hash should be recomputed with the configured algorithm and cost
+    def is_current(self):
+        if self.legacy:
+            return False
+        algorithm, params = self.configured()
+        return self.algorithm == algorithm and self.params == params
+
+    @staticmethod
+    def derive(algorithm, params, password, salt):
+        if algorithm == "pbkdf2-sha256":
+            return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, params["i"], dklen=params["l"])
+        n, r, p = params["n"], params["r"], params["p"]
+        return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r * p, dklen=params["l"])
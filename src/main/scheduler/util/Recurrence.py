@@ -0,0 +1,44 @@
+import datetime
+
+
+class Recurrence:
+    """
+    Recurrence rule for availability uploads.
+
+    Accepted rules are "daily", "weekdays", "weekends", or a comma separated
+    list of day names, abbreviated or in full, such as "mon,wed,fri" or
+    "monday,friday".
+    """
+
+    day_names = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+    full_day_names = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+    def __init__(self, rule="daily"):
+        self.rule = rule.lower()
+        if self.rule == "daily":
+            self.days = set(range(7))
+        elif self.rule == "weekdays":
+            self.days = set(range(5))
+        elif self.rule == "weekends":
+            self.days = {5, 6}
+        else:
+            self.days = set()
+            for name in self.rule.split(","):
+                name = name.strip()
+                if name in self.day_names:
+                    self.days.add(self.day_names.index(name))
+                elif name in self.full_day_names:
+                    self.days.add(self.full_day_names.index(name))
+                else:
+                    raise ValueError(f"Unknown recurrence rule {rule!r}")
+
+    # Yield every date from start to end (both inclusive) that matches the rule
+    def dates(self, start, end):
+        if end < start:
+            raise ValueError("The end date must not be before the start date")
+        d = start
+        one_day = datetime.timedelta(days=1)
+        while d <= end:
+            if d.weekday() in self.days:
+                yield d
+            d += one_day
@@ -15,3 +15,23 @@ class Util:
             dklen=16
         )
         return key
+
+    # Return why a password is not strong enough, or None if it is
+    def password_problem(password):
+        # At least 8 characters
+        if len(password) < 8:
+            return "Your password should include at least 8 characters!"
+
+        # Check for at least one uppercase and one lowercase letter
+        if not any(c.isupper() for c in password) or not any(c.islower() for c in password):
+            return "Your password should include a mixture of both uppercase and lowercase letters!"
+
+        # A mixture of letters and numbers
+        if not any(c.isalnum() for c in password):
+            return "Your password should include a mixture of letters and numbers!"
+
+        # Inclusion of at least one special character from "!", "@", "#", "?"
+        if not any(c in "!@#?" for c in password):
+            return "Your password should include at least one special character from '!','@','#', '?'"
+
+        return None
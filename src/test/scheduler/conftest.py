@@ -0,0 +1,69 @@
+import datetime
+import os
+import sys
+import pytest
+
+# the tests import the scheduler's packages the way Scheduler.py does, from its directory
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "main", "scheduler"))
+
+from db import AssignmentPolicy, Backend  # noqa: E402
+from db.ConnectionManager import ConnectionManager  # noqa: E402
+from model.Caregiver import Caregiver  # noqa: E402
+from model.Patient import Patient  # noqa: E402
+from service import AvailabilityIndex, DoseAllocator, InventoryCache, WaitlistMatcher  # noqa: E402
+
+
+# A scratch SQLite database, migrated on first use, as the process-wide backend,
+# with fresh process-wide services on top of it
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setenv("Backend", "sqlite")
+    monkeypatch.setenv("SQLitePath", str(tmp_path / "scheduler.db"))
+    for module, name in [(AssignmentPolicy, "_policy"), (AvailabilityIndex, "_index"), (DoseAllocator, "_allocator"),
+                         (InventoryCache, "_cache"), (WaitlistMatcher, "_matcher")]:
+        monkeypatch.setattr(module, name, None)
+    Backend._backend = None
+    ConnectionManager._pool = None
+    yield Backend.get_backend()
+    if ConnectionManager._pool is not None:
+        ConnectionManager._pool.close_all()
+    ConnectionManager._pool = None
+    Backend._backend = None
+
+
+# day(n) is the date n days from today
+@pytest.fixture
+def day():
+    today = datetime.date.today()
+    return lambda n: today + datetime.timedelta(days=n)
+
+
+# seed(patients, slots, doses) creates the patients, the caregivers of the
+# (date, caregiver) slots with those slots available, and the pfizer stock
+@pytest.fixture
+def seed(database):
+    def seed(patients, slots, doses=10):
+        for name in patients:
+            Patient(name, salt=bytes(16), hash=bytes(32)).save_to_db()
+        for caregiver_name in sorted({caregiver_name for _, caregiver_name in slots}):
+            Caregiver(caregiver_name, salt=bytes(16), hash=bytes(32)).save_to_db()
+        conn = database.connect()
+        cursor = conn.cursor()
+        cursor.executemany("INSERT INTO Availabilities (Time, Username) VALUES (%s, %s)", slots)
+        cursor.execute("INSERT INTO Vaccines (Name, Doses, TotalAdded) VALUES (%s, %d, %d)", ("pfizer", doses, doses))
+        conn.commit()
+        conn.close()
+    return seed
+
+
+# bookings() returns the (patient, caregiver, date) of every appointment by patient
+@pytest.fixture
+def bookings(database):
+    def bookings():
+        conn = database.connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT patient_name, caregiver_name, appointment_date FROM Reserve ORDER BY patient_name")
+        rows = [tuple(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+    return bookings
@@ -0,0 +1,20 @@
+import pytest
+from db.ReservationEngine import ReservationEngine
+
+
+# only b is free on day 1, everyone on days 2 and 3
+@pytest.mark.parametrize("availability_index", ["0", "1"])
+@pytest.mark.parametrize("policy, caregivers", [
+    ("alphabetical", ["b", "a", "a"]),
+    ("least_loaded", ["b", "a", "c"]),
+    ("round_robin", ["b", "c", "a"]),
+])
+def test_policy_picks_caregivers_in_its_order(seed, bookings, day, monkeypatch, availability_index, policy, caregivers):
+    monkeypatch.setenv("AssignmentPolicy", policy)
+    monkeypatch.setenv("AvailabilityIndex", availability_index)
+    seed(["p1", "p2", "p3"], [(day(1), "b")] + [(day(n), name) for n in (2, 3) for name in "abc"])
+
+    for n, patient_name in enumerate(["p1", "p2", "p3"], 1):
+        assert ReservationEngine().reserve(patient_name, "pfizer", day(n))[0] == ReservationEngine.OK
+
+    assert [caregiver_name for _, caregiver_name, _ in bookings()] == caregivers
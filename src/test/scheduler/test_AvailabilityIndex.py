@@ -0,0 +1,34 @@
+from db.AssignmentPolicy import Alphabetical
+from service.AvailabilityIndex import AvailabilityIndex
+
+
+def test_writes_of_this_process_update_the_index(seed, day):
+    seed([], [(day(1), "a"), (day(1), "b"), (day(2), "b")])
+    index = AvailabilityIndex(ttl=float("inf"))
+    index.load()
+    assert index.counts(day(1), day(3)) == [(day(1), 2), (day(2), 1)]
+
+    assert index.take(day(1), Alphabetical()) == "a"
+    index.remove("b", day(2))
+    index.add("c", [day(2), day(3)])
+
+    assert index.caregivers(day(1)) == ["b"]
+    assert index.schedule(day(1), day(3)) == [(day(1), ["b"]), (day(2), ["c"]), (day(3), ["c"])]
+
+
+def test_writes_during_a_reload_are_replayed_on_its_result(seed, day, monkeypatch):
+    seed([], [(day(1), "a"), (day(1), "b")])
+    index = AvailabilityIndex(ttl=float("inf"))
+    read = index._read
+
+    # commit writes after the reload has read the table, before it swaps in its result
+    def read_then_write():
+        result = read()
+        index.remove("a", day(1))
+        index.add("c", [day(2)])
+        return result
+
+    monkeypatch.setattr(index, "_read", read_then_write)
+    index.load()
+
+    assert index.schedule(day(1), day(2)) == [(day(1), ["b"]), (day(2), ["c"])]
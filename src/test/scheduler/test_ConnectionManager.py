@@ -0,0 +1,15 @@
+import pytest
+from db.ConnectionManager import ConnectionManager
+
+
+def test_exhausted_pool_reports_server_busy(database, monkeypatch, capsys):
+    monkeypatch.setenv("PoolMaxSize", "1")
+    monkeypatch.setenv("PoolCheckoutTimeout", "0.05")
+    holder = ConnectionManager()
+    holder.create_connection()
+    try:
+        with pytest.raises(SystemExit):
+            ConnectionManager().create_connection()
+        assert "Server busy" in capsys.readouterr().out
+    finally:
+        holder.close_connection()
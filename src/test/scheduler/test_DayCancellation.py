@@ -0,0 +1,22 @@
+from db.ReservationEngine import ReservationEngine
+from service.DayCancellation import DayCancellation
+
+
+def test_appointments_move_to_a_free_caregiver_or_are_canceled(database, seed, bookings, day, monkeypatch):
+    monkeypatch.setenv("AssignmentPolicy", "alphabetical")
+    # b is free on day 1 only; day 3 is outside the canceled range
+    seed(["p1", "p2", "p3"], [(day(1), "a"), (day(1), "b"), (day(2), "a"), (day(3), "a")], doses=3)
+    ids = [ReservationEngine().reserve(patient_name, "pfizer", day(n))[1]
+           for n, patient_name in enumerate(["p1", "p2", "p3"], 1)]
+
+    report = DayCancellation().cancel("a", day(1), day(2))
+
+    assert report.moved == [(ids[0], "b", day(1))]
+    assert [(appointment_id, patient_name, date) for appointment_id, patient_name, date, _ in report.canceled] == [
+        (ids[1], "p2", day(2))]
+    assert bookings() == [("p1", "b", day(1)), ("p3", "a", day(3))]
+    conn = database.connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT Doses FROM Vaccines WHERE Name = %s", "pfizer")
+    assert cursor.fetchone()[0] == 1
+    conn.close()
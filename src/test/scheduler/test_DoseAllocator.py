@@ -0,0 +1,31 @@
+import datetime
+import sys
+import pytest
+from service import DoseAllocator
+
+
+def test_reclaim_closes_expired_leases_and_returns_their_doses(database, monkeypatch, capsys):
+    expired = datetime.datetime(2000, 1, 1)
+    conn = database.connect()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO Vaccines (Name, Doses, TotalAdded) VALUES (%s, %d, %d)", ("pfizer", 5, 10))
+    cursor.execute("""
+        INSERT INTO DoseLeases (LeaseId, Instance, Vaccine, Granted, ExpiresAt)
+        VALUES (%s, %s, %s, %d, %s)
+    """, ("lease1", "gone", "pfizer", 5, expired))
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(sys, "argv", ["DoseAllocator", "--reclaim"])
+    with pytest.raises(SystemExit) as exit_info:
+        DoseAllocator.main()
+    assert exit_info.value.code == 0
+    assert "closed 1 expired leases" in capsys.readouterr().out
+
+    conn = database.connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT Doses FROM Vaccines WHERE Name = %s", "pfizer")
+    assert cursor.fetchone()[0] == 10
+    cursor.execute("SELECT COUNT(*) FROM DoseLeases")
+    assert cursor.fetchone()[0] == 0
+    conn.close()
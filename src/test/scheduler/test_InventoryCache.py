@@ -0,0 +1,23 @@
+import Scheduler
+from db.ReservationEngine import ReservationEngine
+from model.Caregiver import Caregiver
+from model.Session import Session
+from service.InventoryCache import get_inventory_cache
+
+
+def test_writes_to_vaccines_invalidate_the_cached_inventory(seed, day, monkeypatch):
+    # only invalidation can refresh the entry
+    monkeypatch.setenv("InventoryCacheTTL", "3600")
+    seed(["p"], [(day(1), "cg")], doses=1)
+    cache = get_inventory_cache()
+    assert cache.vaccines() == [("pfizer", 1)]
+    assert cache.vaccines() == [("pfizer", 1)]
+    assert cache.stats()["hits"] == 1
+
+    session = Session()
+    session.caregiver = Caregiver("cg")
+    assert Scheduler.add_doses(["add_doses", "pfizer", "4"], session)
+    assert cache.vaccines() == [("pfizer", 5)]
+
+    assert ReservationEngine().reserve("p", "pfizer", day(1))[0] == ReservationEngine.OK
+    assert cache.vaccines() == [("pfizer", 4)]
@@ -0,0 +1,28 @@
+from util.MaxFlow import MaxFlow
+
+
+def test_max_flow_of_the_textbook_network():
+    # CLRS figure 26.1: the maximum flow is 23, bounded by the cut {s, v1, v2, v4}
+    s, v1, v2, v3, v4, t = range(6)
+    graph = MaxFlow(6)
+    for u, v, capacity in [(s, v1, 16), (s, v2, 13), (v2, v1, 4), (v1, v3, 12), (v3, v2, 9),
+                           (v2, v4, 14), (v4, v3, 7), (v3, t, 20), (v4, t, 4)]:
+        graph.add_edge(u, v, capacity)
+
+    assert graph.max_flow(s, t) == 23
+
+
+def test_max_flow_undoes_a_first_match_that_blocks_another():
+    # p1 accepts either day, p2 only day1: both are booked only if p1 gets day2
+    source, p1, p2, day1, day2, sink = range(6)
+    graph = MaxFlow(6)
+    graph.add_edge(source, p1, 1)
+    graph.add_edge(source, p2, 1)
+    p1_day1 = graph.add_edge(p1, day1, 1)
+    p1_day2 = graph.add_edge(p1, day2, 1)
+    p2_day1 = graph.add_edge(p2, day1, 1)
+    graph.add_edge(day1, sink, 1)
+    graph.add_edge(day2, sink, 1)
+
+    assert graph.max_flow(source, sink) == 2
+    assert [graph.flow(edge) for edge in (p1_day1, p1_day2, p2_day1)] == [0, 1, 1]
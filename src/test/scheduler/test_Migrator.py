@@ -0,0 +1,33 @@
+from db.Backend import Connection
+from db.Migrator import Migrator
+from db.SQLiteBackend import SQLiteBackend
+
+
+def test_database_without_schema_versions_is_adopted(tmp_path):
+    path = str(tmp_path / "scheduler.db")
+    backend = SQLiteBackend(path, auto_migrate=False)
+    conn = Connection(backend, backend.open())
+    applied = Migrator(backend).migrate(conn)
+    # a database migrated before versions were recorded
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE SchemaVersion")
+    conn.commit()
+
+    assert Migrator(backend).migrate(conn) == applied
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM pragma_table_info('Caregivers') WHERE name = 'Appointments'")
+    assert cursor.fetchone()[0] == 1
+    conn.close()
+
+
+def test_add_column_is_applied_only_once(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "scheduler.db"), auto_migrate=False)
+    conn = Connection(backend, backend.open())
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE t (a INTEGER)")
+    statement = "-- comment\nALTER TABLE t ADD COLUMN b INTEGER;"
+    assert not backend.already_applied(cursor, statement)
+    cursor.execute(statement)
+    assert backend.already_applied(cursor, statement)
+    assert not backend.already_applied(cursor, "CREATE TABLE u (a INTEGER);")
+    conn.close()
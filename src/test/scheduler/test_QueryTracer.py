@@ -0,0 +1,27 @@
+from db import QueryTracer as query_tracer
+from db.QueryTracer import QueryTracer
+
+
+def test_normalize_replaces_standalone_literals_only():
+    tracer = QueryTracer()
+    assert tracer.normalize("SELECT TOP 1 col2 FROM t3 WHERE a = 12 AND b = 1.5 AND c = 'x'") == \
+        "SELECT TOP ? col2 FROM t3 WHERE a = ? AND b = ? AND c = ?"
+    assert tracer.normalize("CREATE TABLE t1 (Name VARCHAR(255), Price DECIMAL(10, 2), Data VARBINARY(MAX))") == \
+        "CREATE TABLE t1 (Name VARCHAR(255), Price DECIMAL(10, 2), Data VARBINARY(MAX))"
+
+
+def test_rows_of_a_select_are_counted_as_fetched(database, monkeypatch):
+    tracer = QueryTracer()
+    monkeypatch.setattr(query_tracer, "_tracer", tracer)
+    conn = database.connect()
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO Vaccines (Name, Doses, TotalAdded) VALUES (%s, %d, %d)",
+                       [("a", 1, 1), ("b", 2, 2), ("c", 3, 3)])
+    cursor.execute("SELECT Name FROM Vaccines WHERE Doses > %d", 1)
+    assert cursor.fetchone() is not None
+    assert len(cursor.fetchall()) == 1
+    conn.close()
+
+    rows = {entry["sql"]: entry["rows"] for entry in tracer.top(n=1000)}
+    assert rows["INSERT INTO Vaccines (Name, Doses, TotalAdded) VALUES (?, ?, ?)"] == 3
+    assert rows["SELECT Name FROM Vaccines WHERE Doses > ?"] == 2
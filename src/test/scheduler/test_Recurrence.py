@@ -0,0 +1,20 @@
+import datetime
+import pytest
+from util.Recurrence import Recurrence
+
+
+def test_day_names_are_abbreviated_or_full():
+    assert Recurrence("Mon,wed").days == {0, 2}
+    assert Recurrence("monday, FRIDAY").days == {0, 4}
+
+
+@pytest.mark.parametrize("rule", ["monkey,friendly", "mo", "fridays", "mon,,fri", "hourly"])
+def test_other_words_are_rejected(rule):
+    with pytest.raises(ValueError):
+        Recurrence(rule)
+
+
+def test_dates_follow_the_rule():
+    start = datetime.date(2027, 1, 4)  # a Monday
+    assert list(Recurrence("weekends").dates(start, start + datetime.timedelta(days=6))) == \
+        [datetime.date(2027, 1, 9), datetime.date(2027, 1, 10)]
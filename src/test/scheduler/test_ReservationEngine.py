@@ -0,0 +1,54 @@
+import datetime
+import threading
+from db.ReservationEngine import ReservationEngine
+from model.Caregiver import Caregiver
+from model.Patient import Patient
+from service.AvailabilityIndex import AvailabilityIndex
+
+day = datetime.date(2027, 1, 4)
+
+
+def test_slot_the_index_has_not_seen_yet_is_booked_from_the_database(database):
+    Patient("p", salt=bytes(16), hash=bytes(32)).save_to_db()
+    Caregiver("cg", salt=bytes(16), hash=bytes(32)).save_to_db()
+    index = AvailabilityIndex(ttl=float("inf"))
+    index.load()
+    # uploaded by another process after the index was loaded
+    conn = database.connect()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO Availabilities (Time, Username) VALUES (%s, %s)", (day, "cg"))
+    cursor.execute("INSERT INTO Vaccines (Name, Doses, TotalAdded) VALUES (%s, %d, %d)", ("pfizer", 1, 1))
+    conn.commit()
+    conn.close()
+
+    status, appointment_id, caregiver_name = ReservationEngine(index=index).reserve("p", "pfizer", day)
+
+    assert (status, caregiver_name) == (ReservationEngine.OK, "cg")
+    assert appointment_id is not None
+    assert index.caregivers(day) == []
+
+
+def test_concurrent_reservations_of_the_last_slot_book_it_once(database, seed, bookings, day):
+    seed(["p1", "p2"], [(day(1), "cg")], doses=1)
+    barrier = threading.Barrier(2)
+    statuses = {}
+
+    def reserve(patient_name):
+        barrier.wait()
+        statuses[patient_name] = ReservationEngine().reserve(patient_name, "pfizer", day(1))[0]
+
+    threads = [threading.Thread(target=reserve, args=(name,)) for name in ("p1", "p2")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    booked, refused = sorted(statuses.values(), key=lambda status: status != ReservationEngine.OK)
+    assert booked == ReservationEngine.OK
+    assert refused in (ReservationEngine.NO_CAREGIVER, ReservationEngine.NO_DOSES)
+    assert len(bookings()) == 1
+    conn = database.connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT Doses FROM Vaccines WHERE Name = %s", "pfizer")
+    assert cursor.fetchone()[0] >= 0
+    conn.close()
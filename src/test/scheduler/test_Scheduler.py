@@ -0,0 +1,125 @@
+import datetime
+import io
+import json
+import pytest
+import Scheduler
+from db.ReservationEngine import ReservationEngine
+from model.Caregiver import Caregiver
+from model.Patient import Patient
+from model.Session import Session
+
+
+def caregiver_session(database):
+    Caregiver("cg", salt=bytes(16), hash=bytes(32)).save_to_db()
+    session = Session()
+    session.caregiver = Caregiver("cg")
+    return session
+
+
+def available_dates(database):
+    conn = database.connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT Time FROM Availabilities ORDER BY Time")
+    dates = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return dates
+
+
+def test_is_valid_date_format_matches_the_whole_token():
+    assert Scheduler.is_valid_date_format("01-04-2027")
+    assert Scheduler.is_valid_date_format("1-4-2027")
+    assert not Scheduler.is_valid_date_format("01-04-2027x")
+    assert not Scheduler.is_valid_date_format("01-04-20277")
+
+
+def test_upload_availability_accepts_single_digit_month_and_day(database):
+    session = caregiver_session(database)
+    assert Scheduler.upload_availability(["upload_availability", "1-4-2027"], session)
+    assert available_dates(database) == [datetime.date(2027, 1, 4)]
+
+
+def test_upload_availability_rejects_trailing_junk(database):
+    session = caregiver_session(database)
+    assert not Scheduler.upload_availability(["upload_availability", "01-04-2027junk"], session)
+    assert available_dates(database) == []
+
+
+def test_upload_availability_rejects_a_reversed_range(database, capsys):
+    session = caregiver_session(database)
+    tokens = ["upload_availability", "from", "03-31-2027", "to", "01-01-2027"]
+    assert not Scheduler.upload_availability(tokens, session)
+    assert "the from date is after the to date" in capsys.readouterr().out
+    assert available_dates(database) == []
+
+
+def test_reserve_does_not_join_the_waitlist_after_a_database_error(database, monkeypatch):
+    joined = []
+    monkeypatch.setattr(Scheduler, "reserve_appointment", lambda *args: (None, None, None))
+    monkeypatch.setattr(Scheduler, "join_waitlist", lambda *args: joined.append(args) or True)
+    session = Session()
+    session.patient = Patient("p")
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+
+    assert not Scheduler.reserve(["reserve", f"{tomorrow:%m-%d-%Y}", "pfizer", "--waitlist"], session)
+    assert joined == []
+
+
+def test_stats_prints_the_current_waitlist_depth(database, capsys):
+    Patient("p", salt=bytes(16), hash=bytes(32)).save_to_db()
+    conn = database.connect()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO Vaccines (Name, Doses, TotalAdded) VALUES (%s, %d, %d)", ("pfizer", 0, 0))
+    conn.commit()
+    conn.close()
+    Scheduler.get_waitlist_matcher().enqueue("p", "pfizer", datetime.date.today() + datetime.timedelta(days=1))
+
+    assert Scheduler.stats(["stats"], Session())
+    assert "'depth': 1" in capsys.readouterr().out
+
+
+def test_show_appointments_pages_with_after_and_limit(seed, day, capsys):
+    seed(["p"], [(day(n), "cg") for n in (1, 2, 3)])
+    ids = [ReservationEngine().reserve("p", "pfizer", day(n))[1] for n in (1, 2, 3)]
+    session = Session()
+    session.patient = Patient("p")
+    capsys.readouterr()
+
+    assert Scheduler.show_appointments(["show_appointments", "--limit", "2"], session)
+    lines = capsys.readouterr().out.splitlines()
+    assert [int(line.split()[0]) for line in lines[1:3]] == ids[:2]
+    assert lines[3] == f"More appointments may follow, use --after {ids[1]} for the next page."
+
+    assert Scheduler.show_appointments(["show_appointments", "--after", str(ids[1]), "--limit", "2"], session)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[1:] == [f"{ids[2]} pfizer {day(3):%m-%d-%Y} cg"]
+
+
+def test_script_writes_one_json_line_per_command(database):
+    results = io.StringIO()
+    lines = ["# set up", "", "create_patient p Passw0rd!x", "login_patient p wrong", "quit", "logout"]
+
+    assert Scheduler.run_script(lines, results) == 1
+
+    created, login = [json.loads(line) for line in results.getvalue().splitlines()]
+    assert set(created) == {"line", "command", "status", "elapsed_ms", "output"}
+    assert (created["line"], created["command"], created["status"]) == (3, "create_patient", "ok")
+    assert created["output"] == "Create user p\n"
+    assert (login["line"], login["command"], login["status"]) == (4, "login_patient", "error")
+    assert "Passw0rd" not in results.getvalue()
+
+
+@pytest.mark.parametrize("availability_index", ["0", "1"])
+def test_range_search_lists_the_days_with_caregivers(seed, day, capsys, monkeypatch, availability_index):
+    monkeypatch.setenv("AvailabilityIndex", availability_index)
+    seed(["p"], [(day(1), "cg1"), (day(1), "cg2"), (day(3), "cg2"), (day(6), "cg1")])
+    session = Session()
+    session.patient = Patient("p")
+    tokens = ["search_caregiver_schedule", f"{day(0):%m-%d-%Y}", f"{day(4):%m-%d-%Y}"]
+
+    assert Scheduler.search_caregiver_schedule(tokens, session)
+    assert capsys.readouterr().out.splitlines()[:3] == [
+        "Date Available_Caregivers", f"{day(1):%m-%d-%Y} 2", f"{day(3):%m-%d-%Y} 1"]
+
+    assert Scheduler.search_caregiver_schedule(tokens + ["--caregivers"], session)
+    assert capsys.readouterr().out.splitlines()[:3] == [
+        "Date Available_Caregivers Caregiver_Usernames", f"{day(1):%m-%d-%Y} 2 cg1 cg2", f"{day(3):%m-%d-%Y} 1 cg2"]
@@ -0,0 +1,37 @@
+import asyncio
+import json
+import Scheduler
+from service.SchedulerServer import SchedulerServer
+
+
+def test_each_connection_has_its_own_session(database):
+    async def command(reader, writer, line):
+        writer.write((line + "\n").encode("utf-8"))
+        await writer.drain()
+        return json.loads(await reader.readline())
+
+    async def run():
+        server = SchedulerServer(Scheduler.execute, port=0, workers=2)
+        ready = asyncio.Event()
+        serving = asyncio.create_task(server.serve(ready))
+        await ready.wait()
+        first = await asyncio.open_connection(server.host, server.port)
+        second = await asyncio.open_connection(server.host, server.port)
+        try:
+            assert (await command(*first, "create_patient p Passw0rd!x"))["status"] == "ok"
+            assert (await command(*first, "login_patient p Passw0rd!x"))["status"] == "ok"
+            # a shared session would already hold the login of the first client
+            assert (await command(*second, "show_appointments"))["output"] == "Please login first!\n"
+            assert (await command(*second, "login_patient p Passw0rd!x"))["status"] == "ok"
+            assert (await command(*first, "logout"))["status"] == "ok"
+            assert (await command(*second, "show_appointments"))["status"] == "ok"
+        finally:
+            for _, writer in (first, second):
+                writer.close()
+            serving.cancel()
+        try:
+            await serving
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
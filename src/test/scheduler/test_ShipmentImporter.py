@@ -0,0 +1,21 @@
+from service.ShipmentImporter import ShipmentImporter
+
+
+def vaccines(database):
+    conn = database.connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT Name, Doses, TotalAdded FROM Vaccines ORDER BY Name")
+    rows = [tuple(row) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+
+def test_importing_a_manifest_again_adds_to_the_existing_rows(database):
+    manifest = [["vaccine", "doses"], ["pfizer", "10"], ["moderna", "5"], ["pfizer", "2"]]
+
+    first = ShipmentImporter().import_rows(manifest)
+    second = ShipmentImporter().import_rows(manifest)
+
+    assert first.vaccines == [("moderna", 0, 5), ("pfizer", 0, 12)]
+    assert second.vaccines == [("moderna", 5, 10), ("pfizer", 12, 24)]
+    assert vaccines(database) == [("moderna", 10, 10), ("pfizer", 24, 24)]
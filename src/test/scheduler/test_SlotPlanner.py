@@ -0,0 +1,16 @@
+from service.SlotPlanner import SlotPlanner
+from service.WaitlistMatcher import WaitlistMatcher
+
+
+def test_planner_books_the_days_the_matcher_would(seed, bookings, day):
+    # the window of p1 started before today; p2 only accepts a day before the range
+    seed(["p1", "p2"], [(day(-1), "cg"), (day(1), "cg"), (day(2), "cg")])
+    matcher = WaitlistMatcher()
+    matcher.enqueue("p1", "pfizer", day(-2), day(1))
+    matcher.enqueue("p2", "pfizer", day(3), day(4))
+
+    report = SlotPlanner().run(day(-3), day(2))
+
+    assert [(patient, caregiver, date) for _, patient, _, caregiver, date in report.booked] == [("p1", "cg", day(1))]
+    assert bookings() == [("p1", "cg", day(1))]
+    assert matcher.depth() == 1
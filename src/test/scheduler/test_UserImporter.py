@@ -0,0 +1,25 @@
+from model.Patient import Patient
+from service.UserImporter import UserImporter
+
+
+def patient_names(database):
+    conn = database.connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT Username FROM Patients ORDER BY Username")
+    names = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return names
+
+
+def test_username_taken_after_the_existence_check_is_skipped(database, monkeypatch):
+    # another import creates the user between the check and the insert
+    Patient("taken", salt=bytes(16), hash=bytes(32)).save_to_db()
+    monkeypatch.setattr(UserImporter, "_existing_usernames", lambda self, batch: set())
+
+    report = UserImporter(workers=1).import_rows([
+        ["patient", "taken", "Passw0rd!x"],
+        ["patient", "fresh", "Passw0rd!x"],
+    ])
+
+    assert (report.created, report.existing) == (1, 1)
+    assert patient_names(database) == ["fresh", "taken"]
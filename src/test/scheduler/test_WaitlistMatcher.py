@@ -0,0 +1,50 @@
+from service.WaitlistMatcher import WaitlistMatcher
+
+
+def test_request_is_booked_on_a_later_day_of_its_window(seed, bookings, day):
+    seed(["p"], [(day(3), "cg")])
+    matcher = WaitlistMatcher()
+    matcher.enqueue("p", "pfizer", day(1), day(5))
+
+    booked = matcher.match()
+
+    assert [(patient, caregiver, date) for _, _, patient, _, caregiver, date, _ in booked] == [("p", "cg", day(3))]
+    assert bookings() == [("p", "cg", day(3))]
+    assert matcher.depth() == 0
+
+
+def test_request_outside_its_window_stays_queued(seed, day):
+    seed(["p"], [(day(6), "cg")])
+    matcher = WaitlistMatcher()
+    matcher.enqueue("p", "pfizer", day(1), day(5))
+
+    assert matcher.match() == []
+    assert matcher.depth() == 1
+
+
+def test_requests_choosing_the_same_day_spill_over_to_later_days(seed, bookings, day):
+    seed(["p1", "p2"], [(day(2), "cg"), (day(4), "cg")])
+    matcher = WaitlistMatcher()
+    matcher.enqueue("p1", "pfizer", day(1), day(5))
+    matcher.enqueue("p2", "pfizer", day(2), day(4))
+
+    matcher.match()
+
+    assert bookings() == [("p1", "cg", day(2)), ("p2", "cg", day(4))]
+
+
+def test_position_counts_older_requests_whose_window_overlaps(seed, day):
+    seed(["p1", "p2", "p3", "p4"], [])
+    matcher = WaitlistMatcher()
+    assert matcher.enqueue("p1", "pfizer", day(1), day(5)) == 1
+    # p1 also accepts day 3, p2 does not accept day 6
+    assert matcher.enqueue("p2", "pfizer", day(3)) == 2
+    assert matcher.enqueue("p3", "pfizer", day(6), day(7)) == 1
+    assert matcher.enqueue("p4", "pfizer", day(5), day(6)) == 3
+    # queuing again keeps the place
+    assert matcher.enqueue("p1", "pfizer", day(1), day(5)) == 1
+
+
+def test_unknown_vaccine_is_not_queued(seed, day):
+    seed(["p"], [])
+    assert WaitlistMatcher().enqueue("p", "moderna", day(1)) is None